@@ -0,0 +1,531 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Local analysis service.
+
+`rttcp.py serve` starts a pool of worker processes with the heavy
+libraries (numpy, pandas, matplotlib) already imported, and runs the
+analyze and plot jobs submitted to it over HTTP, on a Unix socket (only
+accessible to its user) or a localhost port:
+
+  POST /jobs              submit a job: {"argv": [...], "cwd": "/dir",
+                          "wait": false}, where argv are the rttcp.py
+                          arguments (e.g. ["analyze", "-i", "t.pcap",
+                          "-o", "t.txt"])
+  GET  /jobs              list the jobs
+  GET  /jobs/<id>         get a job status
+  GET  /jobs/<id>/result  get a job output file
+  GET  /status            get the service status
+
+Each worker runs a job at a time, so the number of workers is the
+concurrency limit. Jobs wait in a queue (up to a maximum number of
+pending jobs) until a worker is free. A worker that dies (e.g. killed
+when out of memory) fails its running job, and is replaced.
+"""
+
+
+import BaseHTTPServer
+import collections
+import httplib
+import json
+import mimetypes
+import multiprocessing
+import os
+import Queue
+import signal
+import socket
+import SocketServer
+import stat
+import sys
+import threading
+import time
+import traceback
+
+from common import __version__
+from common import SERVE_MAX_QUEUE
+from common import SERVE_SOCKET
+import rttcp
+
+
+JOB_COMMANDS = ['analyze', 'plot']
+FINISHED_STATES = ['done', 'failed']
+# options set by the server only (a job could run any binary otherwise)
+SERVER_OPTIONS = ['--tshark']
+MAX_FINISHED_JOBS = 1000
+# how often the workers are checked (sec)
+WORKER_CHECK_SECS = 1.0
+# max time a "wait" request waits for its job (sec). It then gets the job
+# as it is (still queued or running), and can poll it
+WAIT_TIMEOUT_SECS = 600.0
+
+
+def warm_up():
+  """Imports the heavy libraries (run once in every worker)."""
+  os.environ.setdefault('MPLBACKEND', 'Agg')
+  # pylint: disable=g-import-not-at-top,unused-variable
+  import numpy
+  import pandas
+  import matplotlib.pyplot
+  import batch_plotter
+  import comparison_plotter
+  import packet_dumper
+  import plotter
+  # pylint: enable=g-import-not-at-top,unused-variable
+
+
+def worker_main(job_queue, event_queue):
+  """Worker process loop: runs jobs until it gets a None job.
+
+  Args:
+    job_queue: queue of (job_id, argv, cwd) tuples
+    event_queue: queue where (job_id, state, info) updates are posted
+  """
+  # the server stops the workers (on Ctrl-C too)
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  warm_up()
+  import matplotlib.pyplot as plt  # pylint: disable=g-import-not-at-top
+  for job_id, argv, cwd in iter(job_queue.get, None):
+    event_queue.put((job_id, 'running', {'started': time.time(),
+                                         'pid': os.getpid()}))
+    info = {}
+    try:
+      os.chdir(cwd)
+      rttcp.run(rttcp.get_options(['rttcp.py'] + argv))
+      state = 'done'
+    except (Exception, SystemExit):  # pylint: disable=broad-except
+      state = 'failed'
+      info['error'] = traceback.format_exc()
+    finally:
+      # the plotters leave their figures open
+      plt.close('all')
+    info['finished'] = time.time()
+    event_queue.put((job_id, state, info))
+
+
+class JobError(Exception):
+  """An invalid job request."""
+
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """HTTP front-end of the analysis service."""
+
+  server_version = 'rttcp/%s' % __version__
+
+  def send_json(self, code, obj):
+    body = json.dumps(obj, sort_keys=True) + '\n'
+    self.send_response(code)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def send_file(self, path):
+    try:
+      f = open(path, 'rb')
+    except IOError as e:
+      self.send_json(404, {'error': str(e)})
+      return
+    with f:
+      self.send_response(200)
+      self.send_header('Content-Type', (mimetypes.guess_type(path)[0] or
+                                        'application/octet-stream'))
+      self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+      self.end_headers()
+      for chunk in iter(lambda: f.read(1 << 16), ''):
+        self.wfile.write(chunk)
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    service = self.server.service
+    parts = self.path.strip('/').split('/')
+    if parts == ['status']:
+      self.send_json(200, service.status())
+      return
+    if parts == ['jobs']:
+      self.send_json(200, service.jobs())
+      return
+    job = (service.job(parts[1])
+           if parts[0] == 'jobs' and len(parts) in (2, 3) else None)
+    if job is None:
+      self.send_json(404, {'error': 'not found: %s' % self.path})
+    elif len(parts) == 2:
+      self.send_json(200, job)
+    elif parts[2] != 'result':
+      self.send_json(404, {'error': 'not found: %s' % self.path})
+    elif job['state'] != 'done':
+      self.send_json(409, {'error': 'job %s is %s' % (job['id'],
+                                                      job['state'])})
+    elif job['output'] is None:
+      self.send_json(404, {'error': 'job %s has no output file' %
+                                    job['id']})
+    else:
+      self.send_file(job['output'])
+
+  def do_POST(self):  # pylint: disable=invalid-name
+    service = self.server.service
+    if self.path.strip('/') != 'jobs':
+      self.send_json(404, {'error': 'not found: %s' % self.path})
+      return
+    length = int(self.headers.getheader('content-length', 0))
+    try:
+      request = json.loads(self.rfile.read(length))
+      job = service.submit(request)
+    except (ValueError, JobError) as e:
+      self.send_json(400, {'error': str(e)})
+      return
+    if job is None:
+      self.send_json(503, {'error': 'too many pending jobs'})
+      return
+    if request.get('wait'):
+      waited = service.wait(job['id'])
+      if waited is None:
+        self.send_json(404, {'error': 'job %s expired' % job['id']})
+      elif waited['state'] in FINISHED_STATES:
+        self.send_json(200, waited)
+      else:
+        # timed out: the client polls the job
+        self.send_json(202, waited)
+    else:
+      self.send_json(202, job)
+
+  def log_message(self, fmt, *args):
+    # unix socket clients have no address
+    if self.server.service.debug > 0:
+      sys.stderr.write('%s %s\n' % (self.log_date_time_string(), fmt % args))
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(SocketServer.ThreadingMixIn,
+                              SocketServer.UnixStreamServer):
+  daemon_threads = True
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+  """An HTTP client connection to a Unix socket (for python clients)."""
+
+  def __init__(self, path, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):  # pylint: disable=protected-access
+    httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+    self._path = path
+
+  def connect(self):
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:  # pylint: disable=protected-access
+      self.sock.settimeout(self.timeout)
+    self.sock.connect(self._path)
+
+
+class AnalysisServer(object):
+  """A job queue served by a pool of warm worker processes."""
+
+  def __init__(self, socket_path=None, port=None, workers=0,
+               max_queue=SERVE_MAX_QUEUE, tshark='tshark', debug=0):
+    # listen on a localhost port only if asked to
+    if socket_path is None and port is None:
+      socket_path = os.path.expanduser(SERVE_SOCKET)
+    self._socket_path = socket_path
+    self._port = port
+    self._tshark = tshark
+    self._workers = workers if workers > 0 else multiprocessing.cpu_count()
+    assert max_queue > 0
+    self._max_queue = max_queue
+    self.debug = debug
+    self._job_queue = multiprocessing.Queue()
+    self._event_queue = multiprocessing.Queue()
+    self._processes = []
+    self._collector = None
+    self._server = None
+    self._stopping = False
+    # job state (protected by the condition lock)
+    self._cond = threading.Condition()
+    self._jobs = collections.OrderedDict()
+    self._finished = collections.deque()
+    # id of the job run by every busy worker (by pid)
+    self._running = {}
+    self._next_id = 1
+    self._pending = 0
+    self._started = None
+
+  def start_worker(self):
+    process = multiprocessing.Process(
+        target=worker_main, args=(self._job_queue, self._event_queue))
+    process.daemon = True
+    process.start()
+    return process
+
+  def start(self):
+    """Starts the workers and binds the HTTP server."""
+    # fork the workers before starting any thread
+    self._processes = [self.start_worker() for _ in range(self._workers)]
+    self._collector = threading.Thread(target=self.collect_events)
+    self._collector.daemon = True
+    self._collector.start()
+    if self._socket_path is not None:
+      if (os.path.exists(self._socket_path) and
+          stat.S_ISSOCK(os.stat(self._socket_path).st_mode)):
+        # stale socket from a previous server
+        os.unlink(self._socket_path)
+      # create the socket as 0600 (no window where others can connect)
+      umask = os.umask(0o177)
+      try:
+        self._server = ThreadingUnixHTTPServer(self._socket_path,
+                                               RequestHandler)
+      finally:
+        os.umask(umask)
+    else:
+      self._server = ThreadingHTTPServer(('127.0.0.1', self._port),
+                                         RequestHandler)
+    self._server.service = self
+    self._started = time.time()
+
+  def address(self):
+    return self._server.server_address
+
+  def serve_forever(self):
+    self._server.serve_forever()
+
+  def stop(self):
+    """Stops the HTTP server and the workers."""
+    # the exiting workers must not be replaced
+    with self._cond:
+      self._stopping = True
+    if self._server is not None:
+      self._server.shutdown()
+      self._server.server_close()
+      if self._socket_path is not None and os.path.exists(self._socket_path):
+        os.unlink(self._socket_path)
+    for _ in self._processes:
+      self._job_queue.put(None)
+    for process in self._processes:
+      process.join(1.)
+      if process.is_alive():
+        # busy worker
+        process.terminate()
+    self._event_queue.put(None)
+
+  def run(self):
+    # stop on SIGTERM as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    self.start()
+    sys.stderr.write('serving on %s with %i workers\n' % (
+        self.address() or self._socket_path, self._workers))
+    thread = threading.Thread(target=self.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+      # the main thread must stay interruptible
+      while thread.is_alive():
+        thread.join(1.)
+    except KeyboardInterrupt:
+      pass
+    finally:
+      self.stop()
+
+  def parse_job(self, request):
+    """Validates a job request.
+
+    Args:
+      request: decoded job request
+
+    Returns:
+      (argv, cwd, output): rttcp.py arguments (without the program name),
+      job working directory, and job output file (None for batch plots).
+
+    Raises:
+      JobError: if the request is not a valid job.
+    """
+    if not isinstance(request, dict):
+      raise JobError('a job must be a JSON object')
+    argv = request.get('argv')
+    if (not isinstance(argv, list) or not argv or
+        argv[0] not in JOB_COMMANDS):
+      raise JobError('argv must be a list starting with one of: %s' %
+                     ', '.join(JOB_COMMANDS))
+    argv = [unicode(arg).encode('utf-8') for arg in argv]
+    for arg in argv:
+      # argparse accepts "--opt=value", and unambiguous prefixes ("--tsh")
+      name = arg.split('=', 1)[0]
+      for option in SERVER_OPTIONS:
+        if len(name) > 2 and option.startswith(name):
+          raise JobError('%s is set by the server' % option)
+    cwd = request.get('cwd', os.getcwd())
+    if not os.path.isabs(cwd) or not os.path.isdir(cwd):
+      raise JobError('cwd must be an absolute directory: %s' % cwd)
+    try:
+      options = rttcp.get_options(['rttcp.py'] + argv)
+    except SystemExit:
+      # argparse has already explained the error (in our stderr)
+      raise JobError('invalid arguments: %s' % ' '.join(argv))
+    if options.infile is None or '-' in options.infile:
+      raise JobError('jobs cannot read stdin')
+    output = None
+    if options.outfile not in (None, '-'):
+      output = os.path.join(cwd, options.outfile)
+    elif not getattr(options, 'plot_batch', None):
+      raise JobError('jobs cannot write stdout')
+    return argv, str(cwd), output
+
+  def submit(self, request):
+    """Queues a job (returns None if there are too many pending jobs)."""
+    argv, cwd, output = self.parse_job(request)
+    with self._cond:
+      if self._pending >= self._max_queue:
+        return None
+      job = {
+          'id': self._next_id,
+          'argv': argv,
+          'cwd': cwd,
+          'output': output,
+          'state': 'queued',
+          'submitted': time.time(),
+      }
+      self._jobs[job['id']] = job
+      self._next_id += 1
+      self._pending += 1
+      self._job_queue.put((job['id'], argv + ['--tshark', self._tshark],
+                           cwd))
+      return dict(job)
+
+  def collect_events(self):
+    """Applies the job updates posted by the workers, and checks them."""
+    last_check = time.time()
+    while True:
+      try:
+        event = self._event_queue.get(timeout=WORKER_CHECK_SECS)
+      except Queue.Empty:
+        event = ()
+      if event is None:
+        return
+      if event:
+        self.apply_event(*event)
+      if time.time() - last_check >= WORKER_CHECK_SECS:
+        if not self.check_workers():
+          return
+        last_check = time.time()
+
+  def apply_event(self, job_id, state, info):
+    """Applies a job update (posted by a worker)."""
+    with self._cond:
+      job = self._jobs.get(job_id)
+      if job is None or job['state'] in FINISHED_STATES:
+        # already failed by check_workers()
+        return
+      job['state'] = state
+      job.update(info)
+      if state == 'running':
+        self._running[info['pid']] = job_id
+      elif state in FINISHED_STATES:
+        self.finish_job(job)
+      self._cond.notify_all()
+
+  def finish_job(self, job):
+    """Accounts for a finished job (with the condition lock held)."""
+    job['elapsed'] = job['finished'] - job['submitted']
+    self._running.pop(job.get('pid'), None)
+    self._pending -= 1
+    self._finished.append(job['id'])
+    # forget the oldest finished jobs
+    while len(self._finished) > MAX_FINISHED_JOBS:
+      del self._jobs[self._finished.popleft()]
+
+  def check_workers(self):
+    """Fails the jobs of the dead workers, and replaces them.
+
+    Returns:
+      False if the server is stopping.
+    """
+    dead = [process for process in self._processes if not process.is_alive()]
+    if not dead:
+      return True
+    # a worker may have finished its job just before dying
+    while True:
+      try:
+        event = self._event_queue.get_nowait()
+      except Queue.Empty:
+        break
+      if event is None:
+        return False
+      self.apply_event(*event)
+    with self._cond:
+      if self._stopping:
+        return False
+      for process in dead:
+        job_id = self._running.get(process.pid)
+        job = self._jobs.get(job_id)
+        if job is not None and job['state'] == 'running':
+          job['state'] = 'failed'
+          job['error'] = 'worker %i died (exit code %s)' % (process.pid,
+                                                           process.exitcode)
+          job['finished'] = time.time()
+          self.finish_job(job)
+        sys.stderr.write('worker %i died (exit code %s): restarting it\n' % (
+            process.pid, process.exitcode))
+        self._processes[self._processes.index(process)] = self.start_worker()
+      self._cond.notify_all()
+    return True
+
+  def job(self, job_id):
+    try:
+      job_id = int(job_id)
+    except ValueError:
+      return None
+    with self._cond:
+      job = self._jobs.get(job_id)
+      return dict(job) if job is not None else None
+
+  def jobs(self):
+    with self._cond:
+      return [dict(job) for job in self._jobs.itervalues()]
+
+  def wait(self, job_id, timeout=WAIT_TIMEOUT_SECS):
+    """Waits until a job finishes, and returns it.
+
+    Args:
+      job_id: job to wait for
+      timeout: max wait time (sec)
+
+    Returns:
+      The job (unfinished if the wait timed out), or None if forgotten.
+    """
+    deadline = time.time() + timeout
+    with self._cond:
+      job = self._jobs.get(job_id)
+      while job is not None and job['state'] not in FINISHED_STATES:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          break
+        # python 2 timed waits poll (with up to 50 msec of latency)
+        self._cond.wait(remaining)
+        # the job may have finished and been forgotten in the meantime
+        job = self._jobs.get(job_id)
+      return dict(job) if job is not None else None
+
+  def status(self):
+    with self._cond:
+      states = collections.Counter(job['state']
+                                   for job in self._jobs.itervalues())
+    return {
+        'version': __version__,
+        'uptime': time.time() - self._started,
+        'workers': self._workers,
+        'workers_alive': sum(process.is_alive()
+                             for process in self._processes),
+        'max_queue': self._max_queue,
+        'jobs': dict(states),
+    }
@@ -0,0 +1,190 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for analysis_server.py."""
+
+import json
+import os
+import shutil
+import signal
+import stat
+import tempfile
+import threading
+import time
+import unittest
+
+import analysis_server
+
+
+TSHARK_LINES = """\
+1000.000000;6;192.168.1.1;10.0.0.1;60;40000;80;4999;0;;;1;100;0
+1000.100000;6;10.0.0.1;192.168.1.1;1500;80;40000;1000;1448;2448;5000;0;101;100
+1000.110000;6;192.168.1.1;10.0.0.1;52;40000;80;5000;0;;2448;0;102;101
+"""
+
+
+class AnalysisServerTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    # a fake tshark (that hangs while the "slow" file exists), and an
+    # (empty) capture file
+    lines = os.path.join(self._tmpdir, 'lines.txt')
+    with open(lines, 'w') as f:
+      f.write(TSHARK_LINES)
+    self._slow = os.path.join(self._tmpdir, 'slow')
+    tshark = os.path.join(self._tmpdir, 'tshark')
+    with open(tshark, 'w') as f:
+      f.write('#!/bin/sh\nif [ -e %s ]; then exec sleep 10; fi\ncat %s\n' % (
+          self._slow, lines))
+    os.chmod(tshark, stat.S_IRWXU)
+    open(os.path.join(self._tmpdir, 'trace.pcap'), 'w').close()
+    self._socket_path = os.path.join(self._tmpdir, 'rttcp.sock')
+    self._server = analysis_server.AnalysisServer(self._socket_path,
+                                                  workers=1, tshark=tshark)
+    self._server.start()
+    thread = threading.Thread(target=self._server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+  def tearDown(self):
+    self._server.stop()
+    shutil.rmtree(self._tmpdir)
+
+  def request(self, method, path, body=None):
+    conn = analysis_server.UnixHTTPConnection(self._socket_path)
+    conn.request(method, path, json.dumps(body) if body is not None else None)
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response.status, data
+
+  def testSocketMode(self):
+    # only the server user can connect
+    self.assertEqual(0o600,
+                     stat.S_IMODE(os.stat(self._socket_path).st_mode))
+
+  def testJob(self):
+    status, data = self.request('POST', '/jobs', {
+        'argv': ['analyze', '--type', 'packet', '-i', 'trace.pcap',
+                 '-o', 'trace.txt'],
+        'cwd': self._tmpdir,
+        'wait': True,
+    })
+    self.assertEqual(200, status)
+    job = json.loads(data)
+    self.assertEqual('done', job['state'], job.get('error'))
+    status, data = self.request('GET', '/jobs/%i/result' % job['id'])
+    self.assertEqual(200, status)
+    with open(os.path.join(self._tmpdir, 'trace.txt')) as f:
+      self.assertEqual(f.read(), data)
+    self.assertIn('delta1 1000.100000', data)
+    status, data = self.request('GET', '/status')
+    self.assertEqual({'done': 1}, json.loads(data)['jobs'])
+
+  def testFailedJob(self):
+    _, data = self.request('POST', '/jobs', {
+        'argv': ['analyze', '-i', 'missing.pcap', '-o', 'trace.txt'],
+        'cwd': self._tmpdir,
+        'wait': True,
+    })
+    job = json.loads(data)
+    self.assertEqual('failed', job['state'])
+    self.assertIn('missing.pcap', job['error'])
+    status, _ = self.request('GET', '/jobs/%i/result' % job['id'])
+    self.assertEqual(409, status)
+
+  def testInvalidJobs(self):
+    for argv in (['help'], ['analyze', '-i', 'trace.pcap'],
+                 ['plot', '-o', 'trace.pdf']):
+      status, _ = self.request('POST', '/jobs', {'argv': argv,
+                                                 'cwd': self._tmpdir})
+      self.assertEqual(400, status, argv)
+    status, _ = self.request('GET', '/jobs/1')
+    self.assertEqual(404, status)
+
+  def testServerOptions(self):
+    # jobs cannot pick the binary run by the worker
+    for argv in (['--tshark', '/bin/false'], ['--tshark=/bin/false'],
+                 ['--tsh', '/bin/false'], ['--tsh=/bin/false']):
+      status, data = self.request('POST', '/jobs', {
+          'argv': ['analyze', '-i', 'trace.pcap', '-o', 'trace.txt'] + argv,
+          'cwd': self._tmpdir,
+      })
+      self.assertEqual(400, status, argv)
+      self.assertIn('--tshark', json.loads(data)['error'])
+    # the server one is used
+    _, data = self.request('POST', '/jobs', {
+        'argv': ['analyze', '--type', 'packet', '-i', 'trace.pcap',
+                 '-o', 'trace.txt'],
+        'cwd': self._tmpdir,
+        'wait': True,
+    })
+    job = json.loads(data)
+    self.assertEqual('done', job['state'], job.get('error'))
+    self.assertNotIn('--tshark', job['argv'])
+
+  def testExpiredJob(self):
+    # the job is forgotten as soon as it finishes
+    max_finished_jobs = analysis_server.MAX_FINISHED_JOBS
+    analysis_server.MAX_FINISHED_JOBS = 0
+    try:
+      status, data = self.request('POST', '/jobs', {
+          'argv': ['analyze', '-i', 'missing.pcap', '-o', 'trace.txt'],
+          'cwd': self._tmpdir,
+          'wait': True,
+      })
+    finally:
+      analysis_server.MAX_FINISHED_JOBS = max_finished_jobs
+    self.assertEqual(404, status)
+    self.assertIn('expired', json.loads(data)['error'])
+
+  def testDeadWorker(self):
+    open(self._slow, 'w').close()
+    _, data = self.request('POST', '/jobs', {
+        'argv': ['analyze', '-i', 'trace.pcap', '-o', 'trace.txt'],
+        'cwd': self._tmpdir,
+    })
+    job_id = json.loads(data)['id']
+    deadline = time.time() + 30
+    while self._server.job(job_id)['state'] != 'running':
+      self.assertTrue(time.time() < deadline)
+      time.sleep(.05)
+    # the wait is bounded
+    job = self._server.wait(job_id, timeout=.1)
+    self.assertEqual('running', job['state'])
+    os.kill(job['pid'], signal.SIGKILL)
+    job = self._server.wait(job_id, timeout=30)
+    self.assertEqual('failed', job['state'])
+    self.assertIn('worker %i died' % job['pid'], job['error'])
+    # the worker has been replaced
+    os.unlink(self._slow)
+    status, data = self.request('POST', '/jobs', {
+        'argv': ['analyze', '-i', 'trace.pcap', '-o', 'trace.txt'],
+        'cwd': self._tmpdir,
+        'wait': True,
+    })
+    self.assertEqual(200, status)
+    self.assertEqual('done', json.loads(data)['state'])
+    _, data = self.request('GET', '/status')
+    status = json.loads(data)
+    self.assertEqual(1, status['workers_alive'])
+    self.assertEqual({'done': 1, 'failed': 1}, status['jobs'])
+
+
+if __name__ == '__main__':
+  unittest.main()
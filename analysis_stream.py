@@ -0,0 +1,149 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Library API: analyze a trace as a stream of record batches.
+
+  from analysis_stream import analyze_stream
+  for batch in analyze_stream('trace.pcap', deltas=['delta1']):
+    for sample in batch.samples:
+      print sample.timestamp, sample.value
+
+Packets are only decoded when the consumer asks for the next batch, so
+memory use is bounded by the batch size (plus the in-flight segments of
+the analysis), and no analysis file is written.
+"""
+
+
+from common import MAX_CONN_SEGMENTS
+from common import MAX_TRACE_SEGMENTS
+from common import SEGMENT_HORIZON_SECS
+from output_sink import DeltaSample
+from output_sink import EvictedRecord
+from output_sink import FlowRecord
+from output_sink import RecordSink
+from output_sink import TopRecord
+from packet_dumper import PacketDumper
+from packet_info import PacketInfo
+from trace_info import TraceInfo
+
+
+BATCH_RECORDS = 10000
+
+
+class RecordBatch(object):
+  """A batch of analysis records (lists of output_sink namedtuples)."""
+
+  def __init__(self, samples, evicted, flows, top):
+    self.samples = samples
+    self.evicted = evicted
+    self.flows = flows
+    self.top = top
+
+  def __len__(self):
+    return (len(self.samples) + len(self.evicted) + len(self.flows) +
+            len(self.top))
+
+  def to_arrays(self, name='samples'):
+    """Returns the records of a type as a dictionary of numpy columns.
+
+    Args:
+      name: record type ('samples', 'evicted', 'flows', or 'top')
+
+    Returns:
+      a dictionary mapping each record field to a numpy array.
+    """
+    # numpy is only needed (and imported) for columnar consumers
+    import numpy as np  # pylint: disable=g-import-not-at-top
+    fields = {
+        'samples': DeltaSample._fields,
+        'evicted': EvictedRecord._fields,
+        'flows': FlowRecord._fields,
+        'top': TopRecord._fields,
+    }[name]
+    records = getattr(self, name)
+    columns = zip(*records) if records else [()] * len(fields)
+    return dict((field, np.array(column))
+                for field, column in zip(fields, columns))
+
+
+def iter_packets(source, analysis_type, tshark_bin, debug, start, duration):
+  """Returns an iterator of PacketInfo objects from a packet source."""
+  if isinstance(source, basestring):
+    # a capture file: decode it with tshark
+    return PacketDumper(tshark_bin, source, None, analysis_type, debug,
+                        start=start, duration=duration).packets()
+  assert start is None and duration is None, (
+      'time windows need a capture file')
+  return parse_packets(source, PacketDumper(tshark_bin, None, None,
+                                            analysis_type, debug))
+
+
+def parse_packets(source, packet_dumper):
+  """Yields PacketInfo objects from PacketInfo objects or tshark lines."""
+  for item in source:
+    if isinstance(item, PacketInfo):
+      yield item
+      continue
+    try:
+      yield packet_dumper.parse_line(item)
+    except ValueError:
+      continue
+
+
+def analyze_stream(source, analysis_type='packet', deltas=None,
+                   batch_size=BATCH_RECORDS, tshark_bin='tshark', debug=0,
+                   max_segments=MAX_TRACE_SEGMENTS,
+                   max_conn_segments=MAX_CONN_SEGMENTS,
+                   segment_horizon=SEGMENT_HORIZON_SECS,
+                   start=None, duration=None, prefix_labels=None):
+  """Analyzes a packet trace, and yields its results in batches.
+
+  Args:
+    source: capture file name, or an iterable of PacketInfo objects or
+        newline-terminated tshark lines (PacketDumper field format)
+    analysis_type: 'flow' or 'packet'
+    deltas: delta types to keep (e.g. ['delta1']), or None for all
+    batch_size: (approximate) number of records per batch
+    tshark_bin: tshark binary (capture file sources only)
+    debug: debug level
+    max_segments: max in-flight segments tracked (trace)
+    max_conn_segments: max in-flight segments tracked (per connection
+        direction)
+    segment_horizon: drop in-flight segments older than this (sec)
+    start: window start (sec since the first packet; capture files only)
+    duration: window duration (sec; capture files only)
+    prefix_labels: subnet labels of the connections (a cidr.PrefixTrie)
+
+  Yields:
+    RecordBatch objects. Flow summaries, eviction counters, and the
+    heaviest connections are only known at the end of the trace, so they
+    come in the last batch.
+  """
+  assert batch_size > 0
+  sink = RecordSink(deltas)
+  trace_info = TraceInfo(sink, analysis_type, debug, max_segments,
+                         max_conn_segments, segment_horizon,
+                         prefix_labels=prefix_labels)
+  packets = iter_packets(source, analysis_type, tshark_bin, debug, start,
+                         duration)
+  for packet in packets:
+    trace_info.process_packet(packet)
+    if len(sink) >= batch_size:
+      yield RecordBatch(**sink.take())
+  trace_info.finish()
+  if len(sink):
+    yield RecordBatch(**sink.take())
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for analysis_stream.py."""
+
+import cStringIO
+import unittest
+
+import analysis_stream
+import cidr
+from output_sink import TextSink
+from packet_info import PacketInfo
+from trace_info import TraceInfo
+
+
+NUM_SEGMENTS = 20
+
+
+def tshark_lines():
+  """A bulk transfer, where every data segment is acked after 10 msec."""
+  lines = ['1000.000000;6;192.168.1.1;10.0.0.1;60;40000;80;4999;0;;;1;100;0\n']
+  for i in range(NUM_SEGMENTS):
+    seq = 1000 + i * 1448
+    lines.append('%f;6;10.0.0.1;192.168.1.1;1500;80;40000;%i;1448;%i;5000;'
+                 '0;%i;100\n' % (1000.1 + i * .1, seq, seq + 1448, 200 + i))
+    lines.append('%f;6;192.168.1.1;10.0.0.1;52;40000;80;5000;0;;%i;0;%i;%i\n'
+                 % (1000.11 + i * .1, seq + 1448, 300 + i, 200 + i))
+  return lines
+
+
+class AnalysisStreamTest(unittest.TestCase):
+
+  def testBatches(self):
+    batches = list(analysis_stream.analyze_stream(tshark_lines(),
+                                                  batch_size=10))
+    self.assertTrue(len(batches) > 1)
+    samples = [sample for batch in batches for sample in batch.samples]
+    delta1 = [sample for sample in samples if sample.delta == 'delta1']
+    self.assertEqual(NUM_SEGMENTS, len(delta1))
+    for sample in delta1:
+      self.assertAlmostEqual(.01, sample.value)
+      self.assertEqual(('10.0.0.1:80', '192.168.1.1:40000'),
+                       (sample.src, sample.dst))
+    # the heaviest connections come at the end
+    self.assertEqual([], batches[0].top)
+    self.assertTrue(batches[-1].top)
+
+  def testPrefixLabels(self):
+    prefix_labels = cidr.PrefixTrie()
+    prefix_labels.insert('192.168.1.0/24', 'site-1')
+    for trie, expected in ((None, cidr.NO_LABEL), (prefix_labels, 'site-1')):
+      batches = list(analysis_stream.analyze_stream(
+          tshark_lines(), analysis_type='flow', prefix_labels=trie))
+      flows = [flow for batch in batches for flow in batch.flows]
+      self.assertEqual([expected], [flow.label for flow in flows])
+
+  def testIPv6PrefixLabels(self):
+    prefix_labels = cidr.PrefixTrie()
+    prefix_labels.insert('2001:db8::/32', 'v6')
+    prefix_labels.insert('2001:db8:0:1::/64', 'v6-1')
+    packets = []
+    for client, port in (('2001:db8:0:1::1', '40000'),
+                         ('2001:db8:0:2::1', '40001'),
+                         ('2001:db9::1', '40002')):
+      packets.append(PacketInfo(1000., 6, '2001:db9::80', client, 1100, '80',
+                                port, 1000, 1000, 2000, 1, 0, None, None))
+      packets.append(PacketInfo(1000.5, 6, client, '2001:db9::80', 100, port,
+                                '80', 1, 0, None, 2000, 0, None, None))
+    batches = list(analysis_stream.analyze_stream(
+        packets, 'flow', prefix_labels=prefix_labels))
+    flows = [flow for batch in batches for flow in batch.flows]
+    self.assertEqual(['v6-1', 'v6', cidr.NO_LABEL],
+                     [flow.label for flow in flows])
+
+  def testDeltaFilter(self):
+    samples = []
+    for batch in analysis_stream.analyze_stream(tshark_lines(),
+                                                deltas=['delta2']):
+      samples += batch.samples
+      columns = batch.to_arrays()
+      self.assertEqual(len(batch.samples), len(columns['timestamp']))
+    self.assertEqual(set(['delta2']), set(s.delta for s in samples))
+
+  def testPacketSource(self):
+    packets = []
+    for i in range(3):
+      packets.append(PacketInfo(1000. + i, 6, '1.1.1.1', '2.2.2.2', 1100,
+                                '80', '1234', 1000 * i, 1000,
+                                1000 * (i + 1), 1, 0, i, i))
+      packets.append(PacketInfo(1000.5 + i, 6, '2.2.2.2', '1.1.1.1', 100,
+                                '1234', '80', 1, 0, None, 1000 * (i + 1), 0,
+                                i, i))
+    batches = list(analysis_stream.analyze_stream(packets, 'flow'))
+    self.assertEqual(1, len(batches))
+    self.assertEqual(1, len(batches[0].flows))
+    self.assertEqual(6, batches[0].flows[0].ip_total_pkt)
+
+  def testTextOutput(self):
+    # the text sink writes the same lines as the records
+    out = cStringIO.StringIO()
+    trace_info = TraceInfo(TextSink(out), 'packet')
+    for line in tshark_lines():
+      trace_info.process_packet(analysis_stream.PacketDumper(
+          None, None, None, 'packet', 0).parse_line(line))
+    trace_info.finish()
+    records = list(analysis_stream.analyze_stream(tshark_lines()))[0]
+    lines = [line for line in out.getvalue().splitlines()
+             if not line.startswith('#')]
+    self.assertEqual(len(records.samples), len(lines))
+    sample = records.samples[0]
+    self.assertEqual('%s %f %s %s %f %s' % sample, lines[0])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,202 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Batch rendering of many plots from a single analysis file.
+
+The batch spec is a JSON list of plots, e.g.:
+
+  [
+    {"output": "all.pdf", "title": "full trace"},
+    {"output": "all.png", "src_reverse": "10.0.0.0/8"},
+    {"output": "start.svg", "time_range": "0:30", "title": "first 30 sec"}
+  ]
+
+Each plot has an "output" file, and optional "format" (any matplotlib
+format, or html for packet analysis; defaults to the output file
+extension), "title", "src_reverse" (defaults to the command line one),
+and "time_range" ("START:END", in seconds since the start of the trace,
+where either side may be empty) entries.
+
+The input file is parsed once. The data of every distinct (src_reverse,
+time_range) view is selected and summarized once, and shared by all the
+plots that use it. The plots are then rendered by a pool of worker
+processes, which inherit the prepared views when they are forked.
+"""
+
+
+import json
+import multiprocessing
+import os.path
+import sys
+import time
+
+from common import parse_time_range
+import matplotlib.pyplot as plt
+from plotter import Plotter
+
+
+SPEC_KEYS = ['output', 'format', 'title', 'src_reverse', 'time_range']
+# non-matplotlib plot formats, per analysis type (see
+# Plotter.packet_export_html())
+EXTRA_FORMATS = {
+    'flow': [],
+    'packet': ['html'],
+}
+
+# prepared batch state (set before forking the render workers)
+_batch = {}
+
+
+def read_spec(f, default_src_reverse, analysis_type):
+  """Reads and validates a batch spec.
+
+  Args:
+    f: file object to read from
+    default_src_reverse: src_reverse for the plots that do not set one
+    analysis_type: analysis type of the input file
+
+  Returns:
+    a list of plot dictionaries, with all the SPEC_KEYS set.
+  """
+  spec = json.load(f)
+  assert isinstance(spec, list), 'batch spec must be a list of plots'
+  # check the formats upfront, so a bad one does not fail the batch midway
+  fig = plt.figure()
+  formats = (set(fig.canvas.get_supported_filetypes()) |
+             set(EXTRA_FORMATS[analysis_type]))
+  plt.close(fig)
+  plots = []
+  for plot in spec:
+    unknown = set(plot) - set(SPEC_KEYS)
+    assert not unknown, 'invalid batch spec keys: %s' % sorted(unknown)
+    assert plot.get('output'), 'batch spec plot without output'
+    output = plot['output']
+    plot_format = plot.get('format') or os.path.splitext(output)[1][1:]
+    assert plot_format, 'cannot guess the format of %s' % output
+    assert plot_format in formats, 'unknown %s plot format "%s" (%s)' % (
+        analysis_type, plot_format, output)
+    plots.append({
+        'output': output,
+        'format': plot_format,
+        'title': plot.get('title', ''),
+        'src_reverse': plot.get('src_reverse', default_src_reverse),
+        'time_range': parse_time_range(plot.get('time_range')),
+    })
+  return plots
+
+
+def render_plot(index):
+  """Renders a single plot of the batch (runs in a worker process)."""
+  plot = _batch['plots'][index]
+  view = _batch['views'][(plot['src_reverse'], plot['time_range'])]
+  start = time.time()
+  plotter = Plotter(None, plot['output'], _batch['analysis_type'],
+                    plot['format'], plot['title'], plot['src_reverse'],
+                    _batch['debug'], _batch['density'])
+  if _batch['analysis_type'] == 'flow':
+    plotter.flow_process_data(view['df'])
+  elif plot['format'] == 'html':
+    plotter.packet_write_html(view['df'])
+  else:
+    plotter.packet_plot_stats(view['stats'])
+  plt.close('all')
+  return time.time() - start
+
+
+class BatchPlotter(Plotter):
+  """Class that renders all the plots of a batch spec."""
+
+  def __init__(self, infile, spec_file, analysis_type, src_reverse, debug,
+               density='auto', jobs=0):
+    super(BatchPlotter, self).__init__(
+        infile, None, analysis_type, None, '', src_reverse, debug, density)
+    with open(spec_file) as f:
+      self._plots = read_spec(f, src_reverse, analysis_type)
+    self._jobs = jobs if jobs > 0 else multiprocessing.cpu_count()
+
+  def run(self):
+    """Plot all the outputs of the batch spec."""
+    df = self.read_input()
+    views = self.prepare_views(df)
+    # the workers get the prepared views through fork()
+    _batch.update({
+        'plots': self._plots,
+        'views': views,
+        'analysis_type': self._analysis_type,
+        'debug': self._debug,
+        'density': self._density,
+    })
+    try:
+      times = self.render_plots()
+    finally:
+      _batch.clear()
+    if self._debug > 0:
+      for plot, elapsed in zip(self._plots, times):
+        sys.stderr.write('%s: %.3f sec\n' % (plot['output'], elapsed))
+
+  def prepare_views(self, df):
+    """Select and summarize the data of every distinct plot view.
+
+    Args:
+      df: dataframe with the whole analysis file
+
+    Returns:
+      a dictionary mapping (src_reverse, time_range) keys to views. Views
+      have a 'df' entry (the selected data, with a 'dir' column in packet
+      mode), and a 'stats' entry (packet mode, non-html plots only).
+    """
+    ts_column = 'first_ts' if self._analysis_type == 'flow' else 'timestamp'
+    t0 = df[ts_column].min()
+    direction = {}
+    views = {}
+    for plot in self._plots:
+      key = (plot['src_reverse'], plot['time_range'])
+      if key not in views:
+        view_df = df
+        if self._analysis_type == 'packet':
+          # direction matching only depends on the src_reverse prefixes
+          if plot['src_reverse'] not in direction:
+            plotter = Plotter(None, None, self._analysis_type, None, '',
+                              plot['src_reverse'], self._debug)
+            direction[plot['src_reverse']] = plotter.match_direction(df.src)
+          view_df = df.assign(dir=direction[plot['src_reverse']])
+        start, end = plot['time_range']
+        if start is not None:
+          view_df = view_df[view_df[ts_column] >= t0 + start]
+        if end is not None:
+          view_df = view_df[view_df[ts_column] < t0 + end]
+        assert len(view_df), 'no data in time range %s:%s' % (start, end)
+        views[key] = {'df': view_df.reset_index(drop=True)}
+      view = views[key]
+      if (self._analysis_type == 'packet' and plot['format'] != 'html' and
+          'stats' not in view):
+        view['stats'] = self.packet_group_stats(view['df'])
+    return views
+
+  def render_plots(self):
+    """Render all the plots, in parallel worker processes."""
+    indexes = range(len(self._plots))
+    jobs = min(self._jobs, len(indexes))
+    if jobs <= 1:
+      return map(render_plot, indexes)
+    pool = multiprocessing.Pool(jobs)
+    try:
+      # one plot per task, so slow plots do not hold back others
+      return pool.map(render_plot, indexes, chunksize=1)
+    finally:
+      pool.close()
+      pool.join()
@@ -0,0 +1,149 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for batch_plotter.py."""
+
+import cStringIO
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+# plot without a display
+os.environ.setdefault('MPLBACKEND', 'Agg')
+# pylint: disable=g-import-not-at-top,g-bad-import-order
+import batch_plotter
+from plotter import Plotter
+
+
+def spec_file(spec):
+  return cStringIO.StringIO(json.dumps(spec))
+
+
+class BatchPlotterTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self._infile = self.path('trace.packet.txt')
+    with open(self._infile, 'w') as f:
+      for i in range(200):
+        f.write('delta1 %f 10.0.0.1:80 192.168.1.1:40000 %f -\n' % (
+            1000. + i * .5, .001 * (1 + i % 10)))
+        f.write('delta1 %f 192.168.1.1:40000 10.0.0.1:80 %f -\n' % (
+            1000. + i * .5 + .1, .1))
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def path(self, name):
+    return os.path.join(self._tmpdir, name)
+
+  def batch_plotter(self, spec):
+    with open(self.path('spec.json'), 'w') as f:
+      json.dump(spec, f)
+    return batch_plotter.BatchPlotter(self._infile, self.path('spec.json'),
+                                      'packet', '10.0.0.0/8', 0, jobs=1)
+
+  def testReadSpec(self):
+    plots = batch_plotter.read_spec(spec_file([
+        {'output': 'all.pdf', 'title': 'full trace'},
+        {'output': 'start.svg', 'time_range': '0:30', 'src_reverse': ''},
+        {'output': 'end', 'format': 'png', 'time_range': '60:'},
+    ]), '10.0.0.0/8', 'packet')
+    self.assertEqual([
+        {'output': 'all.pdf', 'format': 'pdf', 'title': 'full trace',
+         'src_reverse': '10.0.0.0/8', 'time_range': (None, None)},
+        {'output': 'start.svg', 'format': 'svg', 'title': '',
+         'src_reverse': '', 'time_range': (0., 30.)},
+        {'output': 'end', 'format': 'png', 'title': '',
+         'src_reverse': '10.0.0.0/8', 'time_range': (60., None)},
+    ], plots)
+
+  def testInvalidSpec(self):
+    for spec in (
+        # not a list of plots
+        {'output': 'all.pdf'},
+        # unknown key
+        [{'output': 'all.pdf', 'colour': 'red'}],
+        # no output
+        [{'title': 'full trace'}],
+        # unknown format
+        [{'output': 'all'}]):
+      self.assertRaises(AssertionError, batch_plotter.read_spec,
+                        spec_file(spec), None, 'packet')
+    self.assertRaises(ValueError, batch_plotter.read_spec,
+                      spec_file([{'output': 'a.pdf', 'time_range': 'x:y'}]),
+                      None, 'packet')
+
+  def testUnknownPlotType(self):
+    for spec in ([{'output': 'all.bmp'}],
+                 [{'output': 'all.pdf', 'format': 'html5'}]):
+      self.assertRaises(AssertionError, batch_plotter.read_spec,
+                        spec_file(spec), None, 'packet')
+    # checked before anything is rendered
+    self.assertRaises(AssertionError, self.batch_plotter,
+                      [{'output': self.path('a.png')},
+                       {'output': self.path('b.bmp')}])
+    self.assertFalse(os.path.exists(self.path('a.png')))
+
+  def testHtmlFormat(self):
+    # only packet analysis can be exported as html
+    for spec in ([{'output': 'all.html'}],
+                 [{'output': 'all', 'format': 'html'}]):
+      self.assertEqual('html', batch_plotter.read_spec(
+          spec_file(spec), None, 'packet')[0]['format'])
+      self.assertRaises(AssertionError, batch_plotter.read_spec,
+                        spec_file(spec), None, 'flow')
+    self.assertEqual('pdf', batch_plotter.read_spec(
+        spec_file([{'output': 'all.pdf'}]), None, 'flow')[0]['format'])
+
+  def testSharedViews(self):
+    plotter = self.batch_plotter([
+        {'output': self.path('all.png')},
+        {'output': self.path('all.svg'), 'title': 'again'},
+        {'output': self.path('all.html')},
+        {'output': self.path('start.png'), 'time_range': '0:50'},
+        {'output': self.path('swapped.png'), 'src_reverse': '192.168.0.0/16'},
+    ])
+    df = Plotter(self._infile, None, 'packet', None, '', None,
+                 0).read_input()
+    views = plotter.prepare_views(df)
+    # one view per distinct (src_reverse, time_range)
+    self.assertEqual(set([('10.0.0.0/8', (None, None)),
+                          ('10.0.0.0/8', (0., 50.)),
+                          ('192.168.0.0/16', (None, None))]), set(views))
+    self.assertEqual(400, len(views[('10.0.0.0/8', (None, None))]['df']))
+    self.assertEqual(200, len(views[('10.0.0.0/8', (0., 50.))]['df']))
+    self.assertEqual(
+        [200, 200], sorted(views[('10.0.0.0/8', (None, None))]['df']
+                           .dir.value_counts().tolist()))
+    self.assertEqual(
+        views[('10.0.0.0/8', (None, None))]['df'].dir.tolist(),
+        [{'fwd': 'rev', 'rev': 'fwd'}[d] for d in
+         views[('192.168.0.0/16', (None, None))]['df'].dir.tolist()])
+    # the stats are computed once per view (and only for image plots)
+    self.assertIn('stats', views[('10.0.0.0/8', (None, None))])
+    # all the plots are rendered from the parsed file
+    plotter.run()
+    for name in ('all.png', 'all.svg', 'all.html', 'start.png',
+                 'swapped.png'):
+      self.assertTrue(os.path.getsize(self.path(name)) > 0, name)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,701 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Benchmarks.
+
+`analyze` measures the throughput (packets/sec) and peak RSS of each
+stage of the analysis, on synthetic traces (see synthetic_trace.py) of
+increasing sizes:
+
+  decode:  tshark decoding the pcap file into field lines (tshark RSS)
+  parse:   PacketDumper.parse_line()
+  process: TraceInfo.process_packet() (results discarded)
+  output:  writing the results (text format, with the sidecar index)
+
+Every stage runs in its own process, so that its peak RSS is its own.
+Stages after the first one run their preceding stages too (untimed), in
+chunks of CHUNK_PACKETS packets, so memory does not grow with the trace.
+
+  ./benchmark.py analyze --sizes 10000,100000,1000000 -o results.json
+
+`memory` measures the memory footprint of the analysis state, on
+synthetic traces with many concurrent flows (each size runs in its own
+process):
+
+  bytes_per_connection: connection state (ConnectionInfo objects and the
+      connection table), from a traversal of the live objects
+  bytes_per_segment: in-flight (unmatched) segment entries
+  peak_rss_bytes_per_mpkt: RSS growth during the analysis (sampled every
+      CHUNK_PACKETS packets), per million packets
+
+It fails (exit status 1) when a measurement exceeds its budget (see
+MEMORY_BUDGETS, or --budgets for a JSON file with the same structure).
+
+  ./benchmark.py memory --sizes 100000,1000000 --flows 10000
+
+`plot` measures the time spent by the plotter in each of its phases, on
+the packet and flow analysis files of synthetic traces of increasing
+sizes (flow workloads use a flow per FLOW_PACKETS packets):
+
+  read:      Plotter.read_input()
+  direction: Plotter.match_direction() (packet)
+  filter:    Plotter.packet_select() (packet, middle half of the trace,
+             delta1 samples)
+  stats:     Plotter.packet_group_stats() (packet)
+  boxplot:   Plotter.add_boxplot_graph() (packet)
+  draw:      creating the figure artists (boxplots excluded)
+  savefig_<format>: rendering and encoding the figure in each format
+
+  ./benchmark.py plot --sizes 10000,100000,1000000 --formats pdf,png,svg
+"""
+
+
+import argparse
+import collections
+import gc
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+from common import __version__
+from common import peak_rss_bytes
+import synthetic_trace
+
+
+ANALYZE_STAGES = ['decode', 'parse', 'process', 'output']
+DEFAULT_SIZES = '10000,100000,1000000'
+CHUNK_PACKETS = 10000
+PLOT_TYPES = ['packet', 'flow']
+PLOT_FORMATS = 'pdf,png,svg'
+FLOW_PACKETS = 20
+MEMORY_TYPES = ['flow', 'packet']
+MEMORY_SIZES = '100000,1000000'
+MEMORY_FLOWS = 10000
+# max bytes (for the default memory workload), per analysis type. Flow
+# mode keeps the delta1 samples of every connection, so its connection
+# state grows with the flow length. RSS growth is spread over fewer
+# packets in the smaller traces
+MEMORY_BUDGETS = {
+    'flow': {
+        'bytes_per_connection': 14000,
+        'bytes_per_segment': 170,
+        'peak_rss_bytes_per_mpkt': 1600000000,
+    },
+    'packet': {
+        'bytes_per_connection': 12500,
+        'bytes_per_segment': 170,
+        'peak_rss_bytes_per_mpkt': 1600000000,
+    },
+}
+RESULTS_VERSION = 1
+
+
+def current_rss_bytes():
+  """Returns the current RSS of this process (linux only, else None)."""
+  try:
+    with open('/proc/self/statm') as f:
+      return int(f.read().split()[1]) * resource.getpagesize()
+  except IOError:
+    return None
+
+
+# objects shared by all the connections (not accounted to any of them)
+SHARED_TYPES = (type, types.ClassType, types.ModuleType, types.FunctionType,
+                types.BuiltinFunctionType)
+
+
+def deep_size(obj, seen):
+  """Returns the size of the objects reachable from obj.
+
+  Args:
+    obj: root object
+    seen: set of the ids of the objects already accounted (or shared).
+        It is updated with the objects reachable from obj.
+
+  Returns:
+    the total size (bytes) of the objects not in seen.
+  """
+  size = 0
+  stack = [obj]
+  while stack:
+    obj = stack.pop()
+    if id(obj) in seen or isinstance(obj, SHARED_TYPES):
+      continue
+    seen.add(id(obj))
+    size += sys.getsizeof(obj)
+    stack.extend(gc.get_referents(obj))
+  return size
+
+
+def read_chunks(path, chunk_packets=CHUNK_PACKETS):
+  """Yields the lines of a file, in lists of up to chunk_packets lines."""
+  with open(path) as f:
+    while True:
+      lines = list(itertools.islice(f, chunk_packets))
+      if not lines:
+        return
+      yield lines
+
+
+class Timer(object):
+  """Accumulates the time spent in `with timer:` blocks."""
+
+  def __init__(self):
+    self.seconds = 0.
+
+  def __enter__(self):
+    self._start = time.time()
+
+  def __exit__(self, *unused_args):
+    self.seconds += time.time() - self._start
+
+
+def run_decode(pcap, fields, analysis_type, tshark_bin):
+  """decode stage: tshark pcap-to-fields decoding."""
+  del fields
+  from packet_dumper import PacketDumper  # pylint: disable=g-import-not-at-top
+  command = PacketDumper(tshark_bin, pcap, None, analysis_type,
+                         0).create_command()
+  timer = Timer()
+  with timer:
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE)
+    packets = sum(1 for _ in iter(proc.stdout.readline, ''))
+    proc.wait()
+  assert proc.returncode == 0, 'tshark failed: %s' % ' '.join(command)
+  return packets, timer.seconds, peak_rss_bytes(resource.RUSAGE_CHILDREN)
+
+
+def run_parse(pcap, fields, analysis_type, tshark_bin):
+  """parse stage: PacketDumper.parse_line()."""
+  del pcap, tshark_bin
+  from packet_dumper import PacketDumper  # pylint: disable=g-import-not-at-top
+  packet_dumper = PacketDumper(None, None, None, analysis_type, 0)
+  timer = Timer()
+  packets = 0
+  for lines in read_chunks(fields):
+    with timer:
+      parsed = [packet_dumper.parse_line(line) for line in lines]
+    packets += len(parsed)
+  return packets, timer.seconds, peak_rss_bytes()
+
+
+def run_process(pcap, fields, analysis_type, tshark_bin, write=False):
+  """process stage: TraceInfo.process_packet() (and output if write)."""
+  del pcap, tshark_bin
+  # pylint: disable=g-import-not-at-top
+  import output_index
+  from output_sink import OutputSink
+  from output_sink import RecordSink
+  from output_sink import TextSink
+  from packet_dumper import PacketDumper
+  from trace_info import TraceInfo
+  # pylint: enable=g-import-not-at-top
+  packet_dumper = PacketDumper(None, None, None, analysis_type, 0)
+  process_timer = Timer()
+  output_timer = Timer()
+  if write:
+    # keep the records, and write them in a separate (timed) step
+    sink = RecordSink()
+    out = open(os.devnull, 'w')
+    writer = output_index.IndexedWriter(out)
+    text_sink = TextSink(writer)
+  else:
+    sink = OutputSink()
+
+  def write_records():
+    records = sink.take()
+    with output_timer:
+      for record in records['samples']:
+        text_sink.sample(record)
+      for record in records['evicted']:
+        text_sink.evicted(record)
+      for record in records['flows']:
+        text_sink.flow(record)
+      for record in records['top']:
+        text_sink.top(record)
+
+  with process_timer:
+    trace_info = TraceInfo(sink, analysis_type)
+  packets = 0
+  for lines in read_chunks(fields):
+    parsed = [packet_dumper.parse_line(line) for line in lines]
+    with process_timer:
+      for packet in parsed:
+        trace_info.process_packet(packet)
+    packets += len(parsed)
+    if write:
+      write_records()
+  with process_timer:
+    trace_info.finish()
+  if not write:
+    return packets, process_timer.seconds, peak_rss_bytes()
+  write_records()
+  with output_timer:
+    writer.write_index(out)
+  out.close()
+  return packets, output_timer.seconds, peak_rss_bytes()
+
+
+def run_memory(fields, analysis_type):
+  """memory benchmark: analysis state footprint.
+
+  Args:
+    fields: tshark field output file
+    analysis_type: analysis type ('flow' or 'packet')
+
+  Returns:
+    the measurements (as a dictionary).
+  """
+  # pylint: disable=g-import-not-at-top
+  from output_sink import OutputSink
+  from packet_dumper import PacketDumper
+  from trace_info import TraceInfo
+  # pylint: enable=g-import-not-at-top
+  packet_dumper = PacketDumper(None, None, None, analysis_type, 0)
+  sink = OutputSink()
+  trace_info = TraceInfo(sink, analysis_type)
+  gc.collect()
+  rss_start = current_rss_bytes()
+  rss_peak = rss_start
+  packets = 0
+  for lines in read_chunks(fields):
+    for line in lines:
+      trace_info.process_packet(packet_dumper.parse_line(line))
+    packets += len(lines)
+    rss_peak = max(rss_peak, current_rss_bytes())
+  # account the segment entries first, so they are excluded from the
+  # connection state
+  # pylint: disable=protected-access
+  connections = trace_info._conn
+  # pylint: enable=protected-access
+  seen = set([id(sink)])
+  segments = 0
+  segment_bytes = 0
+  for conn in connections.itervalues():
+    for _, entries in conn.in_flight_segments():
+      segments += len(entries)
+      for entry in entries:
+        segment_bytes += deep_size(entry, seen)
+  connection_bytes = deep_size(connections, seen)
+  return {
+      'packets': packets,
+      'connections': len(connections),
+      'segments': segments,
+      'bytes_per_connection': (connection_bytes / len(connections)
+                               if connections else None),
+      'bytes_per_segment': segment_bytes / segments if segments else None,
+      'peak_rss_bytes': peak_rss_bytes(),
+      'peak_rss_bytes_per_mpkt': (
+          (rss_peak - rss_start) * 1000000 / packets
+          if rss_start is not None and packets else None),
+  }
+
+
+def run_output(pcap, fields, analysis_type, tshark_bin):
+  """output stage: writing the results."""
+  return run_process(pcap, fields, analysis_type, tshark_bin, write=True)
+
+
+STAGE_RUNNERS = {
+    'decode': run_decode,
+    'parse': run_parse,
+    'process': run_process,
+    'output': run_output,
+}
+
+
+def trace_files(config, workdir):
+  """Returns the (pcap, fields) files of a workload (generating them)."""
+  base = os.path.join(workdir, config.name())
+  pcap, fields = base + '.pcap', base + '.fields'
+  if not (os.path.isfile(pcap) and os.path.isfile(fields)):
+    sys.stderr.write('generating %s\n' % base)
+    with open(pcap + '.tmp', 'wb') as pcap_file:
+      with open(fields + '.tmp', 'w') as fields_file:
+        synthetic_trace.write_trace(config, pcap_file, fields_file)
+    os.rename(pcap + '.tmp', pcap)
+    os.rename(fields + '.tmp', fields)
+  return pcap, fields
+
+
+def analysis_file(config, analysis_type, workdir):
+  """Returns the analysis file of a workload (generating it)."""
+  # pylint: disable=g-import-not-at-top
+  from packet_dumper import PacketDumper
+  from trace_info import TraceInfo
+  # pylint: enable=g-import-not-at-top
+  _, fields = trace_files(config, workdir)
+  path = os.path.join(workdir, '%s.%s.txt' % (config.name(), analysis_type))
+  if not os.path.isfile(path):
+    sys.stderr.write('analyzing %s\n' % path)
+    packet_dumper = PacketDumper(None, None, None, analysis_type, 0)
+    with open(path + '.tmp', 'w') as f:
+      trace_info = TraceInfo(f, analysis_type)
+      for lines in read_chunks(fields):
+        for line in lines:
+          trace_info.process_packet(packet_dumper.parse_line(line))
+      trace_info.finish()
+    os.rename(path + '.tmp', path)
+  return path
+
+
+def which(binary):
+  """Returns whether a binary can be run (by path, or in the PATH)."""
+  if os.path.dirname(binary):
+    return os.access(binary, os.X_OK)
+  return any(os.access(os.path.join(path, binary), os.X_OK)
+             for path in os.environ.get('PATH', '').split(os.pathsep))
+
+
+def run_in_process(args):
+  """Runs an internal benchmark command, and returns its measurements."""
+  command = [sys.executable, os.path.abspath(__file__)] + args
+  output = subprocess.check_output(command)
+  return json.loads(output.splitlines()[-1])
+
+
+def run_stage_process(stage, pcap, fields, analysis_type, tshark_bin):
+  """Runs a stage in a new process, and returns its measurements."""
+  return run_in_process(['run-stage', stage, pcap, fields,
+                         '--type', analysis_type, '--tshark', tshark_bin])
+
+
+def environment():
+  return {
+      'rttcp_version': __version__,
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'machine': platform.machine(),
+      'time': time.time(),
+  }
+
+
+def benchmark_analyze(options):
+  """Runs the analyze benchmark, and returns its results."""
+  stages = options.stages.split(',')
+  assert set(stages).issubset(ANALYZE_STAGES), (
+      'invalid stages: %s' % options.stages)
+  workdir = options.workdir or tempfile.mkdtemp(prefix='rttcp-bench-')
+  if not os.path.isdir(workdir):
+    os.makedirs(workdir)
+  results = []
+  for size in [int(size) for size in options.sizes.split(',')]:
+    config = synthetic_trace.TraceConfig(
+        size, options.flows, options.rtt, options.loss, options.reorder,
+        options.window, options.timestamps, options.seed)
+    pcap, fields = trace_files(config, workdir)
+    for stage in stages:
+      result = {'stage': stage, 'size': size, 'workload': config.name()}
+      if stage == 'decode' and not which(options.tshark):
+        result['skipped'] = 'tshark not found: %s' % options.tshark
+      else:
+        measurements = run_stage_process(stage, pcap, fields,
+                                         options.analysis_type,
+                                         options.tshark)
+        result.update(measurements)
+        result['packets_per_sec'] = (measurements['packets'] /
+                                     measurements['seconds']
+                                     if measurements['seconds'] else None)
+      sys.stderr.write('%s\n' % json.dumps(result, sort_keys=True))
+      results.append(result)
+  return {
+      'version': RESULTS_VERSION,
+      'benchmark': 'analyze',
+      'environment': environment(),
+      'analysis_type': options.analysis_type,
+      'results': results,
+  }
+
+
+def read_budgets(path):
+  """Returns the memory budgets (MEMORY_BUDGETS, updated from a file)."""
+  budgets = dict((analysis_type, dict(budget))
+                 for analysis_type, budget in MEMORY_BUDGETS.iteritems())
+  if path is not None:
+    with open(path) as f:
+      for analysis_type, budget in json.load(f).iteritems():
+        budgets.setdefault(analysis_type, {}).update(budget)
+  return budgets
+
+
+def benchmark_memory(options):
+  """Runs the memory benchmark, and returns its results.
+
+  Every result lists the measurements that exceed their budgets (if any)
+  in 'over_budget'.
+  """
+  types = options.types.split(',')
+  assert set(types).issubset(MEMORY_TYPES), 'invalid types: %s' % (
+      options.types)
+  budgets = read_budgets(options.budgets)
+  workdir = options.workdir or tempfile.mkdtemp(prefix='rttcp-bench-')
+  if not os.path.isdir(workdir):
+    os.makedirs(workdir)
+  results = []
+  for size in [int(size) for size in options.sizes.split(',')]:
+    config = synthetic_trace.TraceConfig(
+        size, options.flows, options.rtt, options.loss, options.reorder,
+        options.window, options.timestamps, options.seed)
+    _, fields = trace_files(config, workdir)
+    for analysis_type in types:
+      result = {'type': analysis_type, 'size': size,
+                'workload': config.name()}
+      result.update(run_in_process(['run-memory', fields,
+                                    '--type', analysis_type]))
+      budget = budgets.get(analysis_type, {})
+      result['over_budget'] = sorted(
+          name for name, limit in budget.iteritems()
+          if result.get(name) is not None and result[name] > limit)
+      sys.stderr.write('%s\n' % json.dumps(result, sort_keys=True))
+      results.append(result)
+  return {
+      'version': RESULTS_VERSION,
+      'benchmark': 'memory',
+      'environment': environment(),
+      'budgets': budgets,
+      'results': results,
+  }
+
+
+def timed(timer, function):
+  """Returns a version of function that runs inside the timer."""
+  def wrapper(*args, **kwargs):
+    with timer:
+      return function(*args, **kwargs)
+  return wrapper
+
+
+def run_plot(path, analysis_type, formats):
+  """Runs the plotter phases on an analysis file.
+
+  Args:
+    path: analysis file
+    analysis_type: analysis type ('flow' or 'packet')
+    formats: list of plot formats
+
+  Returns:
+    a (rows, {phase: seconds}) tuple.
+  """
+  os.environ.setdefault('MPLBACKEND', 'Agg')
+  # pylint: disable=g-import-not-at-top
+  import matplotlib.pyplot as plt
+  from plotter import Plotter
+  # pylint: enable=g-import-not-at-top
+  phases = collections.OrderedDict()
+  timers = collections.defaultdict(Timer)
+  plotter = Plotter(path, None, analysis_type, None, path, None, -1)
+  with timers['read']:
+    df = plotter.read_input()
+  rows = len(df)
+  if analysis_type == 'flow':
+    with timers['draw']:
+      plotter.flow_plot_data(df)
+    names = ['read', 'draw']
+  else:
+    with timers['direction']:
+      df['dir'] = plotter.match_direction(df.src)
+    duration = df.timestamp.max() - df.timestamp.min()
+    selector = Plotter(path, None, analysis_type, None, path, None, -1,
+                       time_range='%f:%f' % (duration / 4, duration * 3 / 4),
+                       delta='delta1')
+    with timers['filter']:
+      selector.packet_select(df, df.timestamp.min())
+    with timers['stats']:
+      stats = plotter.packet_group_stats(df)
+    # the boxplots are drawn as part of the time series graphs
+    plotter.add_boxplot_graph = timed(timers['boxplot'],
+                                      plotter.add_boxplot_graph)
+    with timers['draw']:
+      plotter.packet_draw_stats(stats)
+    timers['draw'].seconds -= timers['boxplot'].seconds
+    names = ['read', 'direction', 'filter', 'stats', 'boxplot', 'draw']
+  for plot_format in formats:
+    name = 'savefig_%s' % plot_format
+    with open(os.devnull, 'wb') as f:
+      with timers[name]:
+        plt.savefig(f, format=plot_format)
+    names.append(name)
+  plt.close('all')
+  for name in names:
+    phases[name] = timers[name].seconds
+  return rows, phases
+
+
+def benchmark_plot(options):
+  """Runs the plot benchmark, and returns its results."""
+  types = options.types.split(',')
+  assert set(types).issubset(PLOT_TYPES), 'invalid types: %s' % options.types
+  formats = options.formats.split(',')
+  workdir = options.workdir or tempfile.mkdtemp(prefix='rttcp-bench-')
+  if not os.path.isdir(workdir):
+    os.makedirs(workdir)
+  results = []
+  for size in [int(size) for size in options.sizes.split(',')]:
+    for analysis_type in types:
+      flows = (options.flows if analysis_type == 'packet' else
+               max(1, size // FLOW_PACKETS))
+      config = synthetic_trace.TraceConfig(
+          size, flows, options.rtt, options.loss, options.reorder,
+          options.window, options.timestamps, options.seed)
+      path = analysis_file(config, analysis_type, workdir)
+      rows, phases = run_plot(path, analysis_type, formats)
+      result = {
+          'type': analysis_type,
+          'size': size,
+          'workload': config.name(),
+          'rows': rows,
+          'phases': phases,
+          'seconds': sum(phases.values()),
+      }
+      sys.stderr.write('%s\n' % json.dumps(result))
+      results.append(result)
+  return {
+      'version': RESULTS_VERSION,
+      'benchmark': 'plot',
+      'environment': environment(),
+      'results': results,
+  }
+
+
+def get_options(argv):
+  """Generic option parser.
+
+  Args:
+    argv: list containing arguments
+
+  Returns:
+    argparse.ArgumentParser - generated option object
+  """
+  parser = argparse.ArgumentParser(description='rttcp benchmarks.')
+  subparsers = parser.add_subparsers()
+  parser_analyze = subparsers.add_parser('analyze', help='analysis stage '
+                                         'throughput and memory')
+  parser_analyze.set_defaults(benchmark='analyze')
+  parser_plot = subparsers.add_parser('plot', help='plotter phase times')
+  parser_plot.set_defaults(benchmark='plot')
+  parser_memory = subparsers.add_parser('memory', help='analysis state '
+                                        'footprint, against budgets')
+  parser_memory.set_defaults(benchmark='memory')
+  parser_stage = subparsers.add_parser('run-stage', help='run a single '
+                                       'stage (internal)')
+  parser_stage.set_defaults(benchmark='run-stage')
+  parser_run_memory = subparsers.add_parser('run-memory', help='run a '
+                                            'single memory benchmark '
+                                            '(internal)')
+  parser_run_memory.set_defaults(benchmark='run-memory')
+  parser_run_memory.add_argument('fields')
+  parser_run_memory.add_argument('--type', action='store',
+                                 dest='analysis_type', default='packet',
+                                 metavar='ANALYSIS_TYPE',
+                                 help='set the analysis type (flow, packet)')
+  for p in (parser_analyze, parser_stage):
+    p.add_argument('--type', action='store', dest='analysis_type',
+                   default='packet', metavar='ANALYSIS_TYPE',
+                   help='set the analysis type (flow, packet)')
+    p.add_argument('--tshark', dest='tshark', default='tshark',
+                   metavar='TSHARK', help='tshark binary')
+  parser_stage.add_argument('stage', choices=ANALYZE_STAGES)
+  parser_stage.add_argument('pcap')
+  parser_stage.add_argument('fields')
+  parser_analyze.add_argument('--stages', dest='stages',
+                              default=','.join(ANALYZE_STAGES),
+                              help='comma-separated stages (%s)' %
+                              ', '.join(ANALYZE_STAGES))
+  parser_plot.add_argument('--types', dest='types',
+                           default=','.join(PLOT_TYPES),
+                           help='comma-separated analysis types (%s)' %
+                           ', '.join(PLOT_TYPES))
+  parser_plot.add_argument('--formats', dest='formats', default=PLOT_FORMATS,
+                           help='comma-separated plot formats')
+  parser_memory.add_argument('--types', dest='types',
+                             default=','.join(MEMORY_TYPES),
+                             help='comma-separated analysis types (%s)' %
+                             ', '.join(MEMORY_TYPES))
+  parser_memory.add_argument('--budgets', dest='budgets', default=None,
+                             metavar='BUDGETS-FILE',
+                             help='JSON file with the max bytes of each '
+                             'measurement, per analysis type (overrides '
+                             'the default budgets)')
+  for p in (parser_analyze, parser_plot, parser_memory):
+    p.add_argument('-o', '--output', dest='outfile', default='-',
+                   metavar='OUTPUT-FILE', help='JSON results file')
+    p.add_argument('--sizes', dest='sizes', default=DEFAULT_SIZES,
+                   help='comma-separated trace sizes (packets)')
+    p.add_argument('--workdir', dest='workdir', default=None,
+                   help='directory for the (reusable) synthetic traces')
+    p.add_argument('--flows', type=int, dest='flows', default=100,
+                   help='number of (concurrent) flows')
+    p.add_argument('--rtt', type=float, dest='rtt', default=.02,
+                   help='round-trip time (sec)')
+    p.add_argument('--loss', type=float, dest='loss', default=.001,
+                   help='data segment loss probability')
+    p.add_argument('--reorder', type=float, dest='reorder', default=.001,
+                   help='data segment reordering probability')
+    p.add_argument('--window', type=int, dest='window', default=10,
+                   help='window (segments per round trip)')
+    p.add_argument('--no-timestamps', action='store_false',
+                   dest='timestamps', default=True,
+                   help='do not use the TCP timestamp option')
+    p.add_argument('--seed', type=int, dest='seed', default=1,
+                   help='random seed')
+  parser_memory.set_defaults(sizes=MEMORY_SIZES, flows=MEMORY_FLOWS)
+  return parser.parse_args(argv[1:])
+
+
+def main(argv):
+  options = get_options(argv)
+  if options.benchmark == 'run-stage':
+    packets, seconds, rss = STAGE_RUNNERS[options.stage](
+        options.pcap, options.fields, options.analysis_type, options.tshark)
+    print json.dumps({'packets': packets, 'seconds': seconds,
+                      'peak_rss_bytes': rss})
+    return
+  if options.benchmark == 'run-memory':
+    print json.dumps(run_memory(options.fields, options.analysis_type))
+    return
+  if options.benchmark == 'plot':
+    results = benchmark_plot(options)
+  elif options.benchmark == 'memory':
+    results = benchmark_memory(options)
+  else:
+    results = benchmark_analyze(options)
+  # we cannot use controlled execution (`with open(...) as f:`) as we want
+  # to support sys.stdout too.
+  f = open(options.outfile, 'w') if options.outfile != '-' else sys.stdout
+  json.dump(results, f, indent=2, sort_keys=True)
+  f.write('\n')
+  if f != sys.stdout:
+    f.close()
+  over_budget = [result for result in results['results']
+                 if result.get('over_budget')]
+  if over_budget:
+    for result in over_budget:
+      sys.stderr.write('error: %s %s over budget: %s\n' % (
+          result['type'], result['workload'],
+          ', '.join(result['over_budget'])))
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main(sys.argv)
@@ -0,0 +1,376 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""CIDR prefix operations.
+
+Addresses are packed into 128-bit values, stored as a (hi, lo) pair of
+64-bit integers so that they fit in numpy arrays. IPv4 addresses are
+mapped into the IPv6 space (::ffff:a.b.c.d).
+
+Labeled prefixes (e.g. one per cell site or PoP) are matched with a
+longest-prefix-match trie (see PrefixTrie).
+
+numpy is only imported by the vectorized helpers (pack_endpoints() and
+match_prefixes()), so the analysis can use this module without it.
+"""
+
+
+import socket
+import struct
+
+
+MAX_PREFIX_LEN = 128
+IPV4_MAPPED_PREFIX_LEN = 96
+IPV4_MAPPED_LO = 0xffff << 32
+UINT64_MASK = (1 << 64) - 1
+# max cached endpoint directions (cleared when full)
+MAX_CACHED_ENDPOINTS = 100000
+# prefix trie stride (address bits per node)
+TRIE_STRIDE = 8
+# label of the connections (endpoints) not matching any labeled prefix
+NO_LABEL = '-'
+
+
+def parse_address(addr):
+  """Packs an IPv4 or IPv6 address into a (hi, lo) pair."""
+  try:
+    if ':' in addr:
+      return struct.unpack('!QQ', socket.inet_pton(socket.AF_INET6, addr))
+    (lo,) = struct.unpack('!I', socket.inet_pton(socket.AF_INET, addr))
+  except socket.error:
+    raise ValueError('invalid address: "%s"' % addr)
+  return 0, IPV4_MAPPED_LO | lo
+
+
+def split_endpoint(endpoint):
+  """Splits an "addr:port" endpoint (as written by ConnectionInfo)."""
+  addr, _, port = endpoint.rpartition(':')
+  if not addr:
+    # no port
+    return endpoint, None
+  return addr, port
+
+
+def parse_prefix_length(prefix):
+  """Parses a prefix into an (addr_hi, addr_lo, length) tuple.
+
+  Supported formats are "addr/len" (IPv4 or IPv6), a full address (host
+  prefix), and a dotted IPv4 prefix without length (e.g. "192.168", which
+  is the same as "192.168.0.0/16"). IPv4 addresses may be abbreviated
+  (e.g. "10/8"). IPv4 lengths are mapped into the IPv6 space.
+
+  Args:
+    prefix: prefix string
+
+  Returns:
+    an (addr_hi, addr_lo, length) tuple. The address is not masked.
+
+  Raises:
+    ValueError: if the prefix is invalid.
+  """
+  addr, _, length = prefix.partition('/')
+  if ':' in addr:
+    length = int(length) if length else MAX_PREFIX_LEN
+  else:
+    octets = addr.rstrip('.').split('.')
+    if len(octets) > 4:
+      raise ValueError('invalid prefix: "%s"' % prefix)
+    addr = '.'.join(octets + ['0'] * (4 - len(octets)))
+    length = int(length) if length else 8 * len(octets)
+    if length < 0 or length > MAX_PREFIX_LEN - IPV4_MAPPED_PREFIX_LEN:
+      raise ValueError('invalid prefix length: "%s"' % prefix)
+    length += IPV4_MAPPED_PREFIX_LEN
+  hi, lo = parse_address(addr)
+  if length < 0 or length > MAX_PREFIX_LEN:
+    raise ValueError('invalid prefix length: "%s"' % prefix)
+  return hi, lo, length
+
+
+def prefix_mask(length):
+  """Returns the 128-bit mask of a prefix length."""
+  return ((1 << MAX_PREFIX_LEN) - 1) ^ ((1 << (MAX_PREFIX_LEN - length)) - 1)
+
+
+def parse_prefix(prefix):
+  """Parses a prefix into a (net_hi, net_lo, mask_hi, mask_lo) tuple.
+
+  See parse_prefix_length() for the supported formats.
+
+  Args:
+    prefix: prefix string
+
+  Returns:
+    a (net_hi, net_lo, mask_hi, mask_lo) tuple.
+
+  Raises:
+    ValueError: if the prefix is invalid.
+  """
+  hi, lo, length = parse_prefix_length(prefix)
+  mask = prefix_mask(length)
+  mask_hi = mask >> 64
+  mask_lo = mask & UINT64_MASK
+  return hi & mask_hi, lo & mask_lo, mask_hi, mask_lo
+
+
+def parse_prefix_list(prefixes):
+  """Parses a comma-separated list of prefixes (None means no prefix)."""
+  if not prefixes:
+    return []
+  return [parse_prefix(prefix.strip()) for prefix in prefixes.split(',')
+          if prefix.strip()]
+
+
+def pack_endpoints(endpoints):
+  """Packs a list of endpoints into numpy arrays.
+
+  Args:
+    endpoints: list of "addr:port" (or "addr") strings
+
+  Returns:
+    a (hi, lo, valid) tuple of numpy arrays. Invalid endpoints are
+    flagged in `valid`.
+  """
+  import numpy as np  # pylint: disable=g-import-not-at-top
+  hi = np.zeros(len(endpoints), dtype=np.uint64)
+  lo = np.zeros(len(endpoints), dtype=np.uint64)
+  valid = np.zeros(len(endpoints), dtype=bool)
+  for i, endpoint in enumerate(endpoints):
+    addr, _ = split_endpoint(endpoint)
+    try:
+      hi[i], lo[i] = parse_address(addr)
+    except ValueError:
+      continue
+    valid[i] = True
+  return hi, lo, valid
+
+
+def match_prefixes(hi, lo, prefixes):
+  """Returns a boolean array marking the addresses matching any prefix."""
+  import numpy as np  # pylint: disable=g-import-not-at-top
+  matched = np.zeros(len(hi), dtype=bool)
+  for net_hi, net_lo, mask_hi, mask_lo in prefixes:
+    matched |= (((hi & np.uint64(mask_hi)) == np.uint64(net_hi)) &
+                ((lo & np.uint64(mask_lo)) == np.uint64(net_lo)))
+  return matched
+
+
+def match_endpoint(endpoint, prefixes):
+  """Returns whether an "addr:port" endpoint matches any prefix.
+
+  This is the single-endpoint (pure python) version of match_prefixes().
+
+  Args:
+    endpoint: "addr:port" (or "addr") string
+    prefixes: list of parsed prefixes
+
+  Returns:
+    True if the endpoint address is valid and matches any of the prefixes.
+  """
+  addr, _ = split_endpoint(endpoint)
+  try:
+    hi, lo = parse_address(addr)
+  except ValueError:
+    return False
+  return any((hi & mask_hi) == net_hi and (lo & mask_lo) == net_lo
+             for net_hi, net_lo, mask_hi, mask_lo in prefixes)
+
+
+class DirectionCache(object):
+  """Classifies "addr:port" endpoints into 'fwd' and 'rev' (memoized).
+
+  Endpoints matching any of the prefixes are 'rev'. This is the streaming
+  version of the plotter's match_direction().
+  """
+
+  def __init__(self, prefixes, max_size=MAX_CACHED_ENDPOINTS):
+    self._prefixes = prefixes
+    self._max_size = max_size
+    self._directions = {}
+
+  def direction(self, endpoint):
+    direction = self._directions.get(endpoint)
+    if direction is None:
+      direction = 'rev' if match_endpoint(endpoint, self._prefixes) else 'fwd'
+      if len(self._directions) >= self._max_size:
+        self._directions = {}
+      self._directions[endpoint] = direction
+    return direction
+
+
+class PrefixTrie(object):
+  """A longest-prefix-match table of labeled IPv4 and IPv6 prefixes.
+
+  This is a multibit trie over the 128-bit addresses, with TRIE_STRIDE
+  bits per node. Each node maps every value of its stride to a child
+  node, and to the longest prefix ending within the stride (prefixes are
+  expanded to the stride boundary when inserted). A lookup then visits at
+  most MAX_PREFIX_LEN / TRIE_STRIDE nodes (fewer if the trie is shallower
+  there), whatever the number of prefixes.
+  """
+
+  def __init__(self):
+    # node: (children, entries), where entries map values to
+    # (length, label) pairs
+    self._root = ({}, {})
+    self._default = None
+    self._size = 0
+
+  def __len__(self):
+    return self._size
+
+  def insert(self, prefix, label):
+    """Adds a labeled prefix (a later duplicate replaces the label)."""
+    hi, lo, length = parse_prefix_length(prefix)
+    self._size += 1
+    if length == 0:
+      self._default = (0, label)
+      return
+    addr = ((hi << 64) | lo) & prefix_mask(length)
+    # the prefix ends within the stride of this level
+    level = (length - 1) // TRIE_STRIDE
+    node = self._root
+    for i in xrange(level):
+      value = self._value(addr, i)
+      child = node[0].get(value)
+      if child is None:
+        child = node[0][value] = ({}, {})
+      node = child
+    value = self._value(addr, level)
+    entries = node[1]
+    for v in xrange(value, value + (1 << (TRIE_STRIDE * (level + 1) -
+                                          length))):
+      entry = entries.get(v)
+      if entry is None or entry[0] <= length:
+        entries[v] = (length, label)
+
+  def _value(self, addr, level):
+    shift = MAX_PREFIX_LEN - TRIE_STRIDE * (level + 1)
+    return (addr >> shift) & ((1 << TRIE_STRIDE) - 1)
+
+  def match(self, hi, lo):
+    """Returns the longest (length, label) prefix matching an address.
+
+    Args:
+      hi: packed address, high 64 bits (see parse_address())
+      lo: packed address, low 64 bits
+
+    Returns:
+      the (length, label) pair of the longest matching prefix (or None).
+    """
+    addr = (hi << 64) | lo
+    best = self._default
+    node = self._root
+    shift = MAX_PREFIX_LEN
+    while node is not None:
+      shift -= TRIE_STRIDE
+      value = (addr >> shift) & ((1 << TRIE_STRIDE) - 1)
+      entry = node[1].get(value)
+      if entry is not None:
+        best = entry
+      node = node[0].get(value)
+    return best
+
+  def lookup(self, endpoint):
+    """Returns the label of an "addr:port" endpoint (or None).
+
+    A bare IPv6 address would lose its last group (taken as the port):
+    use lookup_address() for addresses.
+
+    Args:
+      endpoint: "addr:port" endpoint (or a bare IPv4 address)
+
+    Returns:
+      the label of the longest matching prefix (or None).
+    """
+    addr, _ = split_endpoint(endpoint)
+    return self.lookup_address(addr)
+
+  def lookup_address(self, addr):
+    """Returns the label of an (IPv4 or IPv6) address (or None)."""
+    try:
+      entry = self.match(*parse_address(addr))
+    except ValueError:
+      return None
+    return entry[1] if entry is not None else None
+
+  def label(self, *endpoints):
+    """Returns the label of a connection, from its "addr:port" endpoints.
+
+    See label_addresses() (which takes bare addresses).
+
+    Args:
+      *endpoints: "addr:port" endpoints (or bare IPv4 addresses)
+
+    Returns:
+      the connection label.
+    """
+    return self.label_addresses(*[split_endpoint(endpoint)[0]
+                                  for endpoint in endpoints])
+
+  def label_addresses(self, *addrs):
+    """Returns the label of a connection (NO_LABEL if none).
+
+    The longest prefix matching any of the addresses wins, and ties go to
+    the lowest label, so the label does not depend on the address order.
+
+    Args:
+      *addrs: (IPv4 or IPv6) addresses
+
+    Returns:
+      the connection label.
+    """
+    best = None
+    for addr in addrs:
+      try:
+        entry = self.match(*parse_address(addr))
+      except ValueError:
+        continue
+      if entry is not None and (best is None or
+                                (-entry[0], entry[1]) < (-best[0], best[1])):
+        best = entry
+    return best[1] if best is not None else NO_LABEL
+
+def read_prefix_labels(path):
+  """Reads a prefix label file into a PrefixTrie.
+
+  Each line has a prefix (see parse_prefix_length()) and its label (e.g.
+  "10.1.0.0/16 site-1"), separated by whitespace. Empty lines and "#"
+  comments are ignored.
+
+  Args:
+    path: prefix label file path
+
+  Returns:
+    a PrefixTrie.
+
+  Raises:
+    ValueError: if a line is invalid.
+  """
+  trie = PrefixTrie()
+  with open(path, 'r') as f:
+    for lineno, line in enumerate(f, 1):
+      fields = line.partition('#')[0].split()
+      if not fields:
+        continue
+      if len(fields) != 2 or fields[1] == NO_LABEL:
+        raise ValueError('%s:%i: invalid prefix label line: "%s"' % (
+            path, lineno, line.rstrip()))
+      try:
+        trie.insert(fields[0], fields[1])
+      except ValueError as e:
+        raise ValueError('%s:%i: %s' % (path, lineno, e))
+  return trie
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for cidr.py."""
+
+import os
+import random
+import tempfile
+import unittest
+import cidr
+
+
+class CidrTest(unittest.TestCase):
+
+  def testParseAddress(self):
+    self.assertEqual((0, 0xffffc0a80101), cidr.parse_address('192.168.1.1'))
+    self.assertEqual((0x20010db800000000, 1), cidr.parse_address('2001:db8::1'))
+    self.assertRaises(ValueError, cidr.parse_address, '192.168.1')
+    self.assertRaises(ValueError, cidr.parse_address, 'foo')
+
+  def testSplitEndpoint(self):
+    self.assertEqual(('192.168.1.1', '80'),
+                     cidr.split_endpoint('192.168.1.1:80'))
+    self.assertEqual(('2001:db8::1', '443'),
+                     cidr.split_endpoint('2001:db8::1:443'))
+    self.assertEqual(('192.168.1.1', None), cidr.split_endpoint('192.168.1.1'))
+
+  def testParsePrefix(self):
+    self.assertEqual(cidr.parse_prefix('192.168.0.0/16'),
+                     cidr.parse_prefix('192.168'))
+    self.assertEqual(cidr.parse_prefix('192.168.0.0/16'),
+                     cidr.parse_prefix('192.168.'))
+    self.assertEqual(cidr.parse_prefix('192.168.0.0/16'),
+                     cidr.parse_prefix('192.168.7.7/16'))
+    self.assertEqual(cidr.parse_prefix('10.0.0.1/32'),
+                     cidr.parse_prefix('10.0.0.1'))
+    self.assertRaises(ValueError, cidr.parse_prefix, '10.0.0.0/33')
+    self.assertRaises(ValueError, cidr.parse_prefix, '2001:db8::/129')
+    self.assertRaises(ValueError, cidr.parse_prefix, '1.2.3.4.5')
+    self.assertEqual([], cidr.parse_prefix_list(None))
+    self.assertEqual(2, len(cidr.parse_prefix_list('10/8, 2001:db8::/32')))
+
+  def testMatchPrefixes(self):
+    endpoints = ['192.168.1.1:80', '192.169.1.1:80', '10.1.2.3:443',
+                 '2001:db8::1:443', '2001:db9::1:443', 'invalid:80']
+    hi, lo, valid = cidr.pack_endpoints(endpoints)
+    self.assertEqual([True, True, True, True, True, False], list(valid))
+    test_arr = [
+        ['192.168', [True, False, False, False, False]],
+        ['192.168.0.0/15', [True, True, False, False, False]],
+        ['10.0.0.0/8,2001:db8::/32', [False, False, True, True, False]],
+        ['0.0.0.0/0', [True, True, True, False, False]],
+        ['::/0', [True, True, True, True, True]],
+        ['', [False, False, False, False, False]],
+    ]
+    for prefixes, expected in test_arr:
+      matched = cidr.match_prefixes(hi, lo, cidr.parse_prefix_list(prefixes))
+      self.assertEqual(expected, list(matched[:5]))
+      # the single-endpoint version agrees (and rejects invalid endpoints)
+      self.assertEqual(expected + [False], [
+          cidr.match_endpoint(endpoint, cidr.parse_prefix_list(prefixes))
+          for endpoint in endpoints])
+
+  def testDirectionCache(self):
+    cache = cidr.DirectionCache(cidr.parse_prefix_list('10/8'), max_size=2)
+    for _ in range(2):
+      self.assertEqual(['rev', 'fwd', 'fwd', 'rev'], [
+          cache.direction(endpoint)
+          for endpoint in ('10.0.0.1:80', '192.168.1.1:80', 'invalid:80',
+                           '10.0.0.2:443')])
+
+  def testPrefixTrie(self):
+    trie = cidr.PrefixTrie()
+    # (inserted in no particular length order)
+    for prefix, label in (('192.168.0.0/24', 'b'), ('192.168.0.0/25', 'a'),
+                          ('192.168.0.7', 'host'), ('10/8', 'pop'),
+                          ('192.168.0.128/26', 'c'), ('2001:db8::/32', 'v6'),
+                          ('2001:db8:1::/48', 'v6-1')):
+      trie.insert(prefix, label)
+    self.assertEqual(7, len(trie))
+    test_arr = [
+        ['192.168.0.1:80', 'a'],
+        ['192.168.0.7:80', 'host'],
+        ['192.168.0.127', 'a'],
+        ['192.168.0.128', 'c'],
+        ['192.168.0.192', 'b'],
+        ['192.168.1.1', None],
+        ['10.255.0.1:443', 'pop'],
+        ['2001:db8::1:443', 'v6'],
+        ['2001:db8:1::1:443', 'v6-1'],
+        ['2001:db9::1:443', None],
+        ['invalid:80', None],
+    ]
+    for endpoint, expected in test_arr:
+      self.assertEqual(expected, trie.lookup(endpoint))
+    # connection labels: the longest match of any endpoint
+    self.assertEqual('a', trie.label('10.0.0.1:80', '192.168.0.1:4000'))
+    self.assertEqual('a', trie.label('192.168.0.1:4000', '10.0.0.1:80'))
+    self.assertEqual('pop', trie.label('10.0.0.1:80', '192.168.1.1:4000'))
+    self.assertEqual(cidr.NO_LABEL, trie.label('1.1.1.1:80', 'invalid:80'))
+    self.assertEqual('v6', trie.label('2001:db9::2:80', '2001:db8::1:443'))
+    # bare addresses (an IPv6 address has no port to split)
+    self.assertEqual('v6', trie.lookup_address('2001:db8::1'))
+    self.assertEqual('v6', trie.label_addresses('2001:db8::1', '2001:db9::2'))
+    self.assertEqual('v6-1', trie.label_addresses('2001:db9::2',
+                                                  '2001:db8:1::1'))
+    self.assertEqual('a', trie.label_addresses('10.0.0.1', '192.168.0.1'))
+    self.assertEqual(cidr.NO_LABEL, trie.label_addresses('2001:db9::1',
+                                                         'invalid'))
+    # a default route
+    trie.insert('::/0', 'default')
+    self.assertEqual('default', trie.lookup('1.1.1.1'))
+
+  def testPrefixTrieLongestMatch(self):
+    # compare with a linear scan over random prefixes
+    rng = random.Random(1)
+    prefixes = []
+    trie = cidr.PrefixTrie()
+    for i in range(300):
+      prefix = '10.%i.%i.0/%i' % (rng.randint(0, 3), rng.randint(0, 255),
+                                  rng.randint(8, 24))
+      trie.insert(prefix, 'l%i' % i)
+      _, _, length = cidr.parse_prefix_length(prefix)
+      prefixes.append((length, i, cidr.parse_prefix_list(prefix)))
+    for _ in range(1000):
+      endpoint = '10.%i.%i.%i:80' % (rng.randint(0, 3), rng.randint(0, 255),
+                                     rng.randint(0, 255))
+      matches = [(length, i) for length, i, prefix in prefixes
+                 if cidr.match_endpoint(endpoint, prefix)]
+      # the last of the longest prefixes wins
+      expected = 'l%i' % max(matches)[1] if matches else None
+      self.assertEqual(expected, trie.lookup(endpoint))
+
+  def testReadPrefixLabels(self):
+    fd, path = tempfile.mkstemp()
+    try:
+      with os.fdopen(fd, 'w') as f:
+        f.write('# sites\n\n10.1.0.0/16 site-1\n10.2/16\tsite-2  # pop\n')
+      trie = cidr.read_prefix_labels(path)
+      self.assertEqual(2, len(trie))
+      self.assertEqual('site-2', trie.lookup('10.2.3.4:80'))
+      for line in ('10.3.0.0/16\n', '10.3.0.0/16 a b\n', '10.3.0.0/33 a\n',
+                   '10.3.0.0/16 -\n'):
+        with open(path, 'w') as f:
+          f.write(line)
+        self.assertRaises(ValueError, cidr.read_prefix_labels, path)
+    finally:
+      os.remove(path)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -18,9 +18,56 @@
 """Common code."""
 
 
+import resource
+import sys
+
+
 __version__ = '0.0.1'
 
-TCP_SEQ_MAX_VALUE = (1 << 33) - 1
+TCP_SEQ_MAX_VALUE = (1 << 32) - 1
+
+# in-flight (unmatched) segment tracking limits
+MAX_CONN_SEGMENTS = 10000
+MAX_TRACE_SEGMENTS = 1000000
+SEGMENT_HORIZON_SECS = 60.0
+# connections idle for longer than this are expired (metrics exporter)
+CONN_IDLE_TIMEOUT_SECS = 300.0
+
+# sequence ranges (holes + 1) tracked per connection direction (see
+# seq_interval_set.py)
+MAX_SEQ_INTERVALS = 1000
+
+# multi-capture merge reorder buffer (see packet_merger.py)
+REORDER_WINDOW_SECS = 0.1
+REORDER_MAX_PACKETS = 100000
+
+# plot density modes (see Plotter.plot_samples)
+DENSITY_MODES = ['auto', 'on', 'off']
+
+# heavy connection tracking (space-saving counters per metric)
+TOP_METRICS = ['bytes', 'packets', 'delta1']
+TOP_CONNECTIONS = 10
+TOP_COUNTERS = 100
+TOP_LINE_PREFIX = '#top '
+
+# analysis service (see analysis_server.py)
+SERVE_SOCKET = '~/.rttcp.sock'
+SERVE_PORT = 8642
+SERVE_MAX_QUEUE = 256
+
+# metrics exporter (see metrics_exporter.py)
+METRICS_PORT = 9642
+
+# trace store queries (see trace_store.py)
+QUERY_AGGREGATES = ['traces', 'delta', 'flows']
+QUERY_GROUPS = ['none', 'trace', 'label']
+
+
+def peak_rss_bytes(who=resource.RUSAGE_SELF):
+  """Returns the peak RSS of this process (or of its waited children)."""
+  maxrss = resource.getrusage(who).ru_maxrss
+  # linux reports KB, macos bytes
+  return maxrss if sys.platform == 'darwin' else maxrss * 1024
 
 
 def endpoint_cmp(ip1, port1, ip2, port2):
@@ -59,3 +106,22 @@ def decimal_fmt(num, suffix='sec'):
     num /= 1000.0
   return '%.3g %s%s' % (num, 'Y', suffix)
 
+
+def parse_time_range(time_range):
+  """Parses a "START:END" time range (either side may be empty).
+
+  Args:
+    time_range: time range string, or None (whole trace)
+
+  Returns:
+    a (start, end) pair of floats (or None for open sides).
+  """
+  if not time_range:
+    return (None, None)
+  start, sep, end = time_range.partition(':')
+  assert sep, 'invalid time range: %s' % time_range
+  start = float(start) if start else None
+  end = float(end) if end else None
+  assert start is None or end is None or start < end, (
+      'empty time range: %s' % time_range)
+  return (start, end)
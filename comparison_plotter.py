@@ -0,0 +1,177 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Multi-trace comparison plotting code."""
+
+
+import multiprocessing
+import os.path
+
+from common import decimal_fmt
+import matplotlib.pyplot as plt
+from plotter import DELTA4_MAX_VALUE
+from plotter import DIRECTIONS
+from plotter import IP_CONN_COLOR_D
+from plotter import Plotter
+from sample_stats import sample_summary
+
+
+NUM_CDF_POINTS = 200
+NUM_TIME_BINS = 50
+
+# per-analysis-type layout: (series, graph, unit)
+PACKET_LAYOUT = [
+    ('delta1', 'cdf', 'sec'),
+    ('delta2', 'cdf', 'sec'),
+    ('delta4', 'cdf', 'sec'),
+    ('delta1', 'time', 'sec'),
+]
+FLOW_LAYOUT = [
+    ('tcp_goodput_bitrate', 'cdf', 'bps'),
+    ('delta1_large_median', 'cdf', 'sec'),
+    ('delta1_large_median', 'time', 'sec'),
+]
+
+
+def packet_summary(plotter, df):
+  """Summarizes a packet analysis dataframe, per (delta, direction)."""
+  df['dir'] = plotter.match_direction(df.src)
+  df = df[(df.type != 'delta4') | (df.delta < DELTA4_MAX_VALUE)]
+  t0 = df.timestamp.min()
+  duration = df.timestamp.max() - t0
+  summary = {}
+  for (delta, direction), group in df.groupby(['type', 'dir'],
+                                              observed=True):
+    summary[(delta, direction)] = sample_summary(
+        group.timestamp.values, group.delta.values, t0, duration,
+        NUM_CDF_POINTS, NUM_TIME_BINS)
+  return summary
+
+
+def flow_summary(df):
+  """Summarizes a flow analysis dataframe, per column."""
+  df_tcp = df[(df.ip_proto == 6)]
+  t0 = df_tcp.first_ts.min()
+  duration = df_tcp.first_ts.max() - t0
+  summary = {}
+  for column, _, _ in FLOW_LAYOUT:
+    valid = df_tcp[column].notnull().values
+    summary[(column, '-')] = sample_summary(
+        df_tcp.first_ts.values[valid], df_tcp[column].values[valid], t0,
+        duration, NUM_CDF_POINTS, NUM_TIME_BINS)
+  return summary
+
+
+def load_trace_summary(args):
+  """Reads an analysis file and summarizes it (runs in a worker process)."""
+  infile, analysis_type, src_reverse, debug = args
+  plotter = Plotter(infile, None, analysis_type, None, '', src_reverse,
+                    debug)
+  df = plotter.read_input()
+  if analysis_type == 'flow':
+    return flow_summary(df)
+  return packet_summary(plotter, df)
+
+
+class ComparisonPlotter(Plotter):
+  """Class that overlays several analyzed files on shared axes."""
+
+  def __init__(self, infiles, labels, outfile, analysis_type, plot_format,
+               plot_title, src_reverse, debug, jobs=0):
+    super(ComparisonPlotter, self).__init__(
+        None, outfile, analysis_type, plot_format, plot_title, src_reverse,
+        debug)
+    self._infiles = infiles
+    self._labels = (labels if labels else
+                    [os.path.basename(infile) for infile in infiles])
+    assert len(self._labels) == len(self._infiles), (
+        'need one label per input file')
+    self._jobs = jobs if jobs > 0 else multiprocessing.cpu_count()
+
+  def run(self):
+    """Plot several result files obtained from the pcap analysis."""
+    summaries = self.read_summaries()
+    if self._analysis_type == 'flow':
+      layout, directions = FLOW_LAYOUT, ['-']
+    else:
+      layout, directions = PACKET_LAYOUT, DIRECTIONS
+    self.plot_summaries(summaries, layout, directions)
+
+  def read_summaries(self):
+    """Parse and summarize all the input files in parallel."""
+    args = [(infile, self._analysis_type, self._src_reverse, self._debug)
+            for infile in self._infiles]
+    jobs = min(self._jobs, len(args))
+    if jobs <= 1:
+      return map(load_trace_summary, args)
+    pool = multiprocessing.Pool(jobs)
+    try:
+      return pool.map(load_trace_summary, args)
+    finally:
+      pool.close()
+      pool.join()
+
+  def plot_summaries(self, summaries, layout, directions):
+    """Plot the summaries (one row per layout item, one column per dir)."""
+    fig = plt.figure(figsize=(9, 2.5 * len(layout)))
+    fig.subplots_adjust(hspace=.5)
+    for row, (series, graph, unit) in enumerate(layout):
+      for col, direction in enumerate(directions):
+        ax = fig.add_subplot(len(layout), len(directions),
+                             row * len(directions) + col + 1)
+        xmax = 0
+        for i, summary in enumerate(summaries):
+          stats = summary.get((series, direction), {'count': 0})
+          if stats['count'] == 0:
+            continue
+          color, marker = IP_CONN_COLOR_D.get(i,
+                                              IP_CONN_COLOR_D['remaining'])
+          label = '%s (n: %s median: %s)' % (
+              self._labels[i], decimal_fmt(stats['count'], ''),
+              decimal_fmt(stats['quantile'][0.50], unit))
+          if graph == 'cdf':
+            ax.plot(stats['cdf'], stats['cdf_prob'], color=color, label=label)
+            ax.axvline(x=stats['quantile'][0.50], color=color, ls='dashed',
+                       lw=0.5)
+            xmax = max(xmax, stats['quantile'][0.99])
+          elif graph == 'time':
+            x_l, y_l = stats['time_median']
+            ax.plot(x_l, y_l, color=color, marker=marker, markersize=3,
+                    label=label)
+        # scale the value axis
+        formatter, scaled_unit = ((self._format_milli, 'msec')
+                                  if unit == 'sec' else
+                                  (self._format_mega, 'Mbps'))
+        if graph == 'cdf':
+          if xmax > 0:
+            ax.set_xlim(0, xmax)
+          ax.xaxis.set_major_formatter(formatter)
+          ax.set_xlabel('%s value (%s)' % (series, scaled_unit),
+                        fontsize='xx-small')
+          ax.set_ylabel('CDF', fontsize='x-small')
+        else:
+          ax.yaxis.set_major_formatter(formatter)
+          ax.set_xlabel('time since trace start (sec)', fontsize='xx-small')
+          ax.set_ylabel('median %s\n(%s)' % (series, scaled_unit),
+                        fontsize='x-small')
+        if direction != '-':
+          ax.set_title('%s %s' % (series, direction), fontsize='x-small')
+        ax.tick_params(axis='both', which='major', labelsize=8)
+        if ax.get_legend_handles_labels()[0]:
+          ax.legend(prop={'size': 'xx-small'})
+    plt.suptitle(self._plot_title, fontsize='x-small')
+    plt.savefig(self._outfile, format=self._plot_format)
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for comparison_plotter.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+# plot without a display
+os.environ.setdefault('MPLBACKEND', 'Agg')
+# pylint: disable=g-import-not-at-top,g-bad-import-order
+import numpy as np
+import pandas as pd
+import comparison_plotter
+from plotter import Plotter
+
+
+def packet_df(t0):
+  """Returns a packet analysis dataframe (fwd and rev samples)."""
+  rows = []
+  for i in range(100):
+    rows.append(('delta1', t0 + i, '10.0.0.1:80', '192.168.1.1:40000',
+                 .001 * (1 + i % 10), '-'))
+    rows.append(('delta1', t0 + i + .5, '192.168.1.1:40000', '10.0.0.1:80',
+                 .1, '-'))
+    # the heads of the trains are removed from delta4
+    rows.append(('delta4', t0 + i, '10.0.0.1:80', '192.168.1.1:40000',
+                 .001 if i % 2 else .01, 'data'))
+  df = pd.DataFrame(rows, columns=['type', 'timestamp', 'src', 'dst',
+                                   'delta', 'other'])
+  df['src'] = df.src.astype('category')
+  return df
+
+
+def write_packet_file(path, df):
+  with open(path, 'w') as f:
+    for row in df.itertuples(index=False):
+      f.write('%s %f %s %s %f %s\n' % tuple(row))
+
+
+class ComparisonPlotterTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def path(self, name):
+    return os.path.join(self._tmpdir, name)
+
+  def comparison_plotter(self, infiles, labels, analysis_type='packet'):
+    return comparison_plotter.ComparisonPlotter(
+        infiles, labels, self.path('out.png'), analysis_type, 'png', '',
+        '10.0.0.0/8', 0, jobs=1)
+
+  def testLabels(self):
+    # the labels default to the input file names
+    plotter = self.comparison_plotter(['a/before.txt', 'b/after.txt'], None)
+    self.assertEqual(['before.txt', 'after.txt'], plotter._labels)
+    plotter = self.comparison_plotter(['a/x.txt', 'b/x.txt'],
+                                      ['before', 'after'])
+    self.assertEqual(['before', 'after'], plotter._labels)
+    self.assertRaises(AssertionError, self.comparison_plotter,
+                      ['a/x.txt', 'b/x.txt'], ['before'])
+
+  def testPacketSummary(self):
+    plotter = Plotter(None, None, 'packet', None, '', '10.0.0.0/8', 0)
+    summary = comparison_plotter.packet_summary(plotter, packet_df(1000.))
+    self.assertEqual(set([('delta1', 'rev'), ('delta1', 'fwd'),
+                          ('delta4', 'rev')]), set(summary))
+    rev = summary[('delta1', 'rev')]
+    self.assertEqual(100, rev['count'])
+    self.assertAlmostEqual(.0055, rev['quantile'][0.50])
+    self.assertEqual(comparison_plotter.NUM_CDF_POINTS, len(rev['cdf']))
+    self.assertEqual(.001, rev['cdf'][0])
+    self.assertEqual(.01, rev['cdf'][-1])
+    self.assertEqual(100, summary[('delta1', 'fwd')]['count'])
+    self.assertAlmostEqual(.1, summary[('delta1', 'fwd')]['quantile'][0.50])
+    self.assertEqual(50, summary[('delta4', 'rev')]['count'])
+    # the time bins are relative to the trace start
+    x_l, _ = rev['time_median']
+    self.assertEqual(comparison_plotter.NUM_TIME_BINS, len(x_l))
+    self.assertTrue(0 < x_l[0] < x_l[-1] < 100)
+
+  def testFlowSummary(self):
+    df = pd.DataFrame({
+        'first_ts': [2000., 1000., 1010., 1020., 1030.],
+        'ip_proto': [17, 6, 6, 6, 6],
+        'tcp_goodput_bitrate': [1e9, 1e6, 2e6, np.nan, 4e6],
+        'delta1_large_median': [1., .01, .02, .03, np.nan],
+    })
+    summary = comparison_plotter.flow_summary(df)
+    self.assertEqual(set([('tcp_goodput_bitrate', '-'),
+                          ('delta1_large_median', '-')]), set(summary))
+    # only the (valid) tcp flows are used
+    goodput = summary[('tcp_goodput_bitrate', '-')]
+    self.assertEqual(3, goodput['count'])
+    self.assertEqual(2e6, goodput['quantile'][0.50])
+    self.assertEqual(4e6, goodput['cdf'][-1])
+    delta1 = summary[('delta1_large_median', '-')]
+    self.assertEqual(3, delta1['count'])
+    self.assertAlmostEqual(.02, delta1['quantile'][0.50])
+    # relative to the first tcp flow
+    x_l, y_l = delta1['time_median']
+    self.assertTrue(0 < x_l[0] < x_l[-1] < 30)
+    self.assertEqual([.01, .02, .03], list(y_l))
+
+  def testReadSummaries(self):
+    # the same traffic, captured at different times (and a shorter trace)
+    write_packet_file(self.path('a.txt'), packet_df(1000.))
+    write_packet_file(self.path('b.txt'), packet_df(5000.))
+    df = packet_df(9000.)
+    write_packet_file(self.path('c.txt'), df[df.timestamp < 9050.])
+    plotter = self.comparison_plotter(
+        [self.path('a.txt'), self.path('b.txt'), self.path('c.txt')], None)
+    summaries = plotter.read_summaries()
+    # one summary per input file, in order
+    self.assertEqual([100, 100, 50], [summary[('delta1', 'rev')]['count']
+                                      for summary in summaries])
+    # the traces are aligned on their start
+    for key in summaries[0]:
+      for stat in ('cdf', 'time_median'):
+        np.testing.assert_allclose(summaries[0][key][stat],
+                                   summaries[1][key][stat])
+    self.assertTrue(summaries[2][('delta1', 'rev')]['time_median'][0][-1] <
+                    50)
+    plotter.plot_summaries(summaries, comparison_plotter.PACKET_LAYOUT,
+                           ['fwd', 'rev'])
+    self.assertTrue(os.path.getsize(self.path('out.png')) > 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -19,24 +19,56 @@
 
 
 import sys
-import numpy as np
 
+from cidr import NO_LABEL
 from common import endpoint_cmp
+from common import MAX_CONN_SEGMENTS
+from common import SEGMENT_HORIZON_SECS
 from common import TCP_SEQ_MAX_VALUE
 from modulo import Modulo
+from output_sink import DeltaSample
+from output_sink import EvictedRecord
+from output_sink import FlowRecord
+from output_sink import TrafficRecord
+from seq_interval_set import SeqIntervalSet
 
 
 class ConnectionInfo(object):
   """A class containing a summary about a 5-tuple connection."""
 
-  def __init__(self, analysis_type, connhash, f, debug):
+  # profiled methods (see profiler.py)
+  PROFILE_STAGES = {
+      'flow_process_packet': 'flow_accounting',
+      'packet_process_delta1': 'delta1',
+      'packet_process_delta2': 'delta2',
+      'packet_process_delta3': 'delta3',
+      'packet_process_delta4': 'delta4',
+  }
+
+  def __init__(self, analysis_type, connhash, sink, debug,
+               max_segments=MAX_CONN_SEGMENTS,
+               segment_horizon=SEGMENT_HORIZON_SECS, label=NO_LABEL):
     self._analysis_type = analysis_type
     self._connhash = connhash
-    self._f = f
+    # subnet label (see cidr.PrefixTrie)
+    self._label = label
+    self._sink = sink
+    # per-packet traffic records are only built if the sink uses them
+    self._wants_traffic = sink.wants_traffic
     self._debug = debug
+    self._max_segments = max_segments
+    self._segment_horizon = segment_horizon
     self._ip_total_pkt = 0
     self._ip_total_bytes = 0
     self._seq = Modulo(TCP_SEQ_MAX_VALUE)
+    self._evicted_segments = {
+        'delta1': 0,
+        'delta2': 0,
+    }
+    self._delta1_samples = 0
+
+  def label(self):
+    return self._label
 
   def endpoint(self, addr, port):
     return '%s:%s' % (addr, port)
@@ -98,6 +130,66 @@ class ConnectionInfo(object):
     self.packet_process_delta3(src, dst, packet)
     self.packet_process_delta4(src, dst, packet)
 
+  def evict_segments(self, segments, timestamp, delta):
+    """Drop in-flight segments that are too old or over the cap.
+
+    Segments are appended in arrival order, so the oldest ones are always
+    at the head of the list.
+
+    Args:
+      segments: list of in-flight segments (first element is the timestamp)
+      timestamp: current trace time
+      delta: delta the segments belong to (for accounting)
+
+    Returns:
+      the number of evicted segments.
+    """
+    horizon = timestamp - self._segment_horizon
+    i = 0
+    while i < len(segments) and segments[i][0] < horizon:
+      i += 1
+    i = max(i, len(segments) - self._max_segments)
+    if i > 0:
+      del segments[:i]
+      self._evicted_segments[delta] += i
+    return i
+
+  def in_flight_segments(self):
+    """Yields (delta, list) for all the in-flight segment lists."""
+    if self._ip_total_pkt == 0:
+      return
+    for segments in self._tcp_unacked_segments.itervalues():
+      yield 'delta1', segments
+    for segments in self._tcp_untsecred_segments.itervalues():
+      yield 'delta2', segments
+
+  def outstanding_segments(self):
+    """Returns the number of segments waiting for an ACK or TSecr."""
+    return sum(len(segments) for _, segments in self.in_flight_segments())
+
+  def expire_segments(self, timestamp):
+    """Drop in-flight segments older than the horizon."""
+    return sum(self.evict_segments(segments, timestamp, delta)
+               for delta, segments in self.in_flight_segments())
+
+  def flush_segments(self):
+    """Drop all in-flight segments."""
+    evicted = 0
+    for delta, segments in self.in_flight_segments():
+      self._evicted_segments[delta] += len(segments)
+      evicted += len(segments)
+      del segments[:]
+    return evicted
+
+  def last_timestamp(self):
+    return self._last_ts
+
+  def endpoints(self):
+    return (self._src, self._dst)
+
+  def delta1_samples(self):
+    return self._delta1_samples
+
   def packet_process_delta1(self, src, dst, packet):
     """delta1: match data segments with the first ACK that acks them."""
     if self._ip_total_pkt == 0:
@@ -131,6 +223,8 @@ class ConnectionInfo(object):
       else:
         self._tcp_unacked_segments[src] += [[packet.timestamp, packet.tcp_len,
                                              packet.tcp_nxtseq]]
+        self.evict_segments(self._tcp_unacked_segments[src],
+                            packet.timestamp, 'delta1')
     new_ack_value = False
     if packet.tcp_ack is not None:
       if self._tcp_ack_highest[src] is None:
@@ -149,6 +243,7 @@ class ConnectionInfo(object):
       if self._seq.cmp(tcp_nxtseq, self._tcp_ack_highest[src]) <= 0:
         # segment has been acked
         delta1 = packet.timestamp - timestamp
+        self._delta1_samples += 1
         if delta1 > 1.0:
           if self._debug > 0:
             print 'delta1: should remove [%f, %s, %s]' % (
@@ -160,8 +255,8 @@ class ConnectionInfo(object):
           # (note that we are reversing src and dst as the information
           # we have right now refers to the ACK, which goes in the reverse
           # direction than the segment we care about)
-          self._f.write('%s %f %s %s %f -\n' % ('delta1', timestamp,
-                                                dst, src, delta1))
+          self._sink.sample(DeltaSample('delta1', timestamp, dst, src,
+                                        delta1, '-'))
       else:
         new_list += [l]
     self._tcp_unacked_segments[dst] = new_list
@@ -184,6 +279,8 @@ class ConnectionInfo(object):
     if packet.tcp_len > 0:
       self._tcp_untsecred_segments[src] += [[
           packet.timestamp, packet.tcp_tsval]]
+      self.evict_segments(self._tcp_untsecred_segments[src],
+                          packet.timestamp, 'delta2')
       # TODO(chema): detect and delete duplicate data segments
     new_tsecr_value = False
     if packet.tcp_tsecr is not None:
@@ -210,8 +307,8 @@ class ConnectionInfo(object):
           # (note that we are reversing src and dst as the information
           # we have right now refers to the TSecr, which goes in the reverse
           # direction than the segment we care about)
-          self._f.write('%s %f %s %s %f -\n' % ('delta2', timestamp,
-                                                dst, src, delta2))
+          self._sink.sample(DeltaSample('delta2', timestamp, dst, src,
+                                        delta2, '-'))
       else:
         new_list += [l]
     self._tcp_untsecred_segments[dst] = new_list
@@ -251,6 +348,9 @@ class ConnectionInfo(object):
       return
     ref_timestamp, ref_tcp_tsval = self._reference_tcp_tsval[src]
     if self._estimated_hz[src] is None:
+      if packet.timestamp == ref_timestamp:
+        # e.g. a duplicate packet: wait for a later one
+        return
       self._estimated_hz[src] = self.estimate_hz(packet, src)
     if self._estimated_hz[src] == -1:
       return
@@ -261,8 +361,8 @@ class ConnectionInfo(object):
       # emit delta3 line
       if delta3 > 1.0:
         print 'delta3: should remove [%f, %s]' % (packet.timestamp, delta3)
-      self._f.write('%s %f %s %s %f -\n' % ('delta3', packet.timestamp,
-                                            src, dst, delta3))
+      self._sink.sample(DeltaSample('delta3', packet.timestamp, src, dst,
+                                    delta3, '-'))
 
   def packet_process_delta4(self, src, dst, packet):
     """delta4: match consecutive segments from the same src."""
@@ -282,13 +382,14 @@ class ConnectionInfo(object):
       delta4 = packet.timestamp - self._last_timestamp_from[traffic][src]
       if self._analysis_type == 'packet':
         # emit delta4 line
-        self._f.write('%s %f %s %s %f %s\n' % ('delta4', packet.timestamp,
-                                               src, dst, delta4, traffic))
+        self._sink.sample(DeltaSample('delta4', packet.timestamp, src, dst,
+                                      delta4, traffic))
     self._last_timestamp_from[traffic][src] = packet.timestamp
 
   @classmethod
   def flow_header(cls):
-    return '#%s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s' % (
+    return ('#%s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s '
+            '%s %s %s %s' % (
         'connhash',
         'first_ts',
         'last_ts',
@@ -305,7 +406,14 @@ class ConnectionInfo(object):
         'delta1_small_mean',
         'delta1_small_median',
         'delta1_large_mean',
-        'delta1_large_median')
+        'delta1_large_median',
+        'delta1_evicted',
+        'delta2_evicted',
+        'tcp_retrans_bytes',
+        'tcp_spurious_retrans',
+        'tcp_out_of_order',
+        'tcp_holes',
+        'label'))
 
   def flow_process_packet(self, packet):
     """Process a packet for this connection (flow mode)."""
@@ -331,6 +439,20 @@ class ConnectionInfo(object):
           src: 0,
           dst: 0,
       }
+      # retransmission and reordering accounting
+      self._tcp_seq_seen = {
+          src: SeqIntervalSet(self._seq),
+          dst: SeqIntervalSet(self._seq),
+      }
+      # highest ack sent
+      self._tcp_acked = {
+          src: -1,
+          dst: -1,
+      }
+      self._tcp_retrans_bytes = 0
+      self._tcp_spurious_retrans = 0
+      self._tcp_out_of_order = 0
+      self._tcp_holes = 0
     # SYN packet
     if packet.tcp_flags_syn:
       self._tcp_seq_syn[src] = packet.tcp_seq
@@ -343,15 +465,67 @@ class ConnectionInfo(object):
       self._tcp_seq_first[src] = packet.tcp_seq
     nxtseq = (packet.tcp_nxtseq if packet.tcp_nxtseq is not None
               else packet.tcp_seq)
-    if self._tcp_seq_last[src] is None:
+    seq_last = self._tcp_seq_last[src]
+    if seq_last is None:
       self._tcp_seq_last[src] = nxtseq
     else:
-      self._tcp_seq_last[src] = self._seq.max(self._tcp_seq_last[src], nxtseq)
+      self._tcp_seq_last[src] = self._seq.max(seq_last, nxtseq)
+    if self._wants_traffic:
+      # the increments add up to the flow-mode goodput (last - first)
+      goodput_bytes = self._seq.diff(
+          self._tcp_seq_last[src],
+          seq_last if seq_last is not None else self._tcp_seq_first[src])
+      self._sink.traffic(TrafficRecord(packet.timestamp, src, dst,
+                                       packet.ip_len, goodput_bytes))
+    if self._analysis_type == 'flow':
+      self.flow_process_seq(src, dst, packet)
+
+  def flow_process_seq(self, src, dst, packet):
+    """Account retransmissions, reordering, and holes (flow mode).
+
+    Every direction keeps the sequence ranges it has sent (see
+    seq_interval_set.py). Data already seen is retransmitted, and it is
+    spuriously retransmitted if the receiver had already acked it all. New
+    data under the highest sequence number seen fills a hole (it arrives
+    out of order), and new data over it opens a hole.
+
+    Args:
+      src: source endpoint
+      dst: destination endpoint
+      packet: packet
+    """
+    if packet.tcp_ack is not None:
+      self._tcp_acked[src] = self._seq.max(self._tcp_acked[src],
+                                           packet.tcp_ack)
+    if packet.tcp_len <= 0:
+      return
+    seen = self._tcp_seq_seen[src]
+    start = seen.unwrap(packet.tcp_seq)
+    highest = seen.highest()
+    covered = seen.add(start, start + packet.tcp_len)
+    if covered > 0:
+      self._tcp_retrans_bytes += covered
+      acked = self._tcp_acked[dst]
+      if acked != -1 and self._seq.cmp(
+          self._seq.add(packet.tcp_seq, packet.tcp_len), acked) <= 0:
+        self._tcp_spurious_retrans += 1
+    elif highest is not None and start < highest:
+      self._tcp_out_of_order += 1
+    if highest is not None and start > highest:
+      self._tcp_holes += 1
 
   def print_connection_info(self):
     """Prints information about a full connection (flow mode)."""
     if self._analysis_type == 'packet':
+      # emit the eviction counters (if any)
+      for delta in ('delta1', 'delta2'):
+        if self._evicted_segments[delta] > 0:
+          self._sink.evicted(EvictedRecord(
+              self._last_ts, self._src, self._dst,
+              self._evicted_segments[delta], delta))
       return
+    # numpy is only needed (and imported) for flow-mode summaries
+    import numpy as np  # pylint: disable=g-import-not-at-top
     pps = '-'
     ip_bitrate = '-'
     tcp_bytes = '-'
@@ -381,11 +555,15 @@ class ConnectionInfo(object):
         small_mean = np.mean(self._delta1_list[self._dst])
         large_median = np.median(self._delta1_list[self._src])
         large_mean = np.mean(self._delta1_list[self._src])
-      self._f.write('%s %f %f %s %s %s %i %i %f %f %i %i %f %f %f %f %f\n' % (
+      self._sink.flow(FlowRecord(
           self._connhash, self._first_ts, self._last_ts,
           self._ip_proto,
           self._tcp_seq_syn[self._src], self._tcp_seq_syn[self._dst],
           self._ip_total_pkt, self._ip_total_bytes,
           pps, ip_bitrate, tcp_bytes,
           tcp_goodput_bytes, tcp_goodput_bitrate,
-          small_mean, small_median, large_mean, large_median))
+          small_mean, small_median, large_mean, large_median,
+          self._evicted_segments['delta1'],
+          self._evicted_segments['delta2'],
+          self._tcp_retrans_bytes, self._tcp_spurious_retrans,
+          self._tcp_out_of_order, self._tcp_holes, self._label))
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""Unit tests for connection_info.py."""
+
+import unittest
+
+from connection_info import ConnectionInfo
+from output_sink import RecordSink
+from packet_info import PacketInfo
+
+
+def segment(timestamp, seq, length=100, tsval=None):
+  """A client data segment (with a TSval if given)."""
+  return PacketInfo(timestamp, 6, '192.168.1.1', '10.0.0.1', 52 + length,
+                    '40000', '80', seq, length, seq + length, 1, 0, tsval,
+                    None if tsval is None else 1)
+
+
+def ack(timestamp, ack_value, tsecr=None):
+  """A server pure ACK (with a TSecr if given)."""
+  return PacketInfo(timestamp, 6, '10.0.0.1', '192.168.1.1', 52, '80',
+                    '40000', 1, 0, None, ack_value, 0,
+                    None if tsecr is None else 1, tsecr)
+
+
+class ConnectionInfoTest(unittest.TestCase):
+
+  def connection(self, max_segments=100, segment_horizon=100.):
+    self._sink = RecordSink()
+    return ConnectionInfo('packet', 'conn', self._sink, 0,
+                          max_segments=max_segments,
+                          segment_horizon=segment_horizon)
+
+  def delta1_timestamps(self):
+    return [sample.timestamp for sample in self._sink.take()['samples']
+            if sample.delta == 'delta1']
+
+  def evicted(self, conn):
+    self._sink.take()
+    conn.print_connection_info()
+    return [(record.delta, record.count)
+            for record in self._sink.take()['evicted']]
+
+  def testSegmentCap(self):
+    conn = self.connection(max_segments=3)
+    for i in range(5):
+      conn.process_packet(segment(1. + i * .1, 1000 + i * 100))
+    # the oldest segments are dropped
+    self.assertEqual(3, conn.outstanding_segments())
+    conn.process_packet(ack(2., 1500))
+    self.assertEqual(0, conn.outstanding_segments())
+    self.assertEqual([1.2, 1.3, 1.4],
+                     [round(ts, 6) for ts in self.delta1_timestamps()])
+    self.assertEqual([('delta1', 2)], self.evicted(conn))
+
+  def testSegmentHorizon(self):
+    conn = self.connection(segment_horizon=1.)
+    for i, timestamp in enumerate((1., 1.5, 2., 2.6)):
+      conn.process_packet(segment(timestamp, 1000 + i * 100))
+    # the segments older than 1 sec are dropped on arrival
+    self.assertEqual(2, conn.outstanding_segments())
+    self.assertEqual(0, conn.expire_segments(2.5))
+    self.assertEqual(1, conn.expire_segments(3.1))
+    self.assertEqual(1, conn.outstanding_segments())
+    conn.process_packet(ack(3.2, 1400))
+    self.assertEqual([2.6], self.delta1_timestamps())
+    self.assertEqual([('delta1', 3)], self.evicted(conn))
+
+  def testFlushSegments(self):
+    conn = self.connection()
+    for i in range(3):
+      conn.process_packet(segment(1. + i * .1, 1000 + i * 100,
+                                  tsval=100 + i))
+    # every segment waits for an ACK (delta1) and a TSecr (delta2)
+    self.assertEqual(6, conn.outstanding_segments())
+    self.assertEqual(6, conn.flush_segments())
+    self.assertEqual(0, conn.outstanding_segments())
+    self.assertEqual(0, conn.flush_segments())
+    conn.process_packet(ack(2., 1300, tsecr=102))
+    self.assertEqual([], self.delta1_timestamps())
+    self.assertEqual([('delta1', 3), ('delta2', 3)], self.evicted(conn))
+
+
+if __name__ == '__main__':
+  unittest.main()
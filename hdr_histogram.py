@@ -0,0 +1,318 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Log-linear (HDR-style) histograms of the delta samples.
+
+Every power of 2 is split in SUB_BUCKETS linear buckets, so a value is
+known within a fixed relative error (1 / (2 * SUB_BUCKETS) from its
+bucket midpoint), whatever its magnitude. Adding a value is O(1), and
+only the non-empty buckets are stored.
+
+Packet-mode analysis writes a histogram per (delta, direction, traffic)
+group in a summary file next to the analysis file, so the plotter can
+draw the distributions without reading all the samples.
+
+numpy is only imported when samples are added in batches (or binned), so
+importing this module does not slow down the analysis startup.
+"""
+
+
+import collections
+import json
+import math
+import os.path
+
+import cidr
+from output_sink import OutputSink
+
+
+SUB_BUCKETS = 64
+SUMMARY_SUFFIX = '.hist'
+SUMMARY_VERSION = 1
+# HistogramSink adds the samples to the histograms every these samples
+FLUSH_SAMPLES = 65536
+# samples are rounded as written in the analysis files ('%f')
+SAMPLE_DECIMALS = 6
+
+
+class LogLinearHistogram(object):
+  """A log-linear histogram (of positive, negative, and zero values).
+
+  Bucket keys pack the value exponent, its linear sub-bucket, and its sign
+  into an integer: ((exponent * sub_buckets + sub_bucket) << 1) | negative
+  """
+
+  def __init__(self, sub_buckets=SUB_BUCKETS):
+    self.sub_buckets = sub_buckets
+    self.counts = collections.defaultdict(int)
+    self.zeros = 0
+    self.count = 0
+    self.total = 0.
+    self.min = float('inf')
+    self.max = float('-inf')
+
+  def add(self, value):
+    mantissa, exponent = math.frexp(value)
+    sub_buckets = self.sub_buckets
+    if mantissa > 0:
+      self.counts[(exponent * sub_buckets +
+                   int((mantissa - .5) * 2 * sub_buckets)) << 1] += 1
+    elif mantissa < 0:
+      self.counts[((exponent * sub_buckets +
+                    int((-mantissa - .5) * 2 * sub_buckets)) << 1) | 1] += 1
+    else:
+      self.zeros += 1
+    self.count += 1
+    self.total += value
+    if value < self.min:
+      self.min = value
+    if value > self.max:
+      self.max = value
+
+  def add_values(self, values):
+    """Adds an array of values (faster than adding them one by one)."""
+    import numpy as np  # pylint: disable=g-import-not-at-top
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):  # pylint: disable=g-explicit-length-test
+      return
+    mantissa, exponent = np.frexp(values)
+    keys = (((exponent.astype(np.int64) * self.sub_buckets +
+              ((np.abs(mantissa) - .5) * 2 * self.sub_buckets).astype(
+                  np.int64)) << 1) | (mantissa < 0))
+    nonzero = mantissa != 0
+    keys, counts = np.unique(keys[nonzero], return_counts=True)
+    for key, count in zip(keys.tolist(), counts.tolist()):
+      self.counts[key] += count
+    self.zeros += len(values) - int(nonzero.sum())
+    self.count += len(values)
+    self.total += float(values.sum())
+    self.min = min(self.min, float(values.min()))
+    self.max = max(self.max, float(values.max()))
+
+  def merge(self, other):
+    """Adds the values of another histogram (e.g. of another trace)."""
+    assert other.sub_buckets == self.sub_buckets
+    for key, count in other.counts.iteritems():
+      self.counts[key] += count
+    self.zeros += other.zeros
+    self.count += other.count
+    self.total += other.total
+    self.min = min(self.min, other.min)
+    self.max = max(self.max, other.max)
+
+  def bucket_range(self, key):
+    """Returns the (lo, hi) value range of a bucket."""
+    exponent, sub_bucket = divmod(key >> 1, self.sub_buckets)
+    lo = math.ldexp(.5 + .5 * sub_bucket / self.sub_buckets, exponent)
+    hi = math.ldexp(.5 + .5 * (sub_bucket + 1) / self.sub_buckets, exponent)
+    return (-hi, -lo) if key & 1 else (lo, hi)
+
+  def buckets(self):
+    """Returns the non-empty buckets, as sorted (lo, hi, count) tuples."""
+    buckets = [self.bucket_range(key) + (count,)
+               for key, count in self.counts.iteritems()]
+    if self.zeros:
+      buckets.append((0., 0., self.zeros))
+    return sorted(buckets)
+
+  def mean(self):
+    return self.total / self.count if self.count else float('nan')
+
+  def quantile(self, q):
+    """Returns the q-quantile (the midpoint of the bucket containing it)."""
+    assert self.count > 0
+    # the extreme values are known exactly
+    if q <= 0:
+      return self.min
+    if q >= 1:
+      return self.max
+    rank = q * (self.count - 1)
+    seen = 0
+    for lo, hi, count in self.buckets():
+      seen += count
+      if seen > rank:
+        return min(max((lo + hi) / 2, self.min), self.max)
+    return self.max
+
+  def linear_histogram(self, num_bins):
+    """Returns (counts, bin edges) with num_bins linear bins (as numpy).
+
+    Every bucket is accounted at its midpoint, in the range [min, max]
+    (numpy widens an empty range, as it does for the samples).
+    """
+    import numpy as np  # pylint: disable=g-import-not-at-top
+    buckets = self.buckets()
+    midpoints = np.clip([(lo + hi) / 2 for lo, hi, _ in buckets],
+                        self.min, self.max)
+    value_range = (self.min, self.max) if self.min < self.max else None
+    return np.histogram(midpoints, num_bins, range=value_range,
+                        weights=[count for _, _, count in buckets])
+
+  def truncated(self, max_value):
+    """Returns a histogram with the buckets (midpoints) under max_value.
+
+    The sum and max of the truncated histogram are approximated from the
+    bucket midpoints (the min is kept, as only the top is cut).
+    """
+    histogram = LogLinearHistogram(self.sub_buckets)
+    values = []
+    for key, count in self.counts.iteritems():
+      lo, hi = self.bucket_range(key)
+      if (lo + hi) / 2 < max_value:
+        histogram.counts[key] = count
+        values.append(((lo + hi) / 2, count))
+    if self.zeros and max_value > 0:
+      histogram.zeros = self.zeros
+      values.append((0., self.zeros))
+    if not values:
+      return histogram
+    histogram.count = sum(count for _, count in values)
+    histogram.min = self.min
+    if histogram.count == self.count:
+      histogram.total = self.total
+      histogram.max = self.max
+    else:
+      histogram.total = sum(value * count for value, count in values)
+      histogram.max = min(max(max(value for value, _ in values), self.min),
+                          self.max)
+    return histogram
+
+  def to_json(self):
+    return {
+        'count': self.count,
+        'sum': self.total,
+        'min': self.min if self.count else None,
+        'max': self.max if self.count else None,
+        'zeros': self.zeros,
+        # flat [key, count, key, count, ...] list
+        'buckets': [item for key in sorted(self.counts)
+                    for item in (key, self.counts[key])],
+    }
+
+  @classmethod
+  def from_json(cls, data, sub_buckets=SUB_BUCKETS):
+    histogram = cls(sub_buckets)
+    buckets = data['buckets']
+    histogram.counts.update(zip(buckets[0::2], buckets[1::2]))
+    histogram.zeros = data['zeros']
+    histogram.count = data['count']
+    histogram.total = data['sum']
+    if histogram.count:
+      histogram.min = data['min']
+      histogram.max = data['max']
+    return histogram
+
+
+class HistogramSink(OutputSink):
+  """A sink that keeps a histogram per (delta, direction, traffic) group.
+
+  The direction uses the plotter convention: samples from an endpoint in
+  src_reverse are 'rev', the others 'fwd'. Samples are buffered, and added
+  to their histograms in batches, rounded as in the analysis file (so the
+  histograms match the samples the plotter would read).
+  """
+
+  def __init__(self, src_reverse=None, sub_buckets=SUB_BUCKETS):
+    self._src_reverse = src_reverse
+    self._sub_buckets = sub_buckets
+    self._directions = cidr.DirectionCache(
+        cidr.parse_prefix_list(src_reverse))
+    self.histograms = {}
+    # (delta, src, traffic) -> buffered values of its group
+    self._cache = {}
+    # group key -> buffered values
+    self._pending = {}
+    self._num_pending = 0
+
+  def sample(self, record):
+    try:
+      values = self._cache[record.delta, record.src, record.other]
+    except KeyError:
+      values = self.group_values(record)
+    values.append(record.value)
+    self._num_pending += 1
+    if self._num_pending >= FLUSH_SAMPLES:
+      self.flush()
+
+  def group_values(self, record):
+    """Returns (and caches) the buffered values of a sample group."""
+    if len(self._cache) >= cidr.MAX_CACHED_ENDPOINTS:
+      self._cache.clear()
+    key = (record.delta, self._directions.direction(record.src),
+           record.other)
+    values = self._pending.setdefault(key, [])
+    self._cache[record.delta, record.src, record.other] = values
+    return values
+
+  def flush(self):
+    """Adds the buffered samples to their histograms."""
+    if not self._num_pending:
+      return
+    import numpy as np  # pylint: disable=g-import-not-at-top
+    for key, values in self._pending.iteritems():
+      if key not in self.histograms:
+        self.histograms[key] = LogLinearHistogram(self._sub_buckets)
+      self.histograms[key].add_values(np.round(values, SAMPLE_DECIMALS))
+      # the cache keeps referencing the (now empty) buffers
+      del values[:]
+    self._num_pending = 0
+
+  def write_summary(self, f):
+    """Writes the histograms (as JSON)."""
+    self.flush()
+    json.dump({
+        'version': SUMMARY_VERSION,
+        'sub_buckets': self._sub_buckets,
+        'src_reverse': self._src_reverse,
+        'histograms': [dict(histogram.to_json(), delta=delta, dir=direction,
+                            traffic=traffic)
+                       for (delta, direction, traffic), histogram in
+                       sorted(self.histograms.iteritems())],
+    }, f, separators=(',', ':'))
+
+
+def summary_path(path):
+  """Returns the histogram summary path of an analysis file."""
+  return path + SUMMARY_SUFFIX
+
+
+def read_summary(path):
+  """Reads the histogram summary of an analysis file (None if unavailable).
+
+  Args:
+    path: analysis file
+
+  Returns:
+    a dictionary with the 'src_reverse' used by the analysis, and the
+    'histograms' of every (delta, direction, traffic) group.
+  """
+  if not os.path.isfile(summary_path(path)):
+    return None
+  if os.path.getmtime(summary_path(path)) < os.path.getmtime(path):
+    # stale summary
+    return None
+  with open(summary_path(path)) as f:
+    summary = json.load(f)
+  if summary.get('version') != SUMMARY_VERSION:
+    return None
+  return {
+      'src_reverse': summary['src_reverse'],
+      'histograms': dict(
+          ((data['delta'], data['dir'], data['traffic']),
+           LogLinearHistogram.from_json(data, summary['sub_buckets']))
+          for data in summary['histograms']),
+  }
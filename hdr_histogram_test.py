@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for hdr_histogram.py."""
+
+import cStringIO
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import hdr_histogram
+import numpy as np
+from output_sink import DeltaSample
+from sample_stats import sorted_quantile
+
+
+class HdrHistogramTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def testQuantiles(self):
+    rng = np.random.RandomState(0)
+    values = rng.lognormal(-7, 1.5, 100000)
+    histogram = hdr_histogram.LogLinearHistogram()
+    for value in values:
+      histogram.add(value)
+    self.assertEqual(100000, histogram.count)
+    self.assertAlmostEqual(values.mean(), histogram.mean())
+    sorted_values = np.sort(values)
+    max_error = 1. / (2 * hdr_histogram.SUB_BUCKETS)
+    for q in (0.01, 0.25, 0.50, 0.75, 0.99):
+      expected = sorted_quantile(sorted_values, q)
+      self.assertLess(abs(histogram.quantile(q) - expected) / expected,
+                      max_error, q)
+    # the extremes are exact
+    self.assertEqual(values.min(), histogram.quantile(0.))
+    self.assertEqual(values.max(), histogram.quantile(1.))
+
+  def testAddValues(self):
+    values = [0.001, -0.002, 0., 3.5, 0.001, -1e-9, 0.]
+    histogram = hdr_histogram.LogLinearHistogram()
+    for value in values:
+      histogram.add(value)
+    batched = hdr_histogram.LogLinearHistogram()
+    batched.add_values(values[:3])
+    batched.add_values(values[3:])
+    self.assertEqual(histogram.to_json(), batched.to_json())
+    self.assertEqual(2, batched.zeros)
+    # every value is in its bucket
+    buckets = batched.buckets()
+    self.assertEqual([1, 1, 2, 2, 1], [count for _, _, count in buckets])
+    for value, (lo, hi, _) in zip([-0.002, -1e-9, 0., 0.001, 3.5], buckets):
+      self.assertTrue(lo <= value <= hi, value)
+
+  def testMerge(self):
+    values = [0.001, -0.002, 0., 3.5, 0.001, -1e-9, 0.]
+    histogram = hdr_histogram.LogLinearHistogram()
+    histogram.add_values(values)
+    merged = hdr_histogram.LogLinearHistogram()
+    for part in (values[:3], [], values[3:]):
+      other = hdr_histogram.LogLinearHistogram()
+      other.add_values(part)
+      merged.merge(other)
+    self.assertEqual(histogram.to_json(), merged.to_json())
+
+  def testJson(self):
+    histogram = hdr_histogram.LogLinearHistogram()
+    self.assertEqual(
+        histogram.to_json(),
+        hdr_histogram.LogLinearHistogram.from_json(
+            histogram.to_json()).to_json())
+    histogram.add_values([0.5, 0.25, 0., -4.])
+    copy = hdr_histogram.LogLinearHistogram.from_json(histogram.to_json())
+    self.assertEqual(histogram.buckets(), copy.buckets())
+    self.assertEqual((4, -4., 0.5), (copy.count, copy.min, copy.max))
+
+  def testTruncated(self):
+    histogram = hdr_histogram.LogLinearHistogram()
+    histogram.add_values([0.001] * 3 + [0.0015] + [0.1] * 2)
+    truncated = histogram.truncated(0.002)
+    self.assertEqual(4, truncated.count)
+    self.assertEqual(0.001, truncated.min)
+    self.assertAlmostEqual(0.0015, truncated.max, delta=0.0015 / 128)
+    self.assertAlmostEqual(0.0045 / 4, truncated.mean(),
+                           delta=0.0045 / 4 / 128)
+    self.assertEqual(0, histogram.truncated(0.0001).count)
+    # nothing to cut
+    self.assertEqual(histogram.to_json(),
+                     histogram.truncated(1.).to_json())
+
+  def testLinearHistogram(self):
+    histogram = hdr_histogram.LogLinearHistogram()
+    histogram.add_values([0.001] * 3 + [0.002])
+    counts, bins = histogram.linear_histogram(10)
+    self.assertEqual([3, 0, 0, 0, 0, 0, 0, 0, 0, 1], list(counts))
+    self.assertEqual((0.001, 0.002), (bins[0], bins[-1]))
+    # a single value (as numpy does)
+    histogram = hdr_histogram.LogLinearHistogram()
+    histogram.add(0.001)
+    counts, _ = histogram.linear_histogram(10)
+    self.assertEqual(1, counts.sum())
+
+  def testSummary(self):
+    sink = hdr_histogram.HistogramSink('10/8')
+    for i in range(1000):
+      sink.sample(DeltaSample('delta1', 0., '10.0.0.1:80', '1.1.1.1:1',
+                              0.001 * (i + 1), '-'))
+      sink.sample(DeltaSample('delta4', 0., '1.1.1.1:1', '10.0.0.1:80',
+                              0.0001, 'ack' if i % 4 else 'data'))
+    path = os.path.join(self._tmpdir, 'analysis.txt')
+    with open(path, 'w') as f:
+      f.write('')
+    # no summary
+    self.assertIsNone(hdr_histogram.read_summary(path))
+    with open(hdr_histogram.summary_path(path), 'w') as f:
+      sink.write_summary(f)
+    summary = hdr_histogram.read_summary(path)
+    self.assertEqual('10/8', summary['src_reverse'])
+    histograms = summary['histograms']
+    self.assertEqual([('delta1', 'rev', '-'), ('delta4', 'fwd', 'ack'),
+                      ('delta4', 'fwd', 'data')], sorted(histograms))
+    self.assertEqual(1000, histograms['delta1', 'rev', '-'].count)
+    self.assertAlmostEqual(0.5005, histograms['delta1', 'rev', '-'].mean())
+    self.assertEqual(750, histograms['delta4', 'fwd', 'ack'].count)
+    # stale summary
+    later = time.time() + 10
+    os.utime(path, (later, later))
+    self.assertIsNone(hdr_histogram.read_summary(path))
+
+  def testSummaryEmpty(self):
+    f = cStringIO.StringIO()
+    hdr_histogram.HistogramSink().write_summary(f)
+    self.assertIn('"histograms":[]', f.getvalue())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,240 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Prometheus metrics exporter.
+
+`rttcp.py export` analyzes a (possibly never-ending) capture, and serves
+the delta1/delta2 distributions and the traffic counters of each
+direction at http://localhost:<port>/metrics, in the Prometheus text
+exposition format.
+
+Histograms use fixed buckets, and connections idle for longer than
+--idle-timeout are expired (their counters are already in the totals),
+so memory does not grow with the trace. The analysis loop updates the
+metrics without locks: it is the only writer, every update is a single
+item assignment on a pre-allocated container, and the HTTP thread
+renders from copies. A scrape may thus see a histogram sum slightly
+ahead of its buckets, but never a torn bucket.
+"""
+
+
+import BaseHTTPServer
+import bisect
+import signal
+import sys
+import threading
+import time
+
+import cidr
+from common import __version__
+from common import CONN_IDLE_TIMEOUT_SECS
+from common import MAX_CONN_SEGMENTS
+from common import MAX_TRACE_SEGMENTS
+from common import METRICS_PORT
+from common import SEGMENT_HORIZON_SECS
+from output_sink import OutputSink
+from packet_dumper import PacketDumper
+from trace_info import TraceInfo
+
+
+METRICS_PREFIX = 'rttcp'
+METRIC_DELTAS = ['delta1', 'delta2']
+DIRECTIONS = ['fwd', 'rev']
+# delta histogram bucket upper bounds (sec)
+DELTA_BUCKETS = [.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05,
+                 .1, .25, .5, 1., 2.5, 5., 10.]
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+class Histogram(object):
+  """A fixed-bucket histogram (Prometheus semantics: le buckets)."""
+
+  def __init__(self, buckets):
+    self._buckets = list(buckets)
+    # one count per bucket, plus the +Inf one
+    self._counts = [0] * (len(self._buckets) + 1)
+    self._sum = 0.
+
+  def observe(self, value):
+    self._counts[bisect.bisect_left(self._buckets, value)] += 1
+    self._sum += value
+
+  def snapshot(self):
+    """Returns (cumulative bucket counts, sum)."""
+    counts = list(self._counts)
+    cumulative = []
+    total = 0
+    for count in counts:
+      total += count
+      cumulative.append(total)
+    return cumulative, self._sum
+
+
+def format_labels(labels):
+  return '{%s}' % ','.join('%s="%s"' % label for label in labels)
+
+
+class MetricsSink(OutputSink):
+  """A sink that keeps the delta histograms and traffic counters."""
+
+  wants_traffic = True
+
+  def __init__(self, src_reverse=None, buckets=DELTA_BUCKETS):
+    self._buckets = list(buckets)
+    self._directions = cidr.DirectionCache(
+        cidr.parse_prefix_list(src_reverse))
+    # all the series are created upfront (the analysis loop only updates)
+    self._histograms = dict(((delta, direction), Histogram(self._buckets))
+                            for delta in METRIC_DELTAS
+                            for direction in DIRECTIONS)
+    self._counters = dict((name, dict((direction, 0)
+                                      for direction in DIRECTIONS))
+                          for name in ('packets', 'ip_bytes',
+                                       'goodput_bytes'))
+    self._evicted = dict((delta, 0) for delta in METRIC_DELTAS)
+    self._last_timestamp = 0.
+
+  def sample(self, record):
+    if record.delta in METRIC_DELTAS:
+      direction = self._directions.direction(record.src)
+      self._histograms[(record.delta, direction)].observe(record.value)
+
+  def evicted(self, record):
+    self._evicted[record.delta] += record.count
+
+  def traffic(self, record):
+    direction = self._directions.direction(record.src)
+    self._counters['packets'][direction] += 1
+    self._counters['ip_bytes'][direction] += record.ip_bytes
+    self._counters['goodput_bytes'][direction] += record.goodput_bytes
+    self._last_timestamp = record.timestamp
+
+  def render(self):
+    """Returns the metrics in the Prometheus text exposition format."""
+    name = '%s_delta_seconds' % METRICS_PREFIX
+    bounds = ['%g' % bound for bound in self._buckets] + ['+Inf']
+    lines = [
+        '# HELP %s Time between a segment and its ACK (delta1) or its '
+        'TSecr (delta2).' % name,
+        '# TYPE %s histogram' % name,
+    ]
+    for delta in METRIC_DELTAS:
+      for direction in DIRECTIONS:
+        labels = [('delta', delta), ('direction', direction)]
+        cumulative, total = self._histograms[(delta, direction)].snapshot()
+        for bound, count in zip(bounds, cumulative):
+          lines.append('%s_bucket%s %i' % (
+              name, format_labels(labels + [('le', bound)]), count))
+        lines.append('%s_sum%s %r' % (name, format_labels(labels), total))
+        lines.append('%s_count%s %i' % (name, format_labels(labels),
+                                        cumulative[-1]))
+    for counter, description in (
+        ('packets', 'Packets seen.'),
+        ('ip_bytes', 'IP bytes seen.'),
+        ('goodput_bytes', 'New (not retransmitted) TCP payload bytes.')):
+      name = '%s_%s_total' % (METRICS_PREFIX, counter)
+      lines += ['# HELP %s %s' % (name, description),
+                '# TYPE %s counter' % name]
+      for direction in DIRECTIONS:
+        lines.append('%s%s %i' % (name, format_labels(
+            [('direction', direction)]), self._counters[counter][direction]))
+    name = '%s_evicted_segments_total' % METRICS_PREFIX
+    lines += ['# HELP %s In-flight segments dropped before being matched.' %
+              name, '# TYPE %s counter' % name]
+    for delta in METRIC_DELTAS:
+      lines.append('%s%s %i' % (name, format_labels([('delta', delta)]),
+                                self._evicted[delta]))
+    name = '%s_last_packet_timestamp_seconds' % METRICS_PREFIX
+    lines += ['# HELP %s Capture time of the last packet.' % name,
+              '# TYPE %s gauge' % name,
+              '%s %r' % (name, self._last_timestamp)]
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Serves the metrics of the server sink."""
+
+  server_version = 'rttcp/%s' % __version__
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    if self.path.split('?')[0] != '/metrics':
+      self.send_error(404)
+      return
+    body = self.server.sink.render()
+    self.send_response(200)
+    self.send_header('Content-Type', CONTENT_TYPE)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, fmt, *args):
+    if self.server.debug > 0:
+      BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, fmt, *args)
+
+
+class MetricsExporter(object):
+  """Analyzes a capture, and serves its metrics."""
+
+  def __init__(self, tshark_bin, infile, port=METRICS_PORT,
+               src_reverse=None, debug=0,
+               max_segments=MAX_TRACE_SEGMENTS,
+               max_conn_segments=MAX_CONN_SEGMENTS,
+               segment_horizon=SEGMENT_HORIZON_SECS,
+               idle_timeout=CONN_IDLE_TIMEOUT_SECS):
+    self._packet_dumper = PacketDumper(tshark_bin, infile, None, 'packet',
+                                       debug)
+    self._port = port
+    self._debug = debug
+    self._max_segments = max_segments
+    self._max_conn_segments = max_conn_segments
+    self._segment_horizon = segment_horizon
+    self._idle_timeout = idle_timeout
+    self.sink = MetricsSink(src_reverse)
+
+  def start_server(self):
+    """Starts serving the metrics (in a daemon thread)."""
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', self._port),
+                                       MetricsHandler)
+    server.sink = self.sink
+    server.debug = self._debug
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+  def run(self):
+    # stop on SIGTERM as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    server = self.start_server()
+    sys.stderr.write('serving metrics on http://%s:%i/metrics\n' %
+                     server.server_address)
+    trace_info = TraceInfo(self.sink, 'packet', self._debug,
+                           self._max_segments, self._max_conn_segments,
+                           self._segment_horizon,
+                           idle_timeout=self._idle_timeout)
+    try:
+      for packet in self._packet_dumper.packets():
+        trace_info.process_packet(packet)
+      trace_info.finish()
+      # keep the final values available until interrupted
+      sys.stderr.write('end of capture: still serving metrics\n')
+      while True:
+        time.sleep(3600)
+    except KeyboardInterrupt:
+      pass
+    finally:
+      server.shutdown()
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for metrics_exporter.py."""
+
+import unittest
+
+import metrics_exporter
+from output_sink import DeltaSample
+from output_sink import RecordSink
+from output_sink import TeeSink
+from output_sink import TrafficRecord
+from packet_info import PacketInfo
+from trace_info import TraceInfo
+
+
+class MetricsExporterTest(unittest.TestCase):
+
+  def getMetrics(self, sink):
+    metrics = {}
+    for line in sink.render().splitlines():
+      if not line.startswith('#'):
+        name, value = line.rsplit(' ', 1)
+        metrics[name] = float(value)
+    return metrics
+
+  def testHistogram(self):
+    histogram = metrics_exporter.Histogram([1., 2., 5.])
+    for value in (.5, 1., 1.5, 3., 10.):
+      histogram.observe(value)
+    cumulative, total = histogram.snapshot()
+    # buckets are "less than or equal", and cumulative
+    self.assertEqual([2, 3, 4, 5], cumulative)
+    self.assertEqual(16., total)
+
+  def testSink(self):
+    sink = metrics_exporter.MetricsSink(src_reverse='10.0.0.0/8')
+    for value in (.001, .002, .5):
+      sink.sample(DeltaSample('delta1', 1000., '10.0.0.1:80',
+                              '192.168.1.1:40000', value, '-'))
+    # other deltas are not exported
+    sink.sample(DeltaSample('delta3', 1000., '192.168.1.1:40000',
+                            '10.0.0.1:80', .1, '-'))
+    sink.traffic(TrafficRecord(1000., '10.0.0.1:80', '192.168.1.1:40000',
+                               1500, 1448))
+    sink.traffic(TrafficRecord(1001., '192.168.1.1:40000', '10.0.0.1:80',
+                               52, 0))
+    metrics = self.getMetrics(sink)
+    labels = 'delta="delta1",direction="rev"'
+    self.assertEqual(3, metrics['rttcp_delta_seconds_count{%s}' % labels])
+    self.assertEqual(2, metrics['rttcp_delta_seconds_bucket{%s,le="0.0025"}'
+                                % labels])
+    self.assertEqual(3, metrics['rttcp_delta_seconds_bucket{%s,le="+Inf"}'
+                                % labels])
+    self.assertEqual(0, metrics['rttcp_delta_seconds_count{delta="delta1",'
+                                'direction="fwd"}'])
+    self.assertEqual(1448, metrics['rttcp_goodput_bytes_total'
+                                   '{direction="rev"}'])
+    self.assertEqual(52, metrics['rttcp_ip_bytes_total{direction="fwd"}'])
+    self.assertEqual(1001., metrics['rttcp_last_packet_timestamp_seconds'])
+
+  def testWantsTraffic(self):
+    # only the sinks that use them get the per-packet traffic records
+    self.assertFalse(RecordSink().wants_traffic)
+    self.assertFalse(TeeSink([RecordSink()]).wants_traffic)
+    self.assertTrue(TeeSink([RecordSink(),
+                             metrics_exporter.MetricsSink()]).wants_traffic)
+
+  def testIdleConnections(self):
+    def packet(timestamp, client, seq):
+      # an (unacked) data segment from the server
+      return PacketInfo(timestamp, 6, '10.0.0.1', '192.168.1.%i' % client,
+                        1500, '80', '40000', seq, 1448, seq + 1448, 1, 0,
+                        None, None)
+    sink = metrics_exporter.MetricsSink(src_reverse='10.0.0.0/8')
+    records = RecordSink()
+    trace_info = TraceInfo(TeeSink([sink, records]), 'packet',
+                           idle_timeout=10.)
+    trace_info.process_packet(packet(0., 1, 1000))
+    for i in range(30):
+      trace_info.process_packet(packet(1. + i, 2, 1000 + 1448 * i))
+    # the first connection was expired (and its segment evicted)
+    self.assertEqual(1, trace_info.connections())
+    self.assertEqual(30, trace_info.outstanding_segments())
+    metrics = self.getMetrics(sink)
+    self.assertEqual(31, metrics['rttcp_packets_total{direction="rev"}'])
+    self.assertEqual(1, metrics['rttcp_evicted_segments_total'
+                                '{delta="delta1"}'])
+    # the heavy connections may include expired ones
+    trace_info.finish()
+    top = [record for record in records.take()['top']
+           if record.metric == 'packets']
+    self.assertEqual([('10.0.0.1:80', '192.168.1.2:40000', 30),
+                      ('10.0.0.1:80', '192.168.1.1:40000', 1)],
+                     [(record.src, record.dst, record.count)
+                      for record in top])
+
+if __name__ == '__main__':
+  unittest.main()
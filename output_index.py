@@ -0,0 +1,191 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Sidecar block index for packet-mode analysis files.
+
+The analysis file is split in (line-aligned) blocks of about
+INDEX_BLOCK_BYTES bytes. The index (a JSON file next to the analysis file)
+stores the offset, length, and time range of each block, and the list of
+blocks containing each connection and each delta type, so that readers
+only need to read the blocks that match a query.
+
+Connections are identified by their sorted endpoints ("src dst"), as the
+packet lines carry no protocol.
+"""
+
+
+import json
+import os.path
+
+
+INDEX_SUFFIX = '.idx'
+INDEX_BLOCK_BYTES = 1 << 16
+INDEX_VERSION = 1
+
+
+def index_path(path):
+  """Returns the sidecar index path of an analysis file."""
+  return path + INDEX_SUFFIX
+
+
+def connection_key(src, dst):
+  """Returns the (direction-independent) key of a connection."""
+  return '%s %s' % ((src, dst) if src <= dst else (dst, src))
+
+
+def connhash_key(connhash):
+  """Returns the connection key of a connhash ("src-dst-proto")."""
+  endpoints = connhash.rsplit('-', 1)[0].split('-')
+  assert len(endpoints) == 2, 'invalid connhash: %s' % connhash
+  return connection_key(*endpoints)
+
+
+class IndexedWriter(object):
+  """A file wrapper that indexes the packet-mode lines written through it.
+
+  Every write() must contain a single, full line.
+  """
+
+  def __init__(self, f, block_bytes=INDEX_BLOCK_BYTES):
+    self._f = f
+    self._block_bytes = block_bytes
+    self._offset = 0
+    self._blocks = []
+    self._connections = {}
+    self._by_connection = {}
+    self._by_delta = {}
+    self.start_block()
+
+  def start_block(self):
+    self._block_offset = self._offset
+    self._block_ts = None
+    self._block_connections = set()
+    self._block_deltas = set()
+
+  def write(self, line):
+    self._f.write(line)
+    self._offset += len(line)
+    if not line.startswith('#'):
+      delta, timestamp, src, dst, _ = line.split(' ', 4)
+      timestamp = float(timestamp)
+      if self._block_ts is None:
+        self._block_ts = [timestamp, timestamp]
+      elif timestamp < self._block_ts[0]:
+        self._block_ts[0] = timestamp
+      elif timestamp > self._block_ts[1]:
+        self._block_ts[1] = timestamp
+      key = connection_key(src, dst)
+      if key not in self._connections:
+        self._connections[key] = len(self._connections)
+      self._block_connections.add(self._connections[key])
+      self._block_deltas.add(delta)
+    if self._offset - self._block_offset >= self._block_bytes:
+      self.end_block()
+
+  def end_block(self):
+    """Closes the current block (blocks without samples are not indexed)."""
+    if self._block_ts is not None:
+      block = len(self._blocks)
+      self._blocks.append([self._block_offset,
+                           self._offset - self._block_offset] +
+                          self._block_ts)
+      for conn in self._block_connections:
+        self._by_connection.setdefault(conn, []).append(block)
+      for delta in self._block_deltas:
+        self._by_delta.setdefault(delta, []).append(block)
+    self.start_block()
+
+  def write_index(self, f):
+    """Writes the index of all the lines written so far."""
+    self.end_block()
+    t_min = min(block[2] for block in self._blocks) if self._blocks else None
+    json.dump({
+        'version': INDEX_VERSION,
+        't_min': t_min,
+        'blocks': self._blocks,
+        'connections': dict((key, self._by_connection[conn])
+                            for key, conn in self._connections.iteritems()),
+        'deltas': self._by_delta,
+    }, f, separators=(',', ':'))
+
+
+def read_index(path):
+  """Reads the sidecar index of an analysis file (None if unavailable)."""
+  if not os.path.isfile(index_path(path)):
+    return None
+  if os.path.getmtime(index_path(path)) < os.path.getmtime(path):
+    # stale index
+    return None
+  with open(index_path(path)) as f:
+    index = json.load(f)
+  if index.get('version') != INDEX_VERSION:
+    return None
+  return index
+
+
+def select_blocks(index, time_range=(None, None), connection=None,
+                  delta=None):
+  """Returns the (sorted) blocks that may contain samples matching a query.
+
+  Args:
+    index: sidecar index
+    time_range: (start, end) pair, in seconds since the start of the
+        trace (None for open sides)
+    connection: connection key (see connection_key()), or None
+    delta: delta type, or None
+
+  Returns:
+    a list of block numbers.
+  """
+  blocks = set(range(len(index['blocks'])))
+  if connection is not None:
+    blocks.intersection_update(index['connections'].get(connection, []))
+  if delta is not None:
+    blocks.intersection_update(index['deltas'].get(delta, []))
+  start, end = time_range
+  selected = []
+  for block in sorted(blocks):
+    _, _, ts_min, ts_max = index['blocks'][block]
+    if start is not None and ts_max < index['t_min'] + start:
+      continue
+    if end is not None and ts_min >= index['t_min'] + end:
+      continue
+    selected.append(block)
+  return selected
+
+
+def read_blocks(f, index, blocks):
+  """Reads the given blocks of an analysis file.
+
+  Args:
+    f: analysis file object
+    index: sidecar index
+    blocks: sorted list of block numbers
+
+  Returns:
+    a string with the contents of the blocks (consecutive blocks are read
+    without seeking).
+  """
+  chunks = []
+  end = None
+  for block in blocks:
+    offset, length, _, _ = index['blocks'][block]
+    if offset != end:
+      f.seek(offset)
+    chunks.append(f.read(length))
+    end = offset + length
+  return ''.join(chunks)
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for output_index.py."""
+
+import cStringIO
+import json
+import unittest
+
+import output_index
+
+
+class OutputIndexTest(unittest.TestCase):
+
+  def getIndexedOutput(self):
+    out = cStringIO.StringIO()
+    # tiny blocks: a new block every 2 lines
+    writer = output_index.IndexedWriter(out, block_bytes=50)
+    writer.write('#type src dst timestamp delta other\n')
+    for i in range(10):
+      src, dst = (('1.1.1.1:80', '2.2.2.2:99') if i % 2 else
+                  ('3.3.3.3:80', '4.4.4.4:99'))
+      delta = 'delta1' if i < 6 else 'delta4'
+      writer.write('%s %f %s %s %f -\n' % (delta, 100. + i, dst, src, .1))
+    index_file = cStringIO.StringIO()
+    writer.write_index(index_file)
+    return out, json.loads(index_file.getvalue())
+
+  def testConnectionKey(self):
+    self.assertEqual('1.1.1.1:80 2.2.2.2:99',
+                     output_index.connection_key('2.2.2.2:99', '1.1.1.1:80'))
+    self.assertEqual('1.1.1.1:80 2.2.2.2:99',
+                     output_index.connhash_key('1.1.1.1:80-2.2.2.2:99-6'))
+    self.assertEqual('::1:80 ::2:99',
+                     output_index.connhash_key('::1:80-::2:99-6'))
+
+  def testIndex(self):
+    out, index = self.getIndexedOutput()
+    self.assertEqual(100., index['t_min'])
+    # blocks cover the whole output, in order
+    blocks = index['blocks']
+    data = out.getvalue()
+    self.assertEqual(0, blocks[0][0])
+    for block, next_block in zip(blocks, blocks[1:]):
+      self.assertEqual(block[0] + block[1], next_block[0])
+    self.assertEqual(len(data), blocks[-1][0] + blocks[-1][1])
+    self.assertEqual(set(['delta1', 'delta4']), set(index['deltas']))
+
+  def testSelectAndRead(self):
+    out, index = self.getIndexedOutput()
+    blocks = output_index.select_blocks(
+        index, (2., 6.), output_index.connection_key('2.2.2.2:99',
+                                                     '1.1.1.1:80'),
+        'delta1')
+    self.assertTrue(blocks)
+    lines = output_index.read_blocks(out, index, blocks).splitlines()
+    # the selected blocks contain all the matching lines
+    timestamps = [float(line.split()[1]) for line in lines
+                  if '1.1.1.1:80' in line and line.startswith('delta1')]
+    self.assertTrue(set([103., 105.]).issubset(timestamps))
+    # and no block without matching lines
+    self.assertEqual([], output_index.select_blocks(index, (20., None)))
+    self.assertEqual([], output_index.select_blocks(index, delta='delta3'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,175 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Output sinks for the analysis results.
+
+TraceInfo and ConnectionInfo report their results (delta samples, flow
+summaries, etc.) to a sink. TextSink writes the analysis file format,
+RecordSink keeps them as records for the library API, and TeeSink passes
+them to several sinks.
+"""
+
+
+import collections
+
+from common import TOP_LINE_PREFIX
+
+
+# delta sample (packet mode). `other` is the traffic type for delta4
+DeltaSample = collections.namedtuple('DeltaSample', [
+    'delta', 'timestamp', 'src', 'dst', 'value', 'other'])
+
+# in-flight segments evicted from a connection (packet mode)
+EvictedRecord = collections.namedtuple('EvictedRecord', [
+    'timestamp', 'src', 'dst', 'count', 'delta'])
+
+# per-packet traffic accounting (goodput is the new sequence space
+# covered by the packet). Not written to analysis files
+TrafficRecord = collections.namedtuple('TrafficRecord', [
+    'timestamp', 'src', 'dst', 'ip_bytes', 'goodput_bytes'])
+
+# connection summary (flow mode), in analysis file order
+FlowRecord = collections.namedtuple('FlowRecord', [
+    'connhash', 'first_ts', 'last_ts', 'ip_proto', 'tcp_seq_syn_src',
+    'tcp_seq_syn_dst', 'ip_total_pkt', 'ip_total_bytes', 'pps',
+    'ip_bitrate', 'tcp_bytes', 'tcp_goodput_bytes', 'tcp_goodput_bitrate',
+    'delta1_small_mean', 'delta1_small_median', 'delta1_large_mean',
+    'delta1_large_median', 'delta1_evicted', 'delta2_evicted',
+    'tcp_retrans_bytes', 'tcp_spurious_retrans', 'tcp_out_of_order',
+    'tcp_holes', 'label'])
+
+# heavy connection (see TraceInfo.print_top_connections())
+TopRecord = collections.namedtuple('TopRecord', [
+    'metric', 'rank', 'connhash', 'src', 'dst', 'count', 'error'])
+
+# the methods a sink receives its results through
+SINK_METHODS = ['comment', 'sample', 'evicted', 'flow', 'top', 'traffic']
+
+
+class OutputSink(object):
+  """Base sink (discards everything).
+
+  Traffic records are only produced for sinks that set wants_traffic, as
+  they cost a record per packet.
+  """
+
+  wants_traffic = False
+
+  def comment(self, line):
+    pass
+
+  def sample(self, record):
+    pass
+
+  def evicted(self, record):
+    pass
+
+  def flow(self, record):
+    pass
+
+  def top(self, record):
+    pass
+
+  def traffic(self, record):
+    pass
+
+
+class TextSink(OutputSink):
+  """A sink that writes the analysis file format into a file object."""
+
+  def __init__(self, f):
+    self._f = f
+
+  def comment(self, line):
+    self._f.write(line + '\n')
+
+  def sample(self, record):
+    self._f.write('%s %f %s %s %f %s\n' % record)
+
+  def evicted(self, record):
+    self._f.write('evicted %f %s %s %i %s\n' % record)
+
+  def flow(self, record):
+    self._f.write('%s %f %f %s %s %s %i %i %f %f %i %i %f %f %f %f %f '
+                  '%i %i %i %i %i %i %s\n' % record)
+
+  def top(self, record):
+    self._f.write('%s%s %i %s %s %s %i %i\n' % ((TOP_LINE_PREFIX,) + record))
+
+
+class TeeSink(OutputSink):
+  """A sink that passes the results to several sinks.
+
+  Each method is bound to the sinks that do not discard its results, so
+  passing a result to a single sink costs no more than calling it directly.
+  """
+
+  def __init__(self, sinks):
+    self.wants_traffic = any(sink.wants_traffic for sink in sinks)
+    for name in SINK_METHODS:
+      methods = [getattr(sink, name) for sink in sinks
+                 if getattr(type(sink), name).im_func is not
+                 getattr(OutputSink, name).im_func]
+      if len(methods) == 1:
+        setattr(self, name, methods[0])
+      elif methods:
+        setattr(self, name, self.fan_out(methods))
+
+  @staticmethod
+  def fan_out(methods):
+    def call_all(result):
+      for method in methods:
+        method(result)
+    return call_all
+
+
+class RecordSink(OutputSink):
+  """A sink that keeps the records, until they are taken."""
+
+  RECORD_TYPES = ['samples', 'evicted', 'flows', 'top']
+
+  def __init__(self, deltas=None):
+    self._deltas = set(deltas) if deltas is not None else None
+    self._records = dict((name, []) for name in self.RECORD_TYPES)
+    self._count = 0
+
+  def __len__(self):
+    return self._count
+
+  def add(self, name, record):
+    self._records[name].append(record)
+    self._count += 1
+
+  def sample(self, record):
+    if self._deltas is None or record.delta in self._deltas:
+      self.add('samples', record)
+
+  def evicted(self, record):
+    self.add('evicted', record)
+
+  def flow(self, record):
+    self.add('flows', record)
+
+  def top(self, record):
+    self.add('top', record)
+
+  def take(self):
+    """Returns (and forgets) all the records, as a dictionary of lists."""
+    records = self._records
+    self._records = dict((name, []) for name in self.RECORD_TYPES)
+    self._count = 0
+    return records
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Duplicate packet elimination (for multi-tap captures).
+
+A packet seen on two interfaces (or mirrored twice by a SPAN port) would
+be analyzed as a retransmission. Packets are identified by their 5-tuple,
+TCP seq and ack, IP id, IP length, and TCP tsval, and a packet identical
+to one seen less than a window ago is dropped.
+
+The seen packets are kept in time buckets of a window each. Only the
+current and the previous buckets are needed, so memory is bounded by
+(2 x window x packet rate).
+"""
+
+
+class DuplicateFilter(object):
+  """Detects the packets identical to a recent one."""
+
+  def __init__(self, window):
+    """Creates a duplicate filter.
+
+    Args:
+      window: max time between a packet and its duplicates (sec)
+    """
+    assert window > 0
+    self._window = window
+    self._bucket = float('-inf')
+    # packet key -> timestamp, for the current and the previous buckets
+    self._current = {}
+    self._previous = {}
+    self.duplicates = 0
+
+  @staticmethod
+  def packet_key(packet):
+    return (packet.ip_proto, packet.ip_src, packet.ip_dst, packet.sport,
+            packet.dport, packet.tcp_seq, packet.tcp_ack, packet.ip_id,
+            packet.ip_len, packet.tcp_tsval)
+
+  def is_duplicate(self, packet):
+    """Returns whether a packet duplicates a recent one (and records it)."""
+    bucket = int(packet.timestamp // self._window)
+    if bucket > self._bucket:
+      # time moved on: forget the packets older than the previous bucket
+      self._previous = self._current if bucket == self._bucket + 1 else {}
+      self._current = {}
+      self._bucket = bucket
+    key = self.packet_key(packet)
+    timestamp = self._current.get(key)
+    if timestamp is None:
+      timestamp = self._previous.get(key)
+    if (timestamp is not None and
+        abs(packet.timestamp - timestamp) <= self._window):
+      self.duplicates += 1
+      return True
+    self._current[key] = packet.timestamp
+    return False
+
+  def filter(self, packets):
+    """Yields the packets that do not duplicate a recent one."""
+    is_duplicate = self.is_duplicate
+    for packet in packets:
+      if not is_duplicate(packet):
+        yield packet
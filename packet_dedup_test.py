@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for packet_dedup.py."""
+
+import cStringIO
+import unittest
+
+from packet_dedup import DuplicateFilter
+from packet_dumper import PacketDumper
+from packet_info import PacketInfo
+import synthetic_trace
+from trace_info import TraceInfo
+
+
+def make_packet(timestamp, tcp_seq=1000, ip_id=1):
+  return PacketInfo(timestamp, 6, '1.1.1.1', '2.2.2.2', 1100, '80', '4000',
+                    tcp_seq, 1048, tcp_seq + 1048, 5000, 0, None, None, ip_id)
+
+
+class DuplicateFilterTest(unittest.TestCase):
+
+  def testDuplicates(self):
+    dedup = DuplicateFilter(0.01)
+    self.assertFalse(dedup.is_duplicate(make_packet(1.)))
+    # a copy (from another tap)
+    self.assertTrue(dedup.is_duplicate(make_packet(1.0001)))
+    # a different packet (ip id), and a retransmission (much later)
+    self.assertFalse(dedup.is_duplicate(make_packet(1.0002, ip_id=2)))
+    self.assertFalse(dedup.is_duplicate(make_packet(1.2)))
+    # copies across a bucket boundary
+    self.assertFalse(dedup.is_duplicate(make_packet(1.2999, tcp_seq=1)))
+    self.assertTrue(dedup.is_duplicate(make_packet(1.3001, tcp_seq=1)))
+    # copies out of order
+    self.assertTrue(dedup.is_duplicate(make_packet(1.2998, tcp_seq=1)))
+    self.assertEqual(3, dedup.duplicates)
+
+  def testBoundedMemory(self):
+    dedup = DuplicateFilter(0.01)
+    for i in range(10000):
+      dedup.is_duplicate(make_packet(i * 0.001, tcp_seq=i))
+    # only the last 2 buckets (of ~10 packets each) are kept
+    self.assertLessEqual(len(dedup._current) + len(dedup._previous), 20)
+
+  def testAnalysis(self):
+    config = synthetic_trace.TraceConfig(packets=1000, flows=4)
+    fields = cStringIO.StringIO()
+    synthetic_trace.write_trace(config, fields_file=fields)
+    packet_dumper = PacketDumper(None, None, None, 'packet', 0)
+    packets = [packet_dumper.parse_line(line)
+               for line in fields.getvalue().splitlines(True)]
+    # every packet captured twice
+    doubled = [packet for packet in packets for _ in range(2)]
+    outputs = []
+    for trace, dedup_window in ((packets, None), (doubled, None),
+                                (doubled, 0.001)):
+      f = cStringIO.StringIO()
+      trace_info = TraceInfo(f, 'packet')
+      if dedup_window is not None:
+        trace = DuplicateFilter(dedup_window).filter(trace)
+      for packet in trace:
+        trace_info.process_packet(packet)
+      trace_info.finish()
+      outputs.append(f.getvalue())
+    # the copies are analyzed as retransmissions (losing delta1 samples)
+    self.assertLess(outputs[1].count('delta1'), outputs[0].count('delta1'))
+    self.assertEqual(outputs[0], outputs[2])
+
+
+if __name__ == '__main__':
+  unittest.main()
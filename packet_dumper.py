@@ -20,23 +20,75 @@
 
 import subprocess
 import sys
+import threading
 
+from common import MAX_CONN_SEGMENTS
+from common import MAX_TRACE_SEGMENTS
+from common import REORDER_MAX_PACKETS
+from common import REORDER_WINDOW_SECS
+from common import SEGMENT_HORIZON_SECS
+import output_index
+from output_sink import TeeSink
+from output_sink import TextSink
+from packet_dedup import DuplicateFilter
+import packet_merger
+import pcap_index
 from packet_info import PacketInfo
 from trace_info import TraceInfo
 
 
+# tshark fields per line (see create_command())
+NUM_FIELDS = 15
+
+
 class PacketDumper(object):
   """A class used to cherry-pick data from a packet trace (tshark)."""
 
-  def __init__(self, tshark_bin, infile, outfile, analysis_type, debug):
+  def __init__(self, tshark_bin, infile, outfile, analysis_type, debug,
+               max_segments=MAX_TRACE_SEGMENTS,
+               max_conn_segments=MAX_CONN_SEGMENTS,
+               segment_horizon=SEGMENT_HORIZON_SECS,
+               start=None, duration=None, profiler=None, src_reverse=None,
+               reorder_window=REORDER_WINDOW_SECS,
+               reorder_max_packets=REORDER_MAX_PACKETS, dedup_window=None,
+               prefix_labels=None):
     self._tshark_bin = tshark_bin
-    self._infile = infile
+    # several captures are merged by timestamp (see packet_merger.py)
+    self._infiles = infile if isinstance(infile, list) else [infile]
+    self._infile = self._infiles[0]
     self._outfile = outfile
     self._analysis_type = analysis_type
     self._debug = debug
+    self._max_segments = max_segments
+    self._max_conn_segments = max_conn_segments
+    self._segment_horizon = segment_horizon
+    # time window (seconds since the first packet)
+    assert duration is None or duration > 0
+    assert ((start is None and duration is None) or
+            infile != sys.stdin), 'time windows need a seekable capture'
+    assert ((start is None and duration is None) or
+            len(self._infiles) == 1), 'time windows need a single capture'
+    self._start = start
+    self._duration = duration
+    self._profiler = profiler
+    # direction convention of the histogram summary (see hdr_histogram.py)
+    self._src_reverse = src_reverse
+    self._reorder_window = reorder_window
+    self._reorder_max_packets = reorder_max_packets
+    self._late_packets = 0
+    # duplicate packet elimination (see packet_dedup.py)
+    self._dedup = (DuplicateFilter(dedup_window) if dedup_window is not None
+                   else None)
+    # subnet labels (a prefix label file, see cidr.read_prefix_labels())
+    self._prefix_labels = None
+    if prefix_labels is not None:
+      import cidr  # pylint: disable=g-import-not-at-top
+      self._prefix_labels = cidr.read_prefix_labels(prefix_labels)
+    if self._profiler is not None:
+      self._profiler.instrument(self, {'parse_line': 'parse'})
 
-  def create_command(self):
-    """Create the right tshark command."""
+  def create_command(self, infile=None):
+    """Create the right tshark command (for infile, or the first capture)."""
     tshark_opts = ['-n', '-T', 'fields', '-E', 'separator=;']
     # required to get absolute (raw) tcp seq numbers
     tshark_opts += ['-o', 'tcp.relative_sequence_numbers: false']
@@ -54,15 +106,37 @@ class PacketDumper(object):
     tshark_opts += ['-e', 'tcp.flags.syn']
     tshark_opts += ['-e', 'tcp.options.timestamp.tsval']
     tshark_opts += ['-e', 'tcp.options.timestamp.tsecr']
-    command = [self._tshark_bin] + tshark_opts + ['-r', self._infile]
+    # last, so older field dumps (without it) can still be parsed
+    tshark_opts += ['-e', 'ip.id']
+    if infile is None:
+      infile = self._infile
+    # time windows are fed through stdin
+    if self.has_window() or infile == sys.stdin:
+      infile = '-'
+    command = [self._tshark_bin] + tshark_opts + ['-r', infile]
     return command
 
+  def has_window(self):
+    return self._start is not None or self._duration is not None
+
+  def feed_window(self, ranges, stdin):
+    """Writes the capture window into the decoder stdin."""
+    try:
+      pcap_index.copy_ranges(self._infile, ranges, stdin)
+    except IOError:
+      # the decoder exited early
+      pass
+    finally:
+      stdin.close()
+
   def parse_line(self, line):
     """Parses the output of a tshark line."""
+    fields = line[:-1].split(';')
+    ip_id = fields.pop() if len(fields) == NUM_FIELDS else ''
     try:
       (timestamp, ip_proto, ip_src, ip_dst, ip_len,
        sport, dport, tcp_seq, tcp_len, tcp_nxtseq, tcp_ack,
-       tcp_flags_syn, tcp_tsval, tcp_tsecr) = line[:-1].split(';')
+       tcp_flags_syn, tcp_tsval, tcp_tsecr) = fields
     except ValueError:
       sys.stderr.write('discarding line = "%s"\n' % line)
       raise
@@ -78,17 +152,101 @@ class PacketDumper(object):
     if ',' in ip_len:
       ip_len = ip_len.split(',')[-1]
     ip_len = int(ip_len)
+    if ',' in ip_id:
+      ip_id = ip_id.split(',')[-1]
+    # tshark prints the ip id in hex
+    ip_id = int(ip_id, 0) if ip_id else None
     # sanitize tcp values
     tcp_seq = int(tcp_seq)
     tcp_len = int(tcp_len)
     tcp_nxtseq = int(tcp_nxtseq) if tcp_nxtseq else None
     tcp_ack = int(tcp_ack) if tcp_ack else None
     tcp_flags_syn = int(tcp_flags_syn)
-    tcp_tsval = int(tcp_tsval)
-    tcp_tsecr = int(tcp_tsecr)
+    # packets without the timestamp option have no tsval/tsecr
+    tcp_tsval = int(tcp_tsval) if tcp_tsval else None
+    tcp_tsecr = int(tcp_tsecr) if tcp_tsecr else None
     return PacketInfo(timestamp, ip_proto, ip_src, ip_dst, ip_len,
                       sport, dport, tcp_seq, tcp_len, tcp_nxtseq, tcp_ack,
-                      tcp_flags_syn, tcp_tsval, tcp_tsecr)
+                      tcp_flags_syn, tcp_tsval, tcp_tsecr, ip_id)
+
+  def packets(self):
+    """Returns an iterator of the packets of the capture(s) (as PacketInfo).
+
+    Several captures are decoded at the same time (a tshark per capture),
+    and their packets merged by timestamp. Duplicate packets are dropped
+    (if asked to).
+    """
+    if len(self._infiles) == 1:
+      packets = self.capture_packets(self._infile)
+    else:
+      packets = packet_merger.merge_packets([
+          packet_merger.reorder_packets(self.capture_packets(infile),
+                                        self._reorder_window,
+                                        self._reorder_max_packets,
+                                        self.late_packet)
+          for infile in self._infiles])
+    if self._dedup is not None:
+      packets = self._dedup.filter(packets)
+    return packets
+
+  def late_packet(self, _):
+    """Accounts a packet out of order beyond the reorder buffer."""
+    self._late_packets += 1
+    if self._profiler is not None:
+      self._profiler.count('late_packets')
+
+  def capture_packets(self, infile):
+    """Runs tshark, and yields the packets it decodes (as PacketInfo).
+
+    Packets are decoded as they are consumed, so a slow consumer just
+    makes tshark block on its output pipe.
+    """
+    command = self.create_command(infile)
+    if self._debug > 0:
+      sys.stderr.write(' '.join(command) + '\n')
+    if not self.has_window():
+      proc = subprocess.Popen(command, stdout=subprocess.PIPE)
+    else:
+      # only decode the part of the capture around the window
+      index = pcap_index.get_index(self._infile)
+      ranges = pcap_index.window_ranges(index, self._start or 0.,
+                                        self._duration)
+      if self._debug > 0:
+        sys.stderr.write('decoding %i bytes: %s\n' % (
+            sum(length for _, length in ranges), ranges))
+      t_start = (index['t_first'] or 0.) + (self._start or 0.)
+      t_end = (t_start + self._duration if self._duration is not None
+               else float('inf'))
+      proc = subprocess.Popen(command, stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE)
+      feeder = threading.Thread(target=self.feed_window,
+                                args=(ranges, proc.stdin))
+      feeder.daemon = True
+      feeder.start()
+    readline = proc.stdout.readline
+    if self._profiler is not None:
+      readline = self._profiler.timed('tshark_wait', readline)
+    try:
+      for line in iter(readline, ''):
+        try:
+          packet = self.parse_line(line)
+        except ValueError:
+          if self._profiler is not None:
+            self._profiler.count('discarded_lines')
+          continue
+        if self.has_window() and not t_start <= packet.timestamp < t_end:
+          # packet out of the window (but in the decoded range)
+          if self._profiler is not None:
+            self._profiler.count('window_skipped_packets')
+          continue
+        yield packet
+      proc.wait()
+    finally:
+      if proc.poll() is None:
+        # the consumer stopped early
+        proc.stdout.close()
+        proc.terminate()
+        proc.wait()
 
   def run(self):
     # prepare the output fd
@@ -96,23 +254,43 @@ class PacketDumper(object):
     # to support sys.stdout too.
     f = (open(self._outfile, 'w+') if self._outfile != sys.stdout else
          sys.stdout)
+    # index the packet-mode output files (see output_index.py), and keep
+    # their delta histograms (see hdr_histogram.py)
+    writer = None
+    histograms = None
+    if self._analysis_type == 'packet' and self._outfile != sys.stdout:
+      # numpy is only needed (and imported) for the histogram summary
+      import hdr_histogram  # pylint: disable=g-import-not-at-top
+      writer = output_index.IndexedWriter(f)
+      histograms = hdr_histogram.HistogramSink(self._src_reverse)
     try:
       # init trace info object
-      trace_info = TraceInfo(f, self._analysis_type, self._debug)
-      # run command
-      command = self.create_command()
-      if self._debug > 0:
-        sys.stderr.write(' '.join(command) + '\n')
-      proc = subprocess.Popen(command, stdout=subprocess.PIPE)
-      # process the output
-      for line in iter(proc.stdout.readline, ''):
-        try:
-          packet = self.parse_line(line)
-        except ValueError:
-          continue
+      out = (TeeSink([TextSink(writer), histograms]) if writer is not None
+             else f)
+      trace_info = TraceInfo(out, self._analysis_type, self._debug,
+                             self._max_segments, self._max_conn_segments,
+                             self._segment_horizon, self._profiler,
+                             self._prefix_labels)
+      for packet in self.packets():
         trace_info.process_packet(packet)
-      # clean up trace object
-      del trace_info
+      # print the connection data and the trailer
+      trace_info.finish()
+      if self._late_packets and self._debug >= 0:
+        sys.stderr.write('warning: %i packets out of order beyond the '
+                         'reorder buffer\n' % self._late_packets)
+      if self._dedup is not None:
+        if self._profiler is not None:
+          self._profiler.count('duplicate_packets', self._dedup.duplicates)
+        if self._debug > 0:
+          sys.stderr.write('dropped %i duplicate packets\n' %
+                           self._dedup.duplicates)
     finally:
       if self._outfile != sys.stdout:
         f.close()
+    if writer is not None:
+      # write the index after the output, so it is not seen as stale
+      with open(output_index.index_path(self._outfile), 'w') as index_file:
+        writer.write_index(index_file)
+      with open(hdr_histogram.summary_path(self._outfile),
+                'w') as summary_file:
+        histograms.write_summary(summary_file)
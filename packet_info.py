@@ -23,7 +23,7 @@ class PacketInfo(object):
 
   def __init__(self, timestamp, ip_proto, ip_src, ip_dst, ip_len,
                sport, dport, tcp_seq, tcp_len, tcp_nxtseq, tcp_ack,
-               tcp_flags_syn, tcp_tsval, tcp_tsecr):
+               tcp_flags_syn, tcp_tsval, tcp_tsecr, ip_id=None):
     self.timestamp = timestamp
     self.ip_proto = ip_proto
     self.ip_src = ip_src
@@ -38,3 +38,5 @@ class PacketInfo(object):
     self.tcp_flags_syn = tcp_flags_syn
     self.tcp_tsval = tcp_tsval
     self.tcp_tsecr = tcp_tsecr
+    # None for IPv6 (and older field dumps)
+    self.ip_id = ip_id
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Time-ordered merge of the packets of several captures.
+
+Each capture is decoded as a separate stream. Small timestamp inversions
+inside a stream are absorbed by a bounded reorder buffer, and the
+(ordered) streams are then merged by timestamp with a k-way heap merge,
+so any number of captures is analyzed in a single streaming pass.
+"""
+
+
+import heapq
+import itertools
+
+from common import REORDER_MAX_PACKETS
+from common import REORDER_WINDOW_SECS
+
+
+def reorder_packets(packets, window=REORDER_WINDOW_SECS,
+                    max_packets=REORDER_MAX_PACKETS, late=None):
+  """Sorts a packet stream whose timestamps are only slightly out of order.
+
+  A packet is held until a packet window seconds newer arrives (or the
+  buffer holds more than max_packets). Packets arriving after a newer one
+  was yielded are yielded anyway (out of order).
+
+  Args:
+    packets: iterable of packets (with a timestamp attribute)
+    window: max timestamp inversion absorbed (sec)
+    max_packets: max packets held
+    late: function called with every packet yielded out of order (or None)
+
+  Yields:
+    the packets, in timestamp order (for inversions within the bounds).
+  """
+  assert window >= 0 and max_packets > 0
+  heap = []
+  # arrival order (packets with the same timestamp are not reordered)
+  arrival = itertools.count()
+  newest = float('-inf')
+  last = float('-inf')
+  for packet in packets:
+    heapq.heappush(heap, (packet.timestamp, next(arrival), packet))
+    newest = max(newest, packet.timestamp)
+    while heap and (len(heap) > max_packets or
+                    heap[0][0] <= newest - window):
+      timestamp, _, packet = heapq.heappop(heap)
+      if timestamp < last and late is not None:
+        late(packet)
+      last = max(last, timestamp)
+      yield packet
+  while heap:
+    timestamp, _, packet = heapq.heappop(heap)
+    if timestamp < last and late is not None:
+      late(packet)
+    last = max(last, timestamp)
+    yield packet
+
+
+def merge_packets(streams):
+  """Merges several (ordered) packet streams by timestamp.
+
+  Args:
+    streams: list of iterables of packets (each in timestamp order)
+
+  Yields:
+    the packets of all the streams, in timestamp order (packets with the
+    same timestamp come in stream order).
+  """
+  heap = []
+  for index, stream in enumerate(streams):
+    iterator = iter(stream)
+    for packet in iterator:
+      heap.append((packet.timestamp, index, packet, iterator))
+      break
+  heapq.heapify(heap)
+  while heap:
+    _, index, packet, iterator = heap[0]
+    yield packet
+    for packet in iterator:
+      heapq.heapreplace(heap, (packet.timestamp, index, packet, iterator))
+      break
+    else:
+      # stream exhausted
+      heapq.heappop(heap)
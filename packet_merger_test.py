@@ -0,0 +1,113 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for packet_merger.py."""
+
+import cStringIO
+import collections
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from packet_dumper import PacketDumper
+import packet_merger
+import synthetic_trace
+
+
+Packet = collections.namedtuple('Packet', ['timestamp', 'name'])
+
+
+def make_packets(timestamps):
+  return [Packet(timestamp, '%s/%i' % (timestamp, i))
+          for i, timestamp in enumerate(timestamps)]
+
+
+class PacketMergerTest(unittest.TestCase):
+
+  def testReorder(self):
+    packets = make_packets([1., 1.05, 1.02, 1.2, 1.15, 1.15, 1.3])
+    late = []
+    reordered = list(packet_merger.reorder_packets(packets, 0.1,
+                                                   late=late.append))
+    self.assertEqual(sorted(packets), reordered)
+    self.assertEqual([], late)
+
+  def testLate(self):
+    # 1.0 arrives after 1.2 made 1.05 leave the buffer
+    packets = make_packets([1.05, 1.2, 1., 1.3])
+    late = []
+    reordered = list(packet_merger.reorder_packets(packets, 0.1,
+                                                   late=late.append))
+    self.assertEqual([1.05, 1., 1.2, 1.3],
+                     [packet.timestamp for packet in reordered])
+    self.assertEqual([packets[2]], late)
+
+  def testMaxPackets(self):
+    packets = make_packets([3., 2., 1., .5])
+    late = []
+    reordered = list(packet_merger.reorder_packets(packets, 10.,
+                                                   max_packets=2,
+                                                   late=late.append))
+    self.assertEqual([1., .5, 2., 3.],
+                     [packet.timestamp for packet in reordered])
+    self.assertEqual([packets[3]], late)
+
+  def testMerge(self):
+    streams = [make_packets([1., 3., 5.]), [], make_packets([2., 3., 4.]),
+               make_packets([0.])]
+    merged = list(packet_merger.merge_packets(streams))
+    self.assertEqual([0., 1., 2., 3., 3., 4., 5.],
+                     [packet.timestamp for packet in merged])
+    # same timestamps come in stream order
+    self.assertEqual([streams[0][1], streams[2][1]], merged[3:5])
+    self.assertEqual([], list(packet_merger.merge_packets([])))
+
+  def testCaptures(self):
+    config = synthetic_trace.TraceConfig(packets=1000, flows=4)
+    fields = cStringIO.StringIO()
+    synthetic_trace.write_trace(config, fields_file=fields)
+    lines = fields.getvalue().splitlines(True)
+    tmpdir = tempfile.mkdtemp()
+    try:
+      # a fake tshark that prints the fields file of its capture
+      tshark = os.path.join(tmpdir, 'tshark')
+      with open(tshark, 'w') as f:
+        f.write('#!/bin/sh\nfor last; do :; done\ncat "$last.fields"\n')
+      os.chmod(tshark, stat.S_IRWXU)
+      # the trace, and the same packets split in 3 captures
+      captures = []
+      for name, capture_lines in (('all', lines), ('a', lines[0::3]),
+                                  ('b', lines[1::3]), ('c', lines[2::3])):
+        captures.append(os.path.join(tmpdir, name + '.pcap'))
+        with open(captures[-1] + '.fields', 'w') as f:
+          f.writelines(capture_lines)
+      outputs = []
+      for infile in (captures[0], captures[1:]):
+        outfile = os.path.join(tmpdir, 'out.txt')
+        PacketDumper(tshark, infile, outfile, 'packet', -1).run()
+        with open(outfile) as f:
+          outputs.append(f.read())
+    finally:
+      shutil.rmtree(tmpdir)
+    self.assertIn('delta1', outputs[0])
+    self.assertEqual(outputs[0], outputs[1])
+
+
+if __name__ == '__main__':
+  unittest.main()
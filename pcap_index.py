@@ -0,0 +1,259 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Timestamp-to-offset index of pcap and pcapng captures.
+
+The index is built by scanning the record (block) headers only, without
+dissecting any packet. It stores a (timestamp, offset) checkpoint every
+CHECKPOINT_RECORDS packets, and the location of the blocks any reader
+needs before the first packet (the pcap file header, or the pcapng
+section header and interface description blocks).
+
+A time window of the capture can then be extracted as those header bytes
+followed by a single byte range of packet records, which is a valid
+capture that can be fed to the decoder.
+"""
+
+
+import bisect
+import json
+import os
+import struct
+
+
+INDEX_SUFFIX = '.pcapidx'
+INDEX_VERSION = 1
+CHECKPOINT_RECORDS = 1000
+COPY_CHUNK_BYTES = 1 << 20
+
+PCAP_MAGIC = {
+    # magic: (byte order, timestamp fraction units per second)
+    '\xd4\xc3\xb2\xa1': ('<', 1e6),
+    '\xa1\xb2\xc3\xd4': ('>', 1e6),
+    '\x4d\x3c\xb2\xa1': ('<', 1e9),
+    '\xa1\xb2\x3c\x4d': ('>', 1e9),
+}
+PCAP_HEADER_BYTES = 24
+PCAP_RECORD_BYTES = 16
+
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_IDB = 0x00000001
+PCAPNG_PB = 0x00000002
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+PCAPNG_IF_TSRESOL = 9
+
+
+def index_path(path):
+  """Returns the sidecar index path of a capture file."""
+  return path + INDEX_SUFFIX
+
+
+def scan_pcap(f, byte_order, units):
+  """Scans a pcap file.
+
+  Args:
+    f: capture file object (positioned after the file header)
+    byte_order: struct byte order of the file
+    units: timestamp fraction units per second
+
+  Yields:
+    (timestamp, offset) for every record.
+  """
+  record = struct.Struct(byte_order + 'IIII')
+  offset = PCAP_HEADER_BYTES
+  while True:
+    data = f.read(PCAP_RECORD_BYTES)
+    if len(data) < PCAP_RECORD_BYTES:
+      return
+    ts_sec, ts_frac, incl_len, _ = record.unpack(data)
+    yield ts_sec + ts_frac / units, offset
+    offset += PCAP_RECORD_BYTES + incl_len
+    f.seek(offset)
+
+
+def parse_tsresol(options, byte_order):
+  """Returns the timestamp units per second of a pcapng IDB."""
+  pos = 0
+  while pos + 4 <= len(options):
+    code, length = struct.unpack(byte_order + 'HH', options[pos:pos + 4])
+    if code == 0:
+      break
+    if code == PCAPNG_IF_TSRESOL and length >= 1:
+      value = ord(options[pos + 4])
+      return 2. ** (value & 0x7f) if value & 0x80 else 10. ** value
+    pos += 4 + ((length + 3) & ~3)
+  return 1e6
+
+
+def scan_pcapng(f, header_blocks):
+  """Scans a pcapng file.
+
+  Args:
+    f: capture file object (positioned at the start)
+    header_blocks: list where the (offset, length) of the section header
+        and interface description blocks are appended
+
+  Yields:
+    (timestamp, offset) for every timestamped packet block.
+  """
+  byte_order = '<'
+  units = []
+  offset = 0
+  while True:
+    data = f.read(12)
+    if len(data) < 12:
+      return
+    if struct.unpack('<I', data[:4])[0] == PCAPNG_SHB:
+      # the section header sets the byte order of the section
+      magic, = struct.unpack('<I', data[8:12])
+      byte_order = '<' if magic == PCAPNG_BYTE_ORDER_MAGIC else '>'
+      units = []
+    block_type, length, word = struct.unpack(byte_order + 'III', data)
+    assert length >= 12, 'invalid pcapng block at offset %i' % offset
+    if block_type in (PCAPNG_SHB, PCAPNG_IDB):
+      header_blocks.append([offset, length])
+      if block_type == PCAPNG_IDB:
+        body = f.read(length - 12)
+        units.append(parse_tsresol(body[4:-4], byte_order))
+    elif block_type in (PCAPNG_EPB, PCAPNG_PB):
+      ts_high, ts_low = struct.unpack(byte_order + 'II', f.read(8))
+      if block_type == PCAPNG_EPB:
+        interface = word
+      else:
+        interface, _ = struct.unpack(byte_order + 'HH', data[8:12])
+      unit = units[interface] if interface < len(units) else 1e6
+      yield ((ts_high << 32) + ts_low) / unit, offset
+    offset += length
+    f.seek(offset)
+
+
+def build_index(path, checkpoint_records=CHECKPOINT_RECORDS):
+  """Scans a capture file, and returns its index.
+
+  Args:
+    path: pcap or pcapng file
+    checkpoint_records: number of packets between checkpoints
+
+  Returns:
+    a dictionary with the 'header_blocks' ((offset, length) pairs of the
+    blocks needed before any packet), 't_first' (first packet timestamp),
+    and 'checkpoints' ((timestamp, offset) pairs) entries.
+  """
+  header_blocks = []
+  checkpoints = []
+  t_first = None
+  with open(path, 'rb') as f:
+    magic = f.read(4)
+    if magic in PCAP_MAGIC:
+      byte_order, units = PCAP_MAGIC[magic]
+      header_blocks.append([0, PCAP_HEADER_BYTES])
+      f.seek(PCAP_HEADER_BYTES)
+      records = scan_pcap(f, byte_order, units)
+    else:
+      assert struct.unpack('<I', magic)[0] == PCAPNG_SHB, (
+          '%s is not a pcap or pcapng file' % path)
+      f.seek(0)
+      records = scan_pcapng(f, header_blocks)
+    for i, (timestamp, offset) in enumerate(records):
+      if t_first is None:
+        t_first = timestamp
+      if i % checkpoint_records == 0:
+        # keep the checkpoints sorted even if the capture is not
+        if checkpoints:
+          timestamp = max(timestamp, checkpoints[-1][0])
+        checkpoints.append([timestamp, offset])
+  stat = os.stat(path)
+  return {
+      'version': INDEX_VERSION,
+      'size': stat.st_size,
+      'mtime': stat.st_mtime,
+      'header_blocks': header_blocks,
+      't_first': t_first,
+      'checkpoints': checkpoints,
+  }
+
+
+def get_index(path):
+  """Returns the index of a capture file (building and saving it if needed)."""
+  stat = os.stat(path)
+  try:
+    with open(index_path(path)) as f:
+      index = json.load(f)
+    if (index.get('version') == INDEX_VERSION and
+        index['size'] == stat.st_size and index['mtime'] == stat.st_mtime):
+      return index
+  except (IOError, ValueError):
+    pass
+  index = build_index(path)
+  try:
+    with open(index_path(path), 'w') as f:
+      json.dump(index, f, separators=(',', ':'))
+  except IOError:
+    # read-only capture directory: just use the index this time
+    pass
+  return index
+
+
+def window_ranges(index, start, duration):
+  """Returns the byte ranges of a time window of a capture.
+
+  The packet range is extended to the enclosing checkpoints, so it may
+  include some packets out of the window: the caller must filter them
+  by timestamp.
+
+  Args:
+    index: capture index
+    start: window start (seconds since the first packet)
+    duration: window duration (None for the rest of the capture)
+
+  Returns:
+    a list of (offset, length) pairs: the header blocks before the first
+    packet of the range, and then the range of packet records.
+  """
+  checkpoints = index['checkpoints']
+  if not checkpoints:
+    return [tuple(block) for block in index['header_blocks']]
+  timestamps = [timestamp for timestamp, _ in checkpoints]
+  t_start = index['t_first'] + start
+  # last checkpoint at or before the window start
+  first = max(bisect.bisect_right(timestamps, t_start) - 1, 0)
+  start_offset = checkpoints[first][1]
+  end_offset = index['size']
+  if duration is not None:
+    # first checkpoint at or after the window end
+    last = bisect.bisect_left(timestamps, t_start + duration)
+    if last < len(checkpoints):
+      end_offset = checkpoints[last][1]
+  ranges = [tuple(block) for block in index['header_blocks']
+            if block[0] < start_offset]
+  if end_offset > start_offset:
+    ranges.append((start_offset, end_offset - start_offset))
+  return ranges
+
+
+def copy_ranges(path, ranges, out):
+  """Copies some byte ranges of a file into a file object."""
+  with open(path, 'rb') as f:
+    for offset, length in ranges:
+      f.seek(offset)
+      while length > 0:
+        data = f.read(min(length, COPY_CHUNK_BYTES))
+        if not data:
+          break
+        out.write(data)
+        length -= len(data)
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for pcap_index.py."""
+
+import cStringIO
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import pcap_index
+
+
+NUM_PACKETS = 100
+PAYLOAD = 'x' * 37
+
+
+def pcap_file():
+  """A pcap file with a packet every 0.5 sec."""
+  data = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+  for i in range(NUM_PACKETS):
+    data += struct.pack('<IIII', 1000 + i // 2, 500000 * (i % 2),
+                        len(PAYLOAD), len(PAYLOAD)) + PAYLOAD
+  return data
+
+
+def pcapng_block(block_type, body):
+  body += '\0' * (-len(body) % 4)
+  return (struct.pack('<II', block_type, 12 + len(body)) + body +
+          struct.pack('<I', 12 + len(body)))
+
+
+def pcapng_file():
+  """A pcapng file (nsec timestamps) with a packet every 0.5 sec."""
+  data = pcapng_block(pcap_index.PCAPNG_SHB,
+                      struct.pack('<IHHq', pcap_index.PCAPNG_BYTE_ORDER_MAGIC,
+                                  1, 0, -1))
+  options = struct.pack('<HHB3xHH', pcap_index.PCAPNG_IF_TSRESOL, 1, 9, 0, 0)
+  data += pcapng_block(pcap_index.PCAPNG_IDB,
+                       struct.pack('<HHI', 1, 0, 65535) + options)
+  for i in range(NUM_PACKETS):
+    ts = (1000 * 10 ** 9) + i * 5 * 10 ** 8
+    data += pcapng_block(pcap_index.PCAPNG_EPB, struct.pack(
+        '<IIIII', 0, ts >> 32, ts & 0xffffffff, len(PAYLOAD),
+        len(PAYLOAD)) + PAYLOAD)
+  return data
+
+
+class PcapIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def writeCapture(self, name, data):
+    path = os.path.join(self._tmpdir, name)
+    with open(path, 'wb') as f:
+      f.write(data)
+    return path
+
+  def checkWindow(self, path, header_bytes, record_bytes):
+    index = pcap_index.build_index(path, checkpoint_records=10)
+    self.assertEqual(1000., index['t_first'])
+    self.assertEqual(NUM_PACKETS / 10, len(index['checkpoints']))
+    self.assertEqual(header_bytes,
+                     sum(length for _, length in index['header_blocks']))
+    # [10, 15) sec: packets 20 to 29, in the checkpoints at 20 and 30
+    ranges = pcap_index.window_ranges(index, 10., 5.)
+    self.assertEqual((header_bytes + 20 * record_bytes, 10 * record_bytes),
+                     ranges[-1])
+    # a window capture is a header plus a packet range
+    out = cStringIO.StringIO()
+    pcap_index.copy_ranges(path, ranges, out)
+    self.assertEqual(header_bytes + 10 * record_bytes, len(out.getvalue()))
+    # open-ended windows go up to the end of the capture
+    ranges = pcap_index.window_ranges(index, 44., None)
+    self.assertEqual((header_bytes + 80 * record_bytes, 20 * record_bytes),
+                     ranges[-1])
+
+  def testPcap(self):
+    path = self.writeCapture('trace.pcap', pcap_file())
+    self.checkWindow(path, pcap_index.PCAP_HEADER_BYTES,
+                     pcap_index.PCAP_RECORD_BYTES + len(PAYLOAD))
+
+  def testPcapng(self):
+    path = self.writeCapture('trace.pcapng', pcapng_file())
+    # SHB (28 bytes) and IDB (32 bytes), and 72-byte EPBs
+    self.checkWindow(path, 60, 72)
+
+  def testGetIndex(self):
+    path = self.writeCapture('trace.pcap', pcap_file())
+    index = pcap_index.get_index(path)
+    self.assertTrue(os.path.isfile(pcap_index.index_path(path)))
+    self.assertEqual(index, pcap_index.get_index(path))
+
+
+if __name__ == '__main__':
+  unittest.main()
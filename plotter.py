@@ -18,18 +18,43 @@
 """Plotting code."""
 
 
+import collections
+import cStringIO
 from functools import partial
+import os.path
 import sys
 
+import cidr
 from common import decimal_fmt
+from common import DENSITY_MODES
+from common import parse_time_range
+from common import TOP_CONNECTIONS
+from common import TOP_LINE_PREFIX
+from common import TOP_METRICS
+import hdr_histogram
+import matplotlib.colors as colors
 import matplotlib.gridspec as gridspec
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import numpy as np
+import output_index
 import pandas as pd
+from sample_stats import group_stats
+from sample_stats import HistogramStats
+from sample_stats import SampleStats
+import tile_pyramid
 
 
 MAX_SEPARATE = 5
+# flow-mode labels plotted as separate series (the rest are aggregated)
+MAX_SEPARATE_LABELS = 10
+DIRECTIONS = ['fwd', 'rev']
+# packet-mode panels: time series need the samples, distributions can be
+# drawn from the analysis histogram summary (see hdr_histogram.py)
+TIME_SERIES_DELTAS = ['delta1', 'delta2']
+DISTRIBUTION_DELTAS = ['delta4']
+# remove the heads of the trains (hystart_ack_delta in tcp_cubic.c)
+DELTA4_MAX_VALUE = 0.002
 CUT_VALUE_HEAD_SECS = 0.01
 CUT_VALUE_TAIL_SECS = 0.1
 NUM_BINS = 50
@@ -39,6 +64,13 @@ MIN_FLOW_GOODPUT = 5000000
 
 NUM_MEAN_MARKERS = 10
 
+# density (2D histogram) rendering of large scatter plots
+DENSITY_MIN_POINTS = 100000
+DENSITY_BINS = [400, 200]
+
+# the top connections are written at the end of the analysis file
+TOP_TAIL_BYTES = 65536
+
 # per-experiment, per-direction color/marker
 DIR_CONN_COLOR_D = {
     'delta1': {
@@ -75,18 +107,79 @@ IP_CONN_COLOR_D = {
 }
 
 
+# analysis file columns (name, dtype)
+FLOW_COLUMNS = [
+    ('connhash', object),
+    ('first_ts', np.float64),
+    ('last_ts', np.float64),
+    ('ip_proto', np.int64),
+    ('tcp_seq_syn_sport', object),
+    ('tcp_seq_syn_dport', object),
+    ('ip_total_pkt', np.int64),
+    ('ip_total_bytes', np.int64),
+    ('pps', np.float64),
+    ('ip_bitrate', np.float64),
+    ('tcp_bytes', np.int64),
+    ('tcp_goodput_bytes', np.int64),
+    ('tcp_goodput_bitrate', np.float64),
+    ('delta1_small_mean', np.float64),
+    ('delta1_small_median', np.float64),
+    ('delta1_large_mean', np.float64),
+    ('delta1_large_median', np.float64),
+    ('delta1_evicted', np.int64),
+    ('delta2_evicted', np.int64),
+    # float, so older files (without them) can still be read
+    ('tcp_retrans_bytes', np.float64),
+    ('tcp_spurious_retrans', np.float64),
+    ('tcp_out_of_order', np.float64),
+    ('tcp_holes', np.float64),
+    ('label', object),
+]
+# non-float columns that older files do not have
+OPTIONAL_COLUMNS = ['label']
+
+PACKET_COLUMNS = [
+    ('type', 'category'),
+    ('timestamp', np.float64),
+    ('src', 'category'),
+    ('dst', 'category'),
+    ('delta', np.float64),
+    ('traffic', 'category'),
+]
+
+
 class Plotter(object):
   """Class that processes analyzed files and plots them."""
 
   def __init__(self, infile, outfile, analysis_type, plot_format,
-               plot_title, src_reverse, debug):
+               plot_title, src_reverse, debug, density='auto',
+               top_connections=0, top_metric='delta1', time_range=None,
+               flow=None, delta=None, prefix_labels=None, store=None):
     self._infile = infile
     self._outfile = outfile
     self._analysis_type = analysis_type
     self._plot_format = plot_format
     self._plot_title = plot_title
     self._src_reverse = src_reverse
+    self._src_reverse_prefixes = cidr.parse_prefix_list(src_reverse)
     self._debug = debug
+    assert density in DENSITY_MODES
+    self._density = density
+    assert 0 <= top_connections <= TOP_CONNECTIONS, (
+        'at most %i top connections can be plotted' % TOP_CONNECTIONS)
+    self._top_connections = top_connections
+    assert top_metric in TOP_METRICS
+    self._top_metric = top_metric
+    # packet selection (the sidecar index is used when available)
+    self._time_range = parse_time_range(time_range)
+    self._flow = flow
+    self._delta = delta
+    # trace store (see trace_store.py): infile is then a list of trace
+    # selectors
+    self._store = store
+    # subnet labels (a prefix label file), to facet the plots by label
+    self._prefix_labels = (cidr.read_prefix_labels(prefix_labels)
+                           if prefix_labels is not None else None)
     milli = 1e-3
     self._format_milli = ticker.FuncFormatter(
         lambda y, pos: '{0:g}'.format(y / milli))
@@ -102,14 +195,66 @@ class Plotter(object):
 
   def run(self):
     """Plot a result file obtained from the pcap analysis."""
+    summary = self.read_summary()
+    if summary is not None:
+      # the distributions come from the summary: only read the time series
+      df = self.packet_read_time_series()
+      self.packet_process_data(df, summary)
+      return
     df = self.read_input()
-    if self._analysis_type == 'flow':
+    if self._plot_format == 'html':
+      assert self._analysis_type == 'packet', (
+          'html output requires packet analysis files')
+      self.packet_export_html(df)
+    elif self._analysis_type == 'flow':
       self.flow_process_data(df)
     elif self._analysis_type == 'packet':
       self.packet_process_data(df)
 
+  def read_summary(self):
+    """Read the histogram summary of the input file (None if unusable).
+
+    The summary is only used for full (unselected, unfaceted) packet plots,
+    and only if the analysis used the same --src-reverse directions.
+    """
+    if (self._analysis_type != 'packet' or self._plot_format == 'html' or
+        self._infile == sys.stdin or self._store is not None or
+        self.packet_has_selection() or self._prefix_labels is not None):
+      return None
+    summary = hdr_histogram.read_summary(self._infile)
+    if summary is None or summary['src_reverse'] != self._src_reverse:
+      return None
+    return summary
+
+  def packet_read_time_series(self):
+    """Read the time series samples of the input file (packet type)."""
+    index = output_index.read_index(self._infile)
+    blocks = None
+    if index is not None:
+      blocks = sorted(set(
+          block for delta in TIME_SERIES_DELTAS
+          for block in output_index.select_blocks(index, delta=delta)))
+    if blocks is None or len(blocks) == len(index['blocks']):
+      # no blocks to skip
+      df = self.read_input()
+    else:
+      with open(self._infile, 'r') as f:
+        data = output_index.read_blocks(f, index, blocks)
+      if self._debug > 0:
+        sys.stderr.write('read %i of %i blocks (%i bytes)\n' % (
+            len(blocks), len(index['blocks']), len(data)))
+      df = self.packet_read_input(cStringIO.StringIO(data))
+    df = df[df.type.isin(TIME_SERIES_DELTAS)]
+    return df.reset_index(drop=True)
+
   def read_input(self):
     """Read an input file into a pandas dataframe."""
+    if self._store is not None:
+      return self.store_read_input()
+    if self.packet_has_selection() and self._infile != sys.stdin:
+      index = output_index.read_index(self._infile)
+      if index is not None:
+        return self.packet_read_indexed_input(index)
     # prepare the input fd
     # we cannot use controlled execution (`with open(...) as f:`) as we want
     # to support sys.stdin too.
@@ -122,76 +267,249 @@ class Plotter(object):
     finally:
       if self._infile != sys.stdin:
         f.close()
+    if self.packet_has_selection():
+      df = self.packet_select(df, df.timestamp.min())
+    return df
+
+  def read_table(self, f, columns):
+    """Read a whitespace-separated analysis file using the pandas C parser.
+
+    Args:
+      f: file object to read from
+      columns: list of (name, dtype) pairs describing the file columns.
+          Only float (and OPTIONAL_COLUMNS) columns may contain missing
+          ('-' or nan) values.
+
+    Returns:
+      a pandas dataframe.
+    """
+    names = [name for name, _ in columns]
+    # integer columns cannot hold NaN: read them as floats first
+    int_columns = [name for name, dtype in columns if dtype == np.int64]
+    dtype = dict((name, np.float64 if name in int_columns else dtype)
+                 for name, dtype in columns)
+    na_values = dict((name, ['-']) for name, dtype in columns
+                     if dtype == np.float64)
+    read_csv = partial(pd.read_csv, delim_whitespace=True, comment='#',
+                       header=None, names=names, na_values=na_values,
+                       error_bad_lines=False,
+                       warn_bad_lines=(self._debug >= 0), engine='c')
+    try:
+      df = read_csv(f, dtype=dtype)
+    except ValueError:
+      # some line has a non-numeric value in a numeric column: parse the
+      # file again as strings, and discard the invalid values
+      if f == sys.stdin:
+        raise
+      f.seek(0)
+      df = read_csv(f, dtype=object)
+      for name, dtype in columns:
+        if dtype in (np.float64, np.int64):
+          df[name] = pd.to_numeric(df[name], errors='coerce')
+        elif dtype == 'category':
+          df[name] = df[name].astype('category')
+    # discard lines with missing fields (read as NaN)
+    df = df.dropna(subset=[name for name, dtype in columns
+                           if dtype != np.float64 and
+                           name not in OPTIONAL_COLUMNS])
+    df = df.astype(dict((name, np.int64) for name in int_columns))
+    if self._debug > 0:
+      sys.stderr.write('%s\n' % df)
     return df
 
+  def store_read_input(self):
+    """Read the input traces from a trace store into a pandas dataframe.
+
+    The rows have the same columns (and types) as the analysis files.
+    """
+    import trace_store  # pylint: disable=g-import-not-at-top
+    store = trace_store.TraceStore(self._store, self._debug)
+    try:
+      trace_ids = store.select_traces(self._infile, self._analysis_type)
+      assert trace_ids, 'no %s traces match the input' % self._analysis_type
+      if self._analysis_type == 'flow':
+        columns = FLOW_COLUMNS
+        rows = store.read_flows(trace_ids)
+      elif self._analysis_type == 'packet':
+        columns = PACKET_COLUMNS
+        rows = store.read_samples(trace_ids, self._delta)
+    finally:
+      store.close()
+    if self._debug > 0:
+      sys.stderr.write('read %i rows of %i traces from %s\n' % (
+          len(rows), len(trace_ids), self._store))
+    df = pd.DataFrame.from_records(rows, columns=[name for name, _ in columns])
+    for name, dtype in columns:
+      if dtype == np.int64 and df[name].isnull().any():
+        # (missing in older files)
+        df[name] = df[name].astype(np.float64)
+      elif dtype != object:
+        df[name] = df[name].astype(dtype)
+    if self._analysis_type == 'flow':
+      df = df[df.first_ts.notnull() & df.last_ts.notnull() &
+              df.pps.notnull() & df.ip_bitrate.notnull()]
+    else:
+      df = df[df.timestamp.notnull() & df.delta.notnull()]
+      if self.packet_has_selection():
+        df = self.packet_select(df, df.timestamp.min())
+    return df.reset_index(drop=True)
+
   def flow_read_input(self, f):
     """Read input file into a pandas dataframe (flow type)."""
-    lst = []
-    i = 0
-    for line in f:
-      try:
-        (connhash, first_ts, last_ts,
-         ip_proto,
-         tcp_seq_syn_sport, tcp_seq_syn_dport,
-         ip_total_pkt, ip_total_bytes,
-         pps, ip_bitrate, tcp_bytes,
-         tcp_goodput_bytes, tcp_goodput_bitrate,
-         delta1_small_mean,
-         delta1_small_median,
-         delta1_large_mean,
-         delta1_large_median) = line.split()
-      except ValueError:
-        sys.stderr.write('discarding line = "%s"\n' % line)
-        continue
-      if line[0] == '#':
-        # this is a comment
-        continue
-      if self._debug > 0:
-        sys.stderr.write('%s\n' % line)
-      if pps == '-' or ip_bitrate == '-':
-        continue
-      lst += [[i, connhash, float(first_ts), float(last_ts),
-               int(ip_proto),
-               tcp_seq_syn_sport, tcp_seq_syn_dport,
-               int(ip_total_pkt), int(ip_total_bytes),
-               float(pps), float(ip_bitrate), int(tcp_bytes),
-               int(tcp_goodput_bytes), float(tcp_goodput_bitrate),
-               float(delta1_small_mean), float(delta1_small_median),
-               float(delta1_large_mean), float(delta1_large_median)]]
-      i += 1
-    df = pd.DataFrame(lst, columns=['order', 'connhash', 'first_ts', 'last_ts',
-                                    'ip_proto',
-                                    'tcp_seq_syn_sport', 'tcp_seq_syn_dport',
-                                    'ip_total_pkt', 'ip_total_bytes',
-                                    'pps', 'ip_bitrate', 'tcp_bytes',
-                                    'tcp_goodput_bytes', 'tcp_goodput_bitrate',
-                                    'delta1_small_mean', 'delta1_small_median',
-                                    'delta1_large_mean', 'delta1_large_median'])
-    return df
+    df = self.read_table(f, FLOW_COLUMNS)
+    # skip flows without a duration
+    df = df[df.first_ts.notnull() & df.last_ts.notnull() &
+            df.pps.notnull() & df.ip_bitrate.notnull()]
+    return df.reset_index(drop=True)
 
   def packet_read_input(self, f):
     """Read input file into a pandas dataframe (packet type)."""
-    lst = []
-    i = 0
-    for line in f:
-      try:
-        t, timestamp, src, dst, delta, traffic = line.split()
-      except ValueError:
-        sys.stderr.write('discarding line = "%s"\n' % line)
-        continue
-      if line[0] == '#':
-        # this is a comment
-        continue
-      if self._debug > 0:
-        sys.stderr.write('%s\n' % line)
-      lst += [[i, t, float(timestamp), src, dst, float(delta), traffic]]
-      i += 1
-    df = pd.DataFrame(lst, columns=['order', 'type', 'timestamp', 'src', 'dst',
-                                    'delta', 'traffic'])
-    return df
+    df = self.read_table(f, PACKET_COLUMNS)
+    df = df[df.timestamp.notnull() & df.delta.notnull()]
+    return df.reset_index(drop=True)
+
+  def packet_has_selection(self):
+    """Whether only some of the packet samples must be plotted."""
+    return (self._analysis_type == 'packet' and
+            (self._time_range != (None, None) or self._flow is not None or
+             self._delta is not None))
+
+  def packet_read_indexed_input(self, index):
+    """Read only the blocks of the input file that match the selection."""
+    connection = (output_index.connhash_key(self._flow)
+                  if self._flow is not None else None)
+    blocks = output_index.select_blocks(index, self._time_range, connection,
+                                        self._delta)
+    assert blocks, 'no samples match the selection'
+    with open(self._infile, 'r') as f:
+      data = output_index.read_blocks(f, index, blocks)
+    if self._debug > 0:
+      sys.stderr.write('read %i of %i blocks (%i bytes)\n' % (
+          len(blocks), len(index['blocks']), len(data)))
+    df = self.packet_read_input(cStringIO.StringIO(data))
+    return self.packet_select(df, index['t_min'])
+
+  def packet_select(self, df, t0):
+    """Select the packet samples in the time range, flow, and delta.
+
+    Args:
+      df: packet dataframe
+      t0: trace start (the time range is relative to it)
+
+    Returns:
+      the selected dataframe.
+    """
+    selected = np.ones(len(df), dtype=bool)
+    start, end = self._time_range
+    if start is not None:
+      selected &= (df.timestamp >= t0 + start).values
+    if end is not None:
+      selected &= (df.timestamp < t0 + end).values
+    if self._delta is not None:
+      selected &= (df.type == self._delta).values
+    if self._flow is not None:
+      src, dst = output_index.connhash_key(self._flow).split(' ')
+      selected &= self.match_connections(df, [(src, dst)]) >= 0
+    df = df[selected]
+    assert len(df), 'no samples match the selection'
+    return df.reset_index(drop=True)
+
+  def match_direction(self, src):
+    """Classify a (categorical) src column into 'fwd' and 'rev'.
+
+    Each unique endpoint is parsed and matched against the --src-reverse
+    prefixes only once. The result is then spread over all the rows
+    using the categorical codes.
+
+    Args:
+      src: categorical series with "addr:port" endpoints
+
+    Returns:
+      a categorical series with the direction ('fwd' or 'rev') of each row.
+    """
+    hi, lo, valid = cidr.pack_endpoints(src.cat.categories)
+    is_reverse = (cidr.match_prefixes(hi, lo, self._src_reverse_prefixes) &
+                  valid)
+    # add a (fwd) slot for missing values (code -1)
+    is_reverse = np.append(is_reverse, False).astype(np.int8)
+    codes = is_reverse[src.cat.codes.values]
+    return pd.Series(pd.Categorical.from_codes(codes, ['fwd', 'rev']),
+                     index=src.index)
+
+  def match_labels(self, src, dst):
+    """Label the rows of (categorical) src and dst columns.
+
+    Each unique (src, dst) pair is looked up in the prefix labels only
+    once (see cidr.PrefixTrie.label()).
+
+    Args:
+      src: categorical series with "addr:port" endpoints
+      dst: categorical series with "addr:port" endpoints
+
+    Returns:
+      a categorical series with the label of each row.
+    """
+    # a unique key per (src, dst) code pair (missing values are code -1)
+    width = len(dst.cat.categories) + 1
+    row_key = ((src.cat.codes.values.astype(np.int64) + 1) * width +
+               dst.cat.codes.values + 1)
+    keys, inverse = np.unique(row_key, return_inverse=True)
+    pair_labels = []
+    for key in keys:
+      endpoints = []
+      for categories, code in ((src.cat.categories, key // width - 1),
+                               (dst.cat.categories, key % width - 1)):
+        if code >= 0:
+          endpoints.append(categories[code])
+      pair_labels.append(self._prefix_labels.label(*endpoints))
+    categories = sorted(set(pair_labels))
+    codes = np.searchsorted(categories, pair_labels)[inverse]
+    return pd.Series(pd.Categorical.from_codes(codes, categories),
+                     index=src.index)
+
+  def flow_match_labels(self, df):
+    """Label the flows of a dataframe (None if they are not labeled).
+
+    The --prefix-labels file (if any) is matched against the connection
+    endpoints. Otherwise, the labels of the analysis file are used.
+
+    Args:
+      df: flow dataframe
+
+    Returns:
+      a series with the label of each flow (or None).
+    """
+    if self._prefix_labels is not None:
+      return pd.Series([
+          self._prefix_labels.label(*connhash.rsplit('-', 1)[0].split('-'))
+          for connhash in df.connhash], index=df.index)
+    labels = df.label.fillna(cidr.NO_LABEL)
+    if (labels == cidr.NO_LABEL).all():
+      return None
+    return labels
+
+  def facet_outfile(self, label):
+    """Returns the output file of a label facet (e.g. "out.site-1.pdf")."""
+    if label is None:
+      return self._outfile
+    assert self._outfile != sys.stdout, 'faceted plots need an output file'
+    root, ext = os.path.splitext(self._outfile)
+    return '%s.%s%s' % (root, label.replace(os.sep, '_'), ext)
+
+  def facet_title(self, label):
+    """Returns the plot title of a label facet."""
+    if label is None:
+      return self._plot_title
+    return ('%s [%s]' % (self._plot_title, label) if self._plot_title else
+            label)
 
   def flow_process_data(self, df):
     """Process a pandas dataframe (flow mode)."""
+    self.flow_plot_data(df)
+    plt.savefig(self._outfile, format=self._plot_format)
+
+  def flow_plot_data(self, df):
+    """Draw the flow graphs of a pandas dataframe (without saving them)."""
     # create the matplotlib figure
     fig = plt.figure(figsize=(9, 7))
     # ax_pps = fig.add_subplot(5, 1, 1)
@@ -229,22 +547,25 @@ class Plotter(object):
 
     # select tcp flows only
     df_tcp = df[(df.ip_proto == 6)]
-    label, color, marker = 'tcp', 'b', 'x'
+    # per-label series (a single 'tcp' one for unlabeled flows)
+    series = self.flow_label_series(df_tcp)
     # ax_pps.plot(df_tcp.first_ts, df_tcp.ip_total_pkt,
     #            label=label, linestyle='', marker=marker,
     #            color=color, markersize=3)
 
     # plot TCP flow goodput
-    ax_tcp_rate.plot(df_tcp.first_ts, df_tcp.tcp_goodput_bitrate,
-                     label=label, linestyle='', marker=marker,
-                     color=color, markersize=3)
-    tcp_goodput_quantile_01 = df_tcp.tcp_goodput_bitrate.quantile(q=0.01)
+    density = self.use_density(len(df_tcp))
+    for label, df_label, color, marker in series:
+      self.plot_samples(ax_tcp_rate, df_label.first_ts,
+                        df_label.tcp_goodput_bitrate, color, marker,
+                        label=label, density=density)
+    (tcp_goodput_quantile_01, tcp_goodput_quantile_50,
+     tcp_goodput_quantile_99) = df_tcp.tcp_goodput_bitrate.quantile(
+         q=[0.01, 0.50, 0.99])
     ax_tcp_rate.axhline(y=tcp_goodput_quantile_01, color='g',
                         ls='dotted', lw=0.5)
-    tcp_goodput_quantile_50 = df_tcp.tcp_goodput_bitrate.quantile(q=0.50)
     ax_tcp_rate.axhline(y=tcp_goodput_quantile_50, color='g',
                         ls='dashed', lw=0.5)
-    tcp_goodput_quantile_99 = df_tcp.tcp_goodput_bitrate.quantile(q=0.99)
     ax_tcp_rate.axhline(y=tcp_goodput_quantile_99, color='g',
                         ls='dotted', lw=0.5)
     # zoom on around the median
@@ -255,34 +576,39 @@ class Plotter(object):
                      fontsize='x-small')
 
     # plot flow media delta1
-    ax_delta1.plot(df_tcp.first_ts, df_tcp.delta1_large_median,
-                   linestyle='', marker='x',
-                   color='b', markersize=3)
-    delta1_quantile_01 = df_tcp.delta1_large_median.quantile(q=0.01)
+    for label, df_label, color, marker in series:
+      self.plot_samples(ax_delta1, df_label.first_ts,
+                        df_label.delta1_large_median, color, marker,
+                        density=density)
+    (delta1_quantile_01, delta1_quantile_50,
+     delta1_quantile_99) = df_tcp.delta1_large_median.quantile(
+         q=[0.01, 0.50, 0.99])
     ax_delta1.axhline(y=delta1_quantile_01, color='g', ls='dotted', lw=0.5)
-    delta1_quantile_50 = df_tcp.delta1_large_median.quantile(q=0.50)
     ax_delta1.axhline(y=delta1_quantile_50, color='g', ls='dashed', lw=0.5)
-    delta1_quantile_99 = df_tcp.delta1_large_median.quantile(q=0.99)
     ax_delta1.axhline(y=delta1_quantile_99, color='g', ls='dotted', lw=0.5)
-    # zoom on around the median
-    ax_delta1.set_ylim([0, 10 * delta1_quantile_50])
+    # zoom on around the median (flows may have no delta1 samples in their
+    # large direction)
+    if np.isfinite(delta1_quantile_50):
+      ax_delta1.set_ylim([0, 10 * delta1_quantile_50])
     # add a label with the median
     ax_delta1.text(time_shift, delta1_quantile_50,
                    '%s' % decimal_fmt(delta1_quantile_50, 'sec'),
                    fontsize='x-small')
 
     # plot flow goodput (absolute)
-    ax_tcp_total.plot(df_tcp.first_ts, df_tcp.tcp_goodput_bytes,
-                      label=label, linestyle='', marker=marker,
-                      color=color, markersize=3)
+    for label, df_label, color, marker in series:
+      self.plot_samples(ax_tcp_total, df_label.first_ts,
+                        df_label.tcp_goodput_bytes, color, marker,
+                        label=label, density=density)
     tcp_bytes_quantile_50 = df_tcp.tcp_goodput_bytes.quantile(q=0.50)
     ax_tcp_total.axhline(y=tcp_bytes_quantile_50, color='g',
                          ls='dashed', lw=0.5)
     tcp_extra_percent = ((df_tcp.tcp_bytes - df_tcp.tcp_goodput_bytes) /
                          df_tcp.tcp_goodput_bytes)
-    ax_tcp_extra_bytes.plot(df_tcp.first_ts, tcp_extra_percent,
-                            label=label, linestyle='', marker=marker,
-                            color=color, markersize=3)
+    for label, df_label, color, marker in series:
+      self.plot_samples(ax_tcp_extra_bytes, df_label.first_ts,
+                        tcp_extra_percent[df_label.index], color, marker,
+                        label=label, density=density)
     ax_tcp_extra_bytes.axhline(y=0, color='k', ls='solid', lw=0.5)
     ax_tcp_extra_bytes.axhline(y=tcp_extra_percent.mean(), color='g',
                                ls='dashed', lw=0.5)
@@ -312,11 +638,96 @@ class Plotter(object):
     ax_tcp_extra_bytes.set_ylabel('Flow Extra\nTCP Bytes (%)')
     # ax_ip_rate.set_ylabel('Flow IP Throughput (Mbps)')
     # ax_tcp_total.legend()
+    if len(series) > 1:
+      ax_tcp_rate.legend(prop={'size': 'xx-small'})
     ax_tcp_rate.set_title(self._plot_title)
-    plt.savefig(self._outfile, format=self._plot_format)
 
-  def packet_process_data(self, df):
-    """Process a pandas dataframe (packet mode)."""
+  def flow_label_series(self, df_tcp):
+    """Split the tcp flows into per-label series (flow mode).
+
+    The labels with the most flows get their own color/marker, and the
+    rest are aggregated. Each series label summarizes its flows.
+
+    Args:
+      df_tcp: tcp flow dataframe
+
+    Returns:
+      a list of (label, dataframe, color, marker) tuples (a single 'tcp'
+      series if the flows are not labeled).
+    """
+    labels = self.flow_match_labels(df_tcp)
+    if labels is None:
+      return [('tcp', df_tcp, 'b', 'x')]
+    # most flows first
+    counts = labels.value_counts()
+    separate = list(counts.index[:MAX_SEPARATE_LABELS])
+    if len(counts) > MAX_SEPARATE_LABELS:
+      separate = separate[:-1]
+    groups = [(name, (labels == name).values, IP_CONN_COLOR_D[i])
+              for i, name in enumerate(separate)]
+    if len(separate) < len(counts):
+      groups.append(('remaining', (~labels.isin(separate)).values,
+                     IP_CONN_COLOR_D['remaining']))
+    series = []
+    for name, selected, (color, marker) in groups:
+      df_label = df_tcp[selected]
+      series.append(('%s (%i flows, %s)' % (
+          name, len(df_label),
+          decimal_fmt(df_label.tcp_goodput_bitrate.median(), 'bps')),
+                     df_label, color, marker))
+    return series
+
+  def packet_process_data(self, df, summary=None):
+    """Process a pandas dataframe (packet mode).
+
+    Args:
+      df: packet dataframe
+      summary: histogram summary (see hdr_histogram.read_summary()). If
+          present, the distributions are drawn from it, and df only needs
+          the time series samples.
+    """
+    # split the data depending on the direction
+    df['dir'] = self.match_direction(df.src)
+    if self._prefix_labels is not None:
+      # one plot per label
+      df['label'] = self.match_labels(df.src, df.dst)
+      top = (self.read_top_connections() if self._top_connections > 0
+             else None)
+      for label, df_label in df.groupby('label', observed=True):
+        self.packet_plot_df(df_label, top=top, label=label)
+        plt.close()
+      return
+    self.packet_plot_df(df, summary,
+                        top=(self.read_top_connections()
+                             if self._top_connections > 0 else None))
+
+  def packet_plot_df(self, df, summary=None, top=None, label=None):
+    """Plot a packet dataframe with a 'dir' column.
+
+    Args:
+      df: packet dataframe
+      summary: histogram summary (see packet_process_data())
+      top: heaviest connections to plot separately (see
+          read_top_connections())
+      label: subnet label of the samples (None if not faceted)
+    """
+    # get all the stats in a single pass
+    stats = self.packet_group_stats(df)
+    if summary is not None:
+      stats.update(self.packet_summary_stats(summary))
+    # get the samples of the heaviest connections
+    conn_series = None
+    if top is not None:
+      conn_series = self.packet_connection_series(df, top)
+    self.packet_plot_stats(stats, conn_series, label)
+
+  def packet_plot_stats(self, stats, conn_series=None, label=None):
+    """Plot the per-(type, dir, traffic) stats (packet mode)."""
+    self.packet_draw_stats(stats, conn_series, label)
+    plt.savefig(self.facet_outfile(label), format=self._plot_format)
+
+  def packet_draw_stats(self, stats, conn_series=None, label=None):
+    """Draw the per-(type, dir, traffic) stats (without saving them)."""
     # create the matplotlib figure
     fig = plt.figure(figsize=(9, 7))
     fig.subplots_adjust(hspace=.4)
@@ -331,30 +742,16 @@ class Plotter(object):
         ((1, 1), 'delta4', 'distro', 'ack'),
     ]
 
-    # split the data depending on the direction
-    def match_direction(reverse, x):
-      addr = x['src']
-      if ':' in addr:
-        addr, _ = addr.split(':', 1)
-      if not reverse or not addr.startswith(reverse):
-        return 'fwd'
-      else:
-        return 'rev'
-    bound_match_direction = partial(match_direction, self._src_reverse)
-    df['dir'] = df.apply(bound_match_direction, axis=1)
-
     ax = {}
     subplot_spec = {}
     for (position, delta, graph, traffic) in layout:
       ax[delta] = {}
       subplot_spec[delta] = {}
-      # get the data frame to analyze here
-      data = {}
-      for direction in ('fwd', 'rev'):
-        data[direction] = df[(df.dir == direction) & (df.type == delta)]
-        if delta == 'delta4':
-          # remove the heads of the trains (hystart_ack_delta in tcp_cubic.c)
-          data[direction] = data[direction][(data[direction].delta < 0.002)]
+      # get the stats to plot here
+      data = collections.OrderedDict()
+      for direction in DIRECTIONS:
+        data[direction] = stats.get((delta, direction, traffic),
+                                    self.EMPTY_STATS)
       # print the data frames
       # ax[delta][graph] = fig.add_subplot(4, 2, position)
       subplot_spec[delta][graph] = outer_grid[position[0], position[1]]
@@ -363,43 +760,166 @@ class Plotter(object):
       if graph == 'time':
         # print the time series
         ax[delta][graph] = self.add_timeseries_graph(
-            delta, ax[delta][graph], subplot_spec[delta][graph], data)
+            delta, ax[delta][graph], subplot_spec[delta][graph], data,
+            conn_series.get(delta, []) if conn_series else [])
       elif graph == 'distro':
         # print the distribution
         self.add_distribution_graph(delta, ax[delta][graph], data, traffic)
 
     # main title
-    plt.suptitle(self._plot_title, fontsize='x-small')
-
-    # synchronize the y axes for delta1 and delta2
-    ymin_l = []
-    ymax_l = []
-    for delta in ('delta1', 'delta2'):
-      for vax in ax[delta]['time']:
-        ymin, ymax = vax.get_ylim()
-        ymin_l.append(ymin)
-        ymax_l.append(ymax)
-    ymin = min(ymin_l)
-    ymax = max(ymax_l)
-    for delta in ('delta1', 'delta2'):
-      for vax in ax[delta]['time']:
-        vax.set_ylim(ymin, ymax)
-    # add the legend
-    ax['delta1']['time'][1].legend(prop={'size': 'xx-small'})
+    plt.suptitle(self.facet_title(label), fontsize='x-small')
 
-    plt.savefig(self._outfile, format=self._plot_format)
+    # synchronize the y axes for delta1 and delta2 (a selection may leave
+    # some of them without data)
+    time_axes = [ax[delta]['time'] for delta in ('delta1', 'delta2')
+                 if ax[delta]['time'] is not None]
+    if time_axes:
+      ymin = min(vax.get_ylim()[0] for axes in time_axes for vax in axes)
+      ymax = max(vax.get_ylim()[1] for axes in time_axes for vax in axes)
+      for axes in time_axes:
+        for vax in axes:
+          vax.set_ylim(ymin, ymax)
+      # add the legend
+      time_axes[0][1].legend(prop={'size': 'xx-small'})
+
+  def packet_export_html(self, df):
+    """Write a zoomable html viewer with pre-aggregated time series."""
+    df['dir'] = self.match_direction(df.src)
+    self.packet_write_html(df)
+
+  def packet_write_html(self, df):
+    """Write the html viewer of a dataframe with a 'dir' column."""
+    df = df[df.type.isin(DIR_CONN_COLOR_D.keys())]
+    if df.empty:
+      sys.stderr.write('warning: no samples to export\n')
+      t_min = t_max = 0.
+    else:
+      t_min = df.timestamp.min()
+      t_max = df.timestamp.max()
+    series = []
+    for (delta, direction), group in df.groupby(['type', 'dir'],
+                                                observed=True):
+      color, _ = DIR_CONN_COLOR_D[delta][direction]
+      pyramid = tile_pyramid.build_pyramid(group.timestamp.values,
+                                           group.delta.values, t_min, t_max)
+      series.append((delta, direction, color, pyramid))
+    # we cannot use controlled execution (`with open(...) as f:`) as we want
+    # to support sys.stdout too.
+    f = (open(self._outfile, 'w') if self._outfile != sys.stdout else
+         sys.stdout)
+    try:
+      tile_pyramid.write_html(f, self._plot_title, t_min, t_max, series)
+    finally:
+      if self._outfile != sys.stdout:
+        f.close()
+
+  EMPTY_STATS = SampleStats(np.array([]), np.array([]), 0, 0)
 
-  def add_timeseries_graph(self, delta, _, subplot_spec, data):
+  def packet_group_stats(self, df):
+    """Compute the stats of every (type, dir, traffic) group."""
+    df = df[(df.type != 'delta4') | (df.delta < DELTA4_MAX_VALUE)]
+    return group_stats(df, ['type', 'dir', 'traffic'], NUM_MEAN_MARKERS,
+                       NUM_BINS)
+
+  def packet_summary_stats(self, summary):
+    """Compute the distribution stats of every group in a summary."""
+    stats = {}
+    for key, histogram in summary['histograms'].iteritems():
+      delta, _, _ = key
+      if delta not in DISTRIBUTION_DELTAS:
+        continue
+      if delta == 'delta4':
+        histogram = histogram.truncated(DELTA4_MAX_VALUE)
+      stats[key] = HistogramStats(histogram, NUM_BINS)
+    return stats
+
+  def read_top_connections(self):
+    """Read the heaviest connections from the end of the input file.
+
+    Returns:
+      a list of (src, dst) pairs, heaviest first.
+    """
+    if self._infile == sys.stdin or self._store is not None:
+      sys.stderr.write('warning: top connections unavailable from stdin '
+                       'and trace stores\n')
+      return []
+    top = []
+    with open(self._infile, 'r') as f:
+      f.seek(0, 2)
+      f.seek(max(0, f.tell() - TOP_TAIL_BYTES))
+      for line in f:
+        if not line.startswith(TOP_LINE_PREFIX):
+          continue
+        metric, rank, _, src, dst, _, _ = line[len(TOP_LINE_PREFIX):].split()
+        if metric == self._top_metric:
+          top.append((int(rank), src, dst))
+    if not top and self._debug >= 0:
+      sys.stderr.write('warning: no top connections in %s\n' % self._infile)
+    return [(src, dst) for _, src, dst in sorted(top)[:self._top_connections]]
+
+  def match_connections(self, df, connections):
+    """Find the rows that belong to the given connections.
+
+    Args:
+      df: packet dataframe (with categorical src and dst columns)
+      connections: list of (src, dst) pairs
+
+    Returns:
+      a numpy array with the connection index of each row (-1 for rows
+      in other connections). Both directions of a connection match.
+    """
+    src_codes = pd.Index(df.src.cat.categories).get_indexer
+    dst_codes = pd.Index(df.dst.cat.categories).get_indexer
+    # a unique key per (src, dst) code pair
+    width = len(df.dst.cat.categories) + 1
+    row_key = (df.src.cat.codes.values.astype(np.int64) * width +
+               df.dst.cat.codes.values)
+    conn_key = {}
+    for i, (src, dst) in enumerate(connections):
+      for a, b in ((src, dst), (dst, src)):
+        a_code, = src_codes([a])
+        b_code, = dst_codes([b])
+        if a_code >= 0 and b_code >= 0:
+          conn_key[a_code * width + b_code] = i
+    conn_index = np.full(len(df), -1, dtype=np.int64)
+    if conn_key:
+      keys = np.array(sorted(conn_key), dtype=np.int64)
+      pos = np.minimum(np.searchsorted(keys, row_key), len(keys) - 1)
+      found = keys[pos] == row_key
+      conn_index[found] = [conn_key[k] for k in keys[pos[found]]]
+    return conn_index
+
+  def packet_connection_series(self, df, connections):
+    """Select the samples of the given connections (packet mode).
+
+    Args:
+      df: packet dataframe
+      connections: list of (src, dst) pairs
+
+    Returns:
+      a dictionary mapping each delta to a list of (index, label,
+      timestamp, value) tuples, one per connection.
+    """
+    conn_index = self.match_connections(df, connections)
+    selected = conn_index >= 0
+    df = df[selected].assign(conn=conn_index[selected])
+    conn_series = collections.defaultdict(list)
+    for (delta, i), group in df.groupby(['type', 'conn'], observed=True):
+      src, dst = connections[i]
+      conn_series[delta].append((i, '%s-%s' % (src, dst),
+                                 group.timestamp.values, group.delta.values))
+    return conn_series
+
+  def add_timeseries_graph(self, delta, _, subplot_spec, data,
+                           connections=()):
     """Print the time series."""
     total_line = '%s' % delta
     time_shift = {}
 
     # ensure there is at least some non-empty dataframes
-    # pylint: disable=g-explicit-length-test
-    if all([len(df) == 0 for df in data.values()]):
+    if all([stats.count == 0 for stats in data.values()]):
       print 'error: no actual data for %s' % delta
       return
-    # pylint: enable=g-explicit-length-test
 
     # split the plot in 2 uneven parts
     inner_grid = gridspec.GridSpecFromSubplotSpec(1, 5, subplot_spec)
@@ -409,50 +929,31 @@ class Plotter(object):
     axr = plt.subplot(inner_grid[0, 1:])
     axr.yaxis.set_ticks_position('right')
     axr.tick_params(labeltop='off', labelright='off')
+    density = self.use_density(sum(stats.count for stats in data.values()))
 
-    for i in range(len(data)):
-      df_local = data.values()[i]
-      if len(df_local) == 0:  # pylint: disable=g-explicit-length-test
+    for direction, stats in data.iteritems():
+      if stats.count == 0:
         continue
-      direction = data.keys()[i]
       color, marker = DIR_CONN_COLOR_D[delta][direction]
 
       # get the time series label
       label = '%s "src %s %s"' % (direction, '==' if direction == 'rev'
                                   else '!=', self._src_reverse)
       # get x-axis shift
-      time_shift[direction] = float(df_local[:1].timestamp)
-      df_all = df_local
-
-      # for (src, dst, color, marker) in separate_conn_l:
-      #   df_conn = df_all[(df_all.src == src) & (df_all.dst == dst)]
-      #   label = '%s->%s' % (df_conn.src.iloc[0], df_conn.dst.iloc[0])
-      #   ax[delta]['time'].plot(df_conn.timestamp, df_conn.delta,
-      #                          label=label, linestyle='-', marker=marker,
-      #                          color=color, markersize=3)
-      #   # remove the connection
-      #   df_all = df_all[(df_all.src != src) | (df_all.dst != dst)]
+      time_shift[direction] = stats.first_ts
 
       # print the time series
-      axr.plot(df_all.timestamp, df_all.delta,
-               linestyle='', marker=marker,
-               label=label,
-               color=color, markersize=3)
+      self.plot_samples(axr, stats.timestamp, stats.value, color, marker,
+                        label=label, density=density)
 
-      # calculate and plot the per-second averages
-      x_l = []
-      y_l = []
-      for d in np.array_split(df_all, NUM_MEAN_MARKERS):
-        if len(d) == 0:  # pylint: disable=g-explicit-length-test
-          continue
-        x_l.append(d.timestamp.mean())
-        y_l.append(d.delta.mean())
+      # plot the per-chunk averages
+      x_l, y_l = stats.mean_markers
       axr.plot(x_l, y_l, color='w', marker='*', markeredgecolor=color)
 
-      # calculate the delta percentiles
-      delta_quantile_50 = df_local.delta.quantile(q=0.50)
-      delta_mean = df_local.delta.mean()
-      delta_stddev = df_local.delta.std()
+      # get the delta percentiles
+      delta_quantile_50 = stats.quantile[0.50]
+      delta_mean = stats.mean
+      delta_stddev = stats.std
 
       # print delta percentile lines
       axr.axhline(y=delta_quantile_50, color=color, ls='dashed', lw=0.5)
@@ -463,40 +964,14 @@ class Plotter(object):
           decimal_fmt(delta_quantile_50, 'sec'),
           decimal_fmt(delta_stddev, 'sec'))
 
-    # print a boxplot
-    bp_data = [df['delta'] for df in data.values()]
-    bp = axl.boxplot(bp_data, sym='k+',
-                     notch=True,
-                     bootstrap=5000,
-                     patch_artist=True)
-
-    # change the names of the distro ticks
-    plt.setp(axl, xticklabels=data.keys())
-
-    # mark the medians in white
-    plt.setp(bp['medians'], color='white')
-    # add a mark for the average (mean)
-    for i in range(len(data.values())):
-      df_local = data.values()[i]
-      if len(df_local) == 0:  # pylint: disable=g-explicit-length-test
-        continue
-      med = bp['medians'][i]
-      delta_mean = df_local.delta.mean()
-      axl.plot([np.average(med.get_xdata())], [delta_mean],
-               color='w', marker='*', markeredgecolor='k')
+    # print the heaviest connections on top
+    for i, label, timestamp, value in connections:
+      color, marker = IP_CONN_COLOR_D.get(i, IP_CONN_COLOR_D['remaining'])
+      axr.plot(timestamp, value, label=label, linestyle='', marker=marker,
+               color=color, markersize=3)
 
-    i = 0
-    for obj in bp['boxes']:
-      direction = data.keys()[i]
-      color, marker = DIR_CONN_COLOR_D[delta][direction]
-      plt.setp(obj, color=color)
-      i += 1
-    i = 0
-    for obj in bp['whiskers'] + bp['caps']:
-      direction = data.keys()[(i / 2) % 2]
-      color, marker = DIR_CONN_COLOR_D[delta][direction]
-      plt.setp(obj, color=color, ls='solid', lw=0.5)
-      i += 1
+    # print a boxplot (using the precomputed stats)
+    self.add_boxplot_graph(delta, axl, data)
 
     # shift x axis
     min_time_shift = min(time_shift.values())
@@ -505,12 +980,10 @@ class Plotter(object):
     axr.xaxis.set_major_formatter(format_shift)
     xticks = axr.get_xticks() + (min_time_shift - int(min_time_shift))
     axr.set_xticks(xticks)
-    # pylint: disable=g-explicit-length-test
-    xmin = min([(float(d.timestamp[:1]) if len(d) > 0 else float('nan'))
-                for d in data.values()])
-    xmax = max([(float(d.timestamp[-1:]) if len(d) > 0 else float('nan'))
-                for d in data.values()])
-    # pylint: enable=g-explicit-length-test
+    xmin = min([stats.first_ts for stats in data.values()
+                if stats.count > 0])
+    xmax = max([stats.last_ts for stats in data.values()
+                if stats.count > 0])
     extra_space = (xmax - xmin) * .05 / 2
     axr.set_xlim(xmin - extra_space, xmax + extra_space)
 
@@ -524,17 +997,98 @@ class Plotter(object):
     axr.tick_params(axis='both', which='minor', labelsize=8)
     return (axl, axr)
 
+  def add_boxplot_graph(self, delta, ax, data):
+    """Print a per-direction boxplot (using the precomputed stats)."""
+    bp_directions = [direction for direction, stats in data.iteritems()
+                     if stats.count > 0]
+    bp = ax.bxp([data[direction].box for direction in bp_directions],
+                positions=[data.keys().index(direction) + 1
+                           for direction in bp_directions],
+                flierprops={'marker': '+', 'markeredgecolor': 'k',
+                            'linestyle': 'none'},
+                shownotches=True,
+                patch_artist=True)
+
+    # change the names of the distro ticks
+    ax.set_xlim(0.5, len(data) + 0.5)
+    ax.set_xticks(range(1, len(data) + 1))
+    plt.setp(ax, xticklabels=data.keys())
+
+    # mark the medians in white
+    plt.setp(bp['medians'], color='white')
+    # add a mark for the average (mean)
+    for i, direction in enumerate(bp_directions):
+      med = bp['medians'][i]
+      ax.plot([np.average(med.get_xdata())], [data[direction].mean],
+              color='w', marker='*', markeredgecolor='k')
+
+    for i, direction in enumerate(bp_directions):
+      color, marker = DIR_CONN_COLOR_D[delta][direction]
+      plt.setp(bp['boxes'][i], color=color)
+      for obj in (bp['whiskers'][2 * i:2 * i + 2] +
+                  bp['caps'][2 * i:2 * i + 2]):
+        plt.setp(obj, color=color, ls='solid', lw=0.5)
+
+  def use_density(self, num_points):
+    """Whether to render `num_points` samples as a density image."""
+    if self._density == 'auto':
+      return num_points > DENSITY_MIN_POINTS
+    return self._density == 'on'
+
+  def plot_samples(self, ax, x, y, color, marker, label=None, density=False):
+    """Plot a set of samples as a scatter plot.
+
+    In density mode, the samples are binned into a 2D histogram that is
+    drawn as a rasterized image with log color scaling. Rendering time and
+    output size then do not depend on the number of samples.
+
+    Args:
+      ax: axes to plot into
+      x: x values (series or array)
+      y: y values (series or array)
+      color: sample color
+      marker: sample marker (scatter mode only)
+      label: series label
+      density: whether to use density mode
+    """
+    if not density:
+      ax.plot(x, y, label=label, linestyle='', marker=marker,
+              color=color, markersize=3)
+      return
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x = x[valid]
+    y = y[valid]
+    # pylint: disable=g-explicit-length-test
+    if len(x) == 0:
+      return
+    # pylint: enable=g-explicit-length-test
+    extent = []
+    for v in (x, y):
+      vmin, vmax = v.min(), v.max()
+      if vmin == vmax:
+        vmin, vmax = vmin - 0.5, vmax + 0.5
+      extent += [vmin, vmax]
+    counts, _, _ = np.histogram2d(x, y, bins=DENSITY_BINS,
+                                  range=[extent[0:2], extent[2:4]])
+    # empty bins are transparent, so several series can share the axes
+    cmap = colors.LinearSegmentedColormap.from_list(
+        'density_%s' % color,
+        [colors.to_rgba(color, 0.2), colors.to_rgba(color, 1.0)])
+    cmap.set_bad((0, 0, 0, 0))
+    ax.imshow(np.ma.masked_equal(counts.T, 0), origin='lower',
+              extent=extent, aspect='auto', interpolation='nearest',
+              cmap=cmap, norm=colors.LogNorm(vmin=1, vmax=counts.max()),
+              rasterized=True)
+    # legend proxy
+    ax.plot([], [], label=label, linestyle='', marker='s', color=color)
+
   def add_distribution_graph(self, delta, ax, data, traffic):
     """Print the time series."""
-    for i in range(len(data)):
-      df_local = data.values()[i]
-      if traffic != '-':
-        df_local = df_local[df_local.traffic == traffic]
-      # pylint: disable=g-explicit-length-test
-      if len(df_local.delta.values) == 0:
+    for direction, stats in data.iteritems():
+      if stats.count == 0:
         continue
-      # pylint: enable=g-explicit-length-test
-      direction = data.keys()[i]
       color, _ = DIR_CONN_COLOR_D[delta][direction]
 
       # # 1. print the head distro
@@ -546,14 +1100,15 @@ class Plotter(object):
       #   # set the xlim before adding the percentiles
       #   ax[delta]['head'].set_xlim(0, bins[-1])
 
-      # 2. print the tail distro
-      _, _, _ = ax.hist(df_local.delta.values, NUM_BINS,
+      # 2. print the tail distro (from the precomputed histogram)
+      n, bins = stats.histogram
+      _, _, _ = ax.hist(bins[:-1], bins, weights=n,
                         histtype='step', cumulative=False,
                         color=color)
 
-      # 3. calculate the delta percentiles
-      delta_quantile_50 = df_local.delta.quantile(q=0.50)
-      delta_quantile_99 = df_local.delta.quantile(q=0.99)
+      # 3. get the delta percentiles
+      delta_quantile_50 = stats.quantile[0.50]
+      delta_quantile_99 = stats.quantile[0.99]
 
       # print the delta percentile lines
       ax.axvline(x=delta_quantile_50, color=color, ls='dashed', lw=0.5)
@@ -606,24 +1161,3 @@ class Plotter(object):
     #                                fontsize='x-small')
     # ax[delta]['length'].set_ylabel('min %s time (secs)' % delta,
     #                                fontsize='x-small')
-
-  def get_most_popular_connections(self, df, delta, max_conn):
-    """Select the `max_conn` most popular connections based on `delta`."""
-    separate_conn_l = []
-    i = 0
-    df_all = df
-    for i in range(max_conn):
-      if len(df_all) < 1:
-        break
-      order = df_all[delta].argmax()
-      src = df_all.src[order]
-      dst = df_all.dst[order]
-      try:
-        color, marker = IP_CONN_COLOR_D[i]
-      except KeyError:
-        color, marker = IP_CONN_COLOR_D['remaining']
-      separate_conn_l += [[src, dst, color, marker]]
-      # remove the connection
-      df_all = df_all[(df_all.src != src) | (df_all.dst != dst)]
-      i += 1
-    return separate_conn_l
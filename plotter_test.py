@@ -0,0 +1,205 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""Unit tests for plotter.py."""
+
+import cStringIO
+import os
+import shutil
+import tempfile
+import unittest
+
+# plot without a display
+os.environ.setdefault('MPLBACKEND', 'Agg')
+# pylint: disable=g-import-not-at-top,g-bad-import-order
+import matplotlib.pyplot as plt
+import numpy as np
+import plotter
+from plotter import Plotter
+
+
+PACKET_LINES = """\
+#type src dst timestamp delta other
+delta1 1000.000000 10.0.0.1:80 192.168.1.1:40000 0.010000 -
+delta4 1000.500000 10.0.0.1:80 192.168.1.1:40000 0.001000 data
+truncated line
+delta1 1001.000000 192.168.1.1:40000 10.0.0.1:80 - -
+evicted 1002.000000 10.0.0.1:80 192.168.1.1:40000 3 delta1
+# a comment
+delta2 1003.000000 192.168.1.1:40000 10.0.0.1:80 0.100000 -
+"""
+
+# the flow format before the retransmission and label columns
+FLOW_LINES = (
+    '#connhash first_ts last_ts ip_proto ...\n'
+    '10.0.0.1:80-192.168.1.1:40000-6 1000.000000 1010.000000 6 None 12345 '
+    '100 150000 10.000000 120000.000000 140000 130000 104000.000000 '
+    '0.010000 0.010000 0.100000 0.100000 0 2\n'
+    '10.0.0.1:80-192.168.1.2:40000-6 1000.000000 1000.000000 6 None None '
+    '1 60 - - 0 0 - - - - - 0 0\n'
+    'truncated line\n'
+    '10.0.0.1:80-192.168.1.3:40000-17 1005.000000 1006.000000 17 None None '
+    '2 200 2.000000 1600.000000 0 0 0.000000 nan nan nan nan 0 0\n')
+
+
+def old_read(text, columns):
+  """Parses an analysis file as the (pre-C-parser) line parser did.
+
+  Lines without all the fields, comments, and lines with missing ('-')
+  values are skipped.
+  """
+  rows = []
+  for line in text.splitlines():
+    fields = line.split()
+    if len(fields) != len(columns) or line[0] == '#' or '-' in [
+        value for value, (_, dtype) in zip(fields, columns)
+        if dtype == np.float64]:
+      continue
+    rows.append([int(value) if dtype == np.int64 else
+                 float(value) if dtype == np.float64 else value
+                 for value, (_, dtype) in zip(fields, columns)])
+  return rows
+
+
+class PlotterTest(unittest.TestCase):
+
+  def read_table(self, text, columns):
+    return Plotter(None, None, 'packet', None, '', None, -1).read_table(
+        cStringIO.StringIO(text), columns)
+
+  def assertRowsEqual(self, expected, df):
+    self.assertEqual(len(expected), len(df))
+    for expected_row, row in zip(expected, df.itertuples(index=False)):
+      for expected_value, value in zip(expected_row, row):
+        if isinstance(expected_value, float):
+          np.testing.assert_allclose(expected_value, value)
+        else:
+          self.assertEqual(expected_value, value)
+
+  def testReadPacketTable(self):
+    df = self.read_table(PACKET_LINES, plotter.PACKET_COLUMNS)
+    self.assertEqual(
+        ['category', 'float64', 'category', 'category', 'float64',
+         'category'], [str(dtype) for dtype in df.dtypes])
+    # the missing delta is kept (as nan) for the caller to discard
+    self.assertEqual(5, len(df))
+    self.assertTrue(np.isnan(df.delta.iloc[2]))
+    self.assertRowsEqual(old_read(PACKET_LINES, plotter.PACKET_COLUMNS),
+                         df[df.delta.notnull()])
+
+  def testReadFlowTable(self):
+    df = self.read_table(FLOW_LINES, plotter.FLOW_COLUMNS)
+    self.assertEqual(3, len(df))
+    for name, dtype in plotter.FLOW_COLUMNS:
+      self.assertEqual(np.dtype(dtype), df[name].dtype, name)
+    self.assertEqual('None', df.tcp_seq_syn_sport.iloc[0])
+    self.assertTrue(np.isnan(df.pps.iloc[1]))
+    self.assertTrue(np.isnan(df.delta1_small_mean.iloc[2]))
+    # (older files have no retransmission or label columns)
+    self.assertTrue(df.tcp_holes.isnull().all())
+    self.assertTrue(df.label.isnull().all())
+    old_columns = plotter.FLOW_COLUMNS[:19]
+    self.assertRowsEqual(old_read(FLOW_LINES, old_columns),
+                         df[df.pps.notnull()][[name for name, _ in
+                                               old_columns]])
+
+  def testReadInvalidValues(self):
+    # non-numeric values are discarded (as missing values)
+    df = self.read_table(PACKET_LINES + 'delta1 1004.000000 a b x -\n',
+                         plotter.PACKET_COLUMNS)
+    self.assertEqual('float64', str(df.delta.dtype))
+    self.assertEqual('category', str(df.src.dtype))
+    self.assertEqual(6, len(df))
+    self.assertTrue(np.isnan(df.delta.iloc[5]))
+    self.assertRowsEqual(old_read(PACKET_LINES, plotter.PACKET_COLUMNS),
+                         df[df.delta.notnull()])
+
+  def testUseDensity(self):
+    for density, expected in (('auto', [False, True]), ('on', [True, True]),
+                              ('off', [False, False])):
+      p = Plotter(None, None, 'packet', None, '', None, -1, density=density)
+      self.assertEqual(expected, [
+          p.use_density(plotter.DENSITY_MIN_POINTS),
+          p.use_density(plotter.DENSITY_MIN_POINTS + 1)], density)
+
+  def plot_density(self, x, y):
+    """Plots the samples in density mode, and returns the axes."""
+    fig, ax = plt.subplots()
+    self.addCleanup(plt.close, fig)
+    Plotter(None, None, 'packet', None, '', None, -1).plot_samples(
+        ax, x, y, 'b', '.', label='fwd', density=True)
+    # (and renders them)
+    out = cStringIO.StringIO()
+    fig.savefig(out, format='png')
+    self.assertTrue(out.tell() > 0)
+    return ax
+
+  def testDensitySamples(self):
+    x = np.linspace(0., 10., 1000)
+    y = np.append(np.sin(x[:-1]), np.nan)
+    ax = self.plot_density(x, y)
+    image, = ax.get_images()
+    self.assertEqual((plotter.DENSITY_BINS[1], plotter.DENSITY_BINS[0]),
+                     image.get_array().shape)
+    # every valid sample is in a bin
+    self.assertEqual(999, image.get_array().sum())
+    np.testing.assert_allclose([0., x[-2], y[:-1].min(), y[:-1].max()],
+                               image.get_extent())
+    self.assertEqual(['fwd'], [line.get_label() for line in ax.get_lines()])
+
+  def testDensityDegenerateSamples(self):
+    # all-equal values get a unit-wide range
+    ax = self.plot_density([5.] * 100, [.1] * 100)
+    image, = ax.get_images()
+    self.assertEqual(100, image.get_array().sum())
+    self.assertEqual(1, image.get_array().count())
+    np.testing.assert_allclose([4.5, 5.5, -.4, .6], image.get_extent())
+    # no valid samples: nothing is drawn
+    ax = self.plot_density([np.nan] * 10, range(10))
+    self.assertEqual([], ax.get_images())
+
+  def testDensityPlot(self):
+    tmpdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tmpdir)
+    for name, value in (('trace', lambda i: .001 * (1 + i % 10)),
+                        ('constant', lambda i: .01)):
+      infile = os.path.join(tmpdir, '%s.txt' % name)
+      with open(infile, 'w') as f:
+        for i in range(200):
+          f.write('delta1 %f 10.0.0.1:80 192.168.1.1:40000 %f -\n' % (
+              1000. + i * .5, value(i)))
+      outfile = os.path.join(tmpdir, '%s.png' % name)
+      Plotter(infile, outfile, 'packet', 'png', '', None, -1,
+              density='on').run()
+      self.assertTrue(os.path.getsize(outfile) > 0, name)
+
+  def testExportEmptyHtml(self):
+    tmpdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tmpdir)
+    outfile = os.path.join(tmpdir, 'empty.html')
+    p = Plotter(None, outfile, 'packet', 'html', '', '10.0.0.0/8', -1)
+    # no samples left (e.g. after a time range selection)
+    df = self.read_table('# no samples\n', plotter.PACKET_COLUMNS)
+    self.assertEqual(0, len(df))
+    p.packet_export_html(df)
+    with open(outfile) as f:
+      self.assertIn('"series": []', f.read())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,214 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Analysis profiler (`analyze --profile`).
+
+The profiler times the stages of the analysis pipeline by wrapping the
+methods that implement them, on the profiled objects only:
+
+  tshark_wait:     waiting for tshark output (PacketDumper)
+  parse:           PacketDumper.parse_line()
+  process:         TraceInfo.process_packet() (includes the stages below)
+  flow_lookup:     connection hashing and lookup (TraceInfo)
+  eviction:        in-flight segment eviction (TraceInfo)
+  flow_accounting: ConnectionInfo.flow_process_packet()
+  delta1..delta4:  ConnectionInfo.packet_process_delta*()
+  output:          writing the results (output sink)
+
+Unprofiled runs are not slowed down at all: their methods are not wrapped.
+The profiler also keeps event counters (e.g. discarded lines), and tracks
+gauges (live connections, outstanding segments) and their peaks. The
+report is written as JSON at the end of the run (and, optionally, every
+few seconds), together with an optional cProfile (pstats) dump.
+"""
+
+
+import cProfile
+import collections
+import json
+import os
+import sys
+import time
+import weakref
+
+from common import peak_rss_bytes
+
+
+REPORT_VERSION = 1
+# report order (in pipeline order)
+STAGES = ['tshark_wait', 'parse', 'process', 'flow_lookup', 'eviction',
+          'flow_accounting', 'delta1', 'delta2', 'delta3', 'delta4',
+          'output']
+# gauges are sampled (and the report interval checked) every these packets
+SAMPLE_PACKETS = 1000
+
+
+class Profiler(object):
+  """Per-stage timers, counters, and gauges of an analysis run."""
+
+  def __init__(self, report_file='-', interval=None, pstats_file=None):
+    """Creates a profiler.
+
+    Args:
+      report_file: JSON report file (- for stderr, a line per report)
+      interval: also write the report every these seconds (None for only
+          at the end)
+      pstats_file: cProfile dump file (None for no cProfile)
+    """
+    assert interval is None or interval > 0
+    self._report_file = report_file
+    self._interval = interval
+    self._pstats_file = pstats_file
+    self._cprofile = None
+    # stage -> [calls, seconds]
+    self._timers = collections.OrderedDict()
+    self._counters = collections.defaultdict(int)
+    # gauge -> (weak object reference, method name)
+    self._gauges = collections.OrderedDict()
+    # gauge -> last sampled value, peak sampled value
+    self._values = {}
+    self._peaks = {}
+    self._packets = 0
+    self._start = None
+    self._last_report = None
+
+  def start(self):
+    self._start = self._last_report = time.time()
+    if self._pstats_file is not None:
+      self._cprofile = cProfile.Profile()
+      self._cprofile.enable()
+
+  def stop(self):
+    """Writes the final report (and the pstats dump)."""
+    if self._cprofile is not None:
+      self._cprofile.disable()
+      self._cprofile.dump_stats(self._pstats_file)
+      self._cprofile = None
+    self.sample_gauges()
+    self.write_report(final=True)
+
+  def timed(self, stage, function, obj_ref=None):
+    """Returns a version of function that accounts its time to a stage.
+
+    Args:
+      stage: stage name
+      function: function to time
+      obj_ref: weak reference to pass as first argument (for unbound
+          methods)
+
+    Returns:
+      the timed function.
+    """
+    timer = self._timers.setdefault(stage, [0, 0.])
+    clock = time.time
+
+    def timed_function(*args, **kwargs):
+      start = clock()
+      try:
+        if obj_ref is not None:
+          return function(obj_ref(), *args, **kwargs)
+        return function(*args, **kwargs)
+      finally:
+        timer[1] += clock() - start
+        timer[0] += 1
+    return timed_function
+
+  def instrument(self, obj, stages):
+    """Times some methods of an object (other objects are not affected).
+
+    The wrapped methods only keep a weak reference to the object, so no
+    reference cycles are created (TraceInfo has a __del__ method).
+
+    Args:
+      obj: object to instrument
+      stages: dictionary mapping method names to stage names
+    """
+    obj_ref = weakref.ref(obj)
+    for name, stage in stages.iteritems():
+      method = getattr(obj, name)
+      if getattr(method, 'im_self', None) is obj:
+        # bound method: call the function with a weak self
+        setattr(obj, name, self.timed(stage, method.im_func, obj_ref))
+      else:
+        setattr(obj, name, self.timed(stage, method))
+
+  def count(self, counter, value=1):
+    self._counters[counter] += value
+
+  def add_gauge(self, gauge, obj, method_name):
+    """Tracks the value of obj.method_name() (while obj is alive)."""
+    self._gauges[gauge] = (weakref.ref(obj), method_name)
+
+  def sample_gauges(self):
+    for gauge, (obj_ref, method_name) in self._gauges.iteritems():
+      obj = obj_ref()
+      if obj is None:
+        continue
+      value = getattr(obj, method_name)()
+      self._values[gauge] = value
+      self._peaks[gauge] = max(self._peaks.get(gauge, value), value)
+
+  def tick(self):
+    """Accounts a packet (called by the analysis loop)."""
+    self._packets += 1
+    if self._packets % SAMPLE_PACKETS:
+      return
+    self.sample_gauges()
+    if (self._interval is not None and
+        time.time() - self._last_report >= self._interval):
+      self.write_report()
+
+  def report(self, final=False):
+    """Returns the report (as a JSON-serializable dictionary)."""
+    elapsed = time.time() - self._start if self._start is not None else 0.
+    stages = collections.OrderedDict()
+    order = dict((stage, i) for i, stage in enumerate(STAGES))
+    for stage in sorted(self._timers, key=lambda s: order.get(s, len(order))):
+      calls, seconds = self._timers[stage]
+      stages[stage] = collections.OrderedDict([
+          ('calls', calls),
+          ('seconds', seconds),
+          ('usec_per_call', 1e6 * seconds / calls if calls else None),
+      ])
+    gauges = collections.OrderedDict(
+        (gauge, {'value': self._values.get(gauge),
+                 'peak': self._peaks.get(gauge)})
+        for gauge in self._gauges)
+    return collections.OrderedDict([
+        ('version', REPORT_VERSION),
+        ('final', final),
+        ('time', time.time()),
+        ('elapsed', elapsed),
+        ('packets', self._packets),
+        ('packets_per_sec', self._packets / elapsed if elapsed else None),
+        ('peak_rss_bytes', peak_rss_bytes()),
+        ('stages', stages),
+        ('counters', dict(self._counters)),
+        ('gauges', gauges),
+    ])
+
+  def write_report(self, final=False):
+    """Writes the report (replacing the previous one, if in a file)."""
+    self._last_report = time.time()
+    report = self.report(final)
+    if self._report_file == '-':
+      sys.stderr.write('%s\n' % json.dumps(report))
+      return
+    with open(self._report_file + '.tmp', 'w') as f:
+      json.dump(report, f, indent=2)
+      f.write('\n')
+    os.rename(self._report_file + '.tmp', self._report_file)
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for profiler.py."""
+
+import cStringIO
+import gc
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import weakref
+
+from packet_dumper import PacketDumper
+from profiler import Profiler
+import synthetic_trace
+from trace_info import TraceInfo
+
+
+class ProfilerTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def analyze(self, lines, profiler=None):
+    f = cStringIO.StringIO()
+    packet_dumper = PacketDumper(None, None, None, 'packet', 0,
+                                 profiler=profiler)
+    trace_info = TraceInfo(f, 'packet', profiler=profiler)
+    for line in lines:
+      trace_info.process_packet(packet_dumper.parse_line(line))
+    trace_info.finish()
+    return f.getvalue(), weakref.ref(trace_info)
+
+  def testReport(self):
+    config = synthetic_trace.TraceConfig(packets=2000, flows=4)
+    fields = cStringIO.StringIO()
+    synthetic_trace.write_trace(config, fields_file=fields)
+    lines = fields.getvalue().splitlines(True)
+    path = os.path.join(self._tmpdir, 'profile.json')
+    profiler = Profiler(path)
+    profiler.start()
+    output, trace_info_ref = self.analyze(lines, profiler)
+    profiler.stop()
+    # profiling does not change the results, nor leak the trace
+    self.assertEqual(self.analyze(lines)[0], output)
+    gc.collect()
+    self.assertIsNone(trace_info_ref())
+    with open(path) as f:
+      report = json.load(f)
+    self.assertTrue(report['final'])
+    self.assertEqual(2000, report['packets'])
+    stages = report['stages']
+    for stage in ('parse', 'process', 'delta1', 'delta2', 'delta3', 'delta4',
+                  'flow_accounting'):
+      self.assertEqual(2000, stages[stage]['calls'], stage)
+    # hash and lookup
+    self.assertEqual(4000, stages['flow_lookup']['calls'])
+    # a call per output line (text sinks get no traffic records)
+    self.assertEqual(output.count('\n'), stages['output']['calls'])
+    self.assertTrue(stages['process']['seconds'] >=
+                    stages['delta1']['seconds'])
+    self.assertEqual({'value': 4, 'peak': 4}, report['gauges']['connections'])
+
+  def testCounters(self):
+    profiler = Profiler(os.path.join(self._tmpdir, 'profile.json'))
+    profiler.start()
+    packet_dumper = PacketDumper(None, None, None, 'packet', 0,
+                                 profiler=profiler)
+    self.assertRaises(ValueError, packet_dumper.parse_line, 'bad line\n')
+    trace_info = TraceInfo(cStringIO.StringIO(), 'packet', profiler=profiler)
+    trace_info.process_packet(packet_dumper.parse_line(
+        '1000.000000;1;10.0.0.1;10.0.0.2;84;;;0;0;;;0;;\n'))
+    report = profiler.report()
+    self.assertEqual({'ignored_packets': 1}, report['counters'])
+    # failed calls are timed too
+    self.assertEqual(2, report['stages']['parse']['calls'])
+
+
+if __name__ == '__main__':
+  unittest.main()
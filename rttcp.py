@@ -15,16 +15,35 @@
 # limitations under the License.
 
 
-"""Simple tcp flow aggregation."""
+"""Simple tcp flow aggregation.
+
+Note that the subcommand modules (and the heavy libraries they need, like
+numpy, pandas, or matplotlib) are only imported when the subcommand runs,
+so that short invocations start fast.
+"""
 
 
 import argparse
+import glob
+import os
 import os.path
 import sys
 
 from common import __version__
-from packet_dumper import PacketDumper
-from plotter import Plotter
+from common import CONN_IDLE_TIMEOUT_SECS
+from common import DENSITY_MODES
+from common import MAX_CONN_SEGMENTS
+from common import MAX_TRACE_SEGMENTS
+from common import METRICS_PORT
+from common import parse_time_range
+from common import QUERY_AGGREGATES
+from common import QUERY_GROUPS
+from common import REORDER_WINDOW_SECS
+from common import SEGMENT_HORIZON_SECS
+from common import SERVE_MAX_QUEUE
+from common import SERVE_PORT
+from common import SERVE_SOCKET
+from common import TOP_METRICS
 
 
 def get_options(argv):
@@ -46,6 +65,18 @@ def get_options(argv):
   parser_anal.set_defaults(subcommand='analyze')
   parser_plot = subparsers.add_parser('plot', help='plot analysis file')
   parser_plot.set_defaults(subcommand='plot')
+  parser_serve = subparsers.add_parser('serve', help='run analyze and plot '
+                                       'jobs from a local socket')
+  parser_serve.set_defaults(subcommand='serve')
+  parser_export = subparsers.add_parser('export', help='serve the metrics '
+                                        'of a (live) pcap file')
+  parser_export.set_defaults(subcommand='export')
+  parser_ingest = subparsers.add_parser('ingest', help='load analysis '
+                                        'files into a trace store')
+  parser_ingest.set_defaults(subcommand='ingest')
+  parser_query = subparsers.add_parser('query', help='aggregate the '
+                                       'traces of a trace store')
+  parser_query.set_defaults(subcommand='query')
   # common arguments
   for p in (parser, parser_anal, parser_plot):
     p.add_argument('-d', '--debug', action='count',
@@ -60,9 +91,10 @@ def get_options(argv):
                    default='tshark',
                    metavar='TSHARK',
                    help='tshark binary',)
-    p.add_argument('-i', '--input', dest='infile', default=None,
+    p.add_argument('-i', '--input', dest='infile', default=None, nargs='+',
                    metavar='INPUT-FILE',
-                   help='input file',)
+                   help='input file (analyze merges several, plot '
+                   'compares them)',)
     p.add_argument('-o', '--output', dest='outfile', default=None,
                    metavar='OUTPUT-FILE',
                    help='output file',)
@@ -72,7 +104,67 @@ def get_options(argv):
                    help='set the analysis type (flow, packet)')
     p.add_argument('--src-reverse', dest='src_reverse', default=None,
                    metavar='SRC-REVERSE',
-                   help='any packet from a src definition (cidr) as reverse',)
+                   help='any packet from a src definition (cidr) as reverse '
+                   '(comma-separated list)',)
+    p.add_argument('--prefix-labels', dest='prefix_labels', default=None,
+                   metavar='PREFIX-LABELS',
+                   help='label the connections with the longest matching '
+                   'prefix in this file ("prefix label" lines), and facet '
+                   'the plots by label',)
+  # analyze-only arguments
+  parser_anal.add_argument('--max-segments', action='store', type=int,
+                           dest='max_segments', default=MAX_TRACE_SEGMENTS,
+                           metavar='MAX_SEGMENTS',
+                           help='max in-flight segments tracked (trace)')
+  parser_anal.add_argument('--max-conn-segments', action='store', type=int,
+                           dest='max_conn_segments',
+                           default=MAX_CONN_SEGMENTS,
+                           metavar='MAX_CONN_SEGMENTS',
+                           help='max in-flight segments tracked '
+                           '(per connection direction)')
+  parser_anal.add_argument('--segment-horizon', action='store', type=float,
+                           dest='segment_horizon',
+                           default=SEGMENT_HORIZON_SECS,
+                           metavar='SEGMENT_HORIZON',
+                           help='drop in-flight segments older than this '
+                           '(sec)')
+  parser_anal.add_argument('--reorder-window', action='store', type=float,
+                           dest='reorder_window',
+                           default=REORDER_WINDOW_SECS,
+                           metavar='REORDER_WINDOW',
+                           help='max timestamp inversion absorbed when '
+                           'merging several captures (sec)')
+  parser_anal.add_argument('--dedup-window', action='store', type=float,
+                           dest='dedup_window', default=None,
+                           metavar='DEDUP_WINDOW',
+                           help='drop the packets identical to one seen '
+                           'less than this ago (sec), e.g. for multi-tap '
+                           'captures')
+  parser_anal.add_argument('--start', action='store', type=float,
+                           dest='start', default=None,
+                           metavar='START',
+                           help='only analyze the packets after this time '
+                           '(sec since the first packet)')
+  parser_anal.add_argument('--duration', action='store', type=float,
+                           dest='duration', default=None,
+                           metavar='DURATION',
+                           help='only analyze this many seconds of the '
+                           'trace')
+  parser_anal.add_argument('--profile', action='store',
+                           dest='profile', default=None,
+                           metavar='PROFILE_REPORT',
+                           help='write a JSON profile (per-stage times, '
+                           'counters, and gauges) to this file (- for '
+                           'stderr)')
+  parser_anal.add_argument('--profile-interval', action='store', type=float,
+                           dest='profile_interval', default=None,
+                           metavar='PROFILE_INTERVAL',
+                           help='also write the profile every these seconds')
+  parser_anal.add_argument('--profile-pstats', action='store',
+                           dest='profile_pstats', default=None,
+                           metavar='PSTATS_FILE',
+                           help='write a cProfile (pstats) dump to this file '
+                           '(needs --profile)')
   # plot-only arguments
   parser_plot.add_argument('--title', action='store',
                            dest='plot_title', default='',
@@ -81,7 +173,163 @@ def get_options(argv):
   parser_plot.add_argument('--format', action='store',
                            dest='plot_format', default='pdf',
                            metavar='PLOT_FORMAT',
-                           help='set the plot format')
+                           help='set the plot format (any matplotlib '
+                           'format, or html for a zoomable viewer)')
+  parser_plot.add_argument('--density', action='store',
+                           dest='plot_density', default='auto',
+                           choices=DENSITY_MODES,
+                           help='render samples as a density image '
+                           '(auto, on, off)')
+  parser_plot.add_argument('--top-connections', action='store', type=int,
+                           dest='top_connections', default=0,
+                           metavar='TOP_CONNECTIONS',
+                           help='plot the samples of the heaviest '
+                           'connections separately (packet)')
+  parser_plot.add_argument('--top-by', action='store',
+                           dest='top_metric', default='delta1',
+                           choices=TOP_METRICS,
+                           help='metric used to rank the heaviest '
+                           'connections')
+  parser_plot.add_argument('--time-range', action='store',
+                           dest='time_range', default=None,
+                           metavar='START:END',
+                           help='only plot the packets in this time range '
+                           '(sec since the trace start, packet)')
+  parser_plot.add_argument('--flow', action='store',
+                           dest='flow', default=None,
+                           metavar='CONNHASH',
+                           help='only plot the packets of this connection '
+                           '(packet)')
+  parser_plot.add_argument('--delta', action='store',
+                           dest='delta', default=None,
+                           metavar='DELTA',
+                           help='only plot this delta type (packet)')
+  parser_plot.add_argument('--labels', action='store',
+                           dest='plot_labels', default=None,
+                           metavar='PLOT_LABELS',
+                           help='comma-separated input file labels '
+                           '(comparison plots)')
+  parser_plot.add_argument('--batch', action='store',
+                           dest='plot_batch', default=None,
+                           metavar='BATCH_SPEC',
+                           help='render all the plots listed in a (JSON) '
+                           'batch spec file')
+  parser_plot.add_argument('-j', '--jobs', action='store', type=int,
+                           dest='jobs', default=0,
+                           metavar='JOBS',
+                           help='number of worker processes (0 for one '
+                           'per cpu)')
+  parser_plot.add_argument('--store', action='store',
+                           dest='store', default=None,
+                           metavar='STORE',
+                           help='read the input traces (-i selects them by '
+                           'id, path, or pattern) from this trace store')
+  # serve-only arguments
+  parser_serve.add_argument('-d', '--debug', action='count',
+                            dest='debug', default=0,
+                            help='Increase verbosity (use multiple times '
+                            'for more)',)
+  parser_serve.add_argument('--tshark', dest='tshark',
+                            default='tshark',
+                            metavar='TSHARK',
+                            help='tshark binary (for all the jobs)',)
+  parser_serve.add_argument('--socket', action='store',
+                            dest='socket_path', default=None,
+                            metavar='SOCKET',
+                            help='listen on this Unix socket (default: %s)' %
+                            SERVE_SOCKET)
+  parser_serve.add_argument('--port', action='store', type=int,
+                            dest='port', default=None, nargs='?',
+                            const=SERVE_PORT,
+                            metavar='PORT',
+                            help='listen on this localhost port (default: '
+                            '%i) instead of a Unix socket. Any local user '
+                            'can submit jobs' % SERVE_PORT)
+  parser_serve.add_argument('-j', '--jobs', action='store', type=int,
+                            dest='jobs', default=0,
+                            metavar='JOBS',
+                            help='number of worker processes, i.e., of '
+                            'concurrent jobs (0 for one per cpu)')
+  parser_serve.add_argument('--max-queue', action='store', type=int,
+                            dest='max_queue', default=SERVE_MAX_QUEUE,
+                            metavar='MAX_QUEUE',
+                            help='max pending (queued or running) jobs')
+  # export-only arguments
+  parser_export.add_argument('-d', '--debug', action='count',
+                             dest='debug', default=0,
+                             help='Increase verbosity (use multiple times '
+                             'for more)',)
+  parser_export.add_argument('--tshark', dest='tshark',
+                             default='tshark',
+                             metavar='TSHARK',
+                             help='tshark binary',)
+  parser_export.add_argument('-i', '--input', dest='infile', default='-',
+                             metavar='INPUT-FILE',
+                             help='input file (- for stdin)',)
+  parser_export.add_argument('--src-reverse', dest='src_reverse',
+                             default=None,
+                             metavar='SRC-REVERSE',
+                             help='any packet from a src definition (cidr) '
+                             'as reverse (comma-separated list)',)
+  parser_export.add_argument('--port', action='store', type=int,
+                             dest='port', default=METRICS_PORT,
+                             metavar='PORT',
+                             help='serve the metrics on this localhost port')
+  parser_export.add_argument('--idle-timeout', action='store', type=float,
+                             dest='idle_timeout',
+                             default=CONN_IDLE_TIMEOUT_SECS,
+                             metavar='IDLE_TIMEOUT',
+                             help='forget the connections idle for longer '
+                             'than this (sec)')
+  # ingest and query arguments
+  for p in (parser_ingest, parser_query):
+    p.add_argument('-d', '--debug', action='count',
+                   dest='debug', default=0,
+                   help='Increase verbosity (use multiple times for more)',)
+    p.add_argument('--store', action='store', dest='store', required=True,
+                   metavar='STORE',
+                   help='trace store (SQLite database) file')
+  parser_ingest.add_argument('-i', '--input', dest='infile', nargs='+',
+                             required=True, metavar='INPUT-FILE',
+                             help='analysis file(s) to load')
+  parser_ingest.add_argument('--type', action='store',
+                             dest='analysis_type', default='flow',
+                             metavar='ANALYSIS_TYPE',
+                             help='set the analysis type (flow, packet)')
+  parser_ingest.add_argument('--prefix-labels', dest='prefix_labels',
+                             default=None, metavar='PREFIX-LABELS',
+                             help='label the connections with the longest '
+                             'matching prefix in this file')
+  parser_query.add_argument('-i', '--input', dest='infile', default=None,
+                            nargs='+', metavar='TRACE',
+                            help='only use these traces (ids, paths, or '
+                            'path patterns)')
+  parser_query.add_argument('-o', '--output', dest='outfile', default=None,
+                            metavar='OUTPUT-FILE',
+                            help='output file',)
+  parser_query.add_argument('--aggregate', action='store',
+                            dest='aggregate', default='delta',
+                            choices=QUERY_AGGREGATES,
+                            help='list the traces, or aggregate the delta '
+                            'samples or the flows')
+  parser_query.add_argument('--delta', action='store',
+                            dest='delta', default='delta1',
+                            metavar='DELTA',
+                            help='delta type (delta aggregate)')
+  parser_query.add_argument('--label', action='store',
+                            dest='label', default=None,
+                            metavar='LABEL',
+                            help='only use the connections with this label')
+  parser_query.add_argument('--time-range', action='store',
+                            dest='time_range', default=None,
+                            metavar='START:END',
+                            help='only use the samples in this time range '
+                            '(unix time, delta aggregate)')
+  parser_query.add_argument('--group-by', action='store',
+                            dest='group_by', default='trace',
+                            choices=QUERY_GROUPS,
+                            help='aggregate per trace, per label, or all '
+                            'together')
   # do the parsing
   options = parser.parse_args(argv[1:])
   if options.subcommand == 'help':
@@ -93,13 +341,93 @@ def get_options(argv):
 def main(argv):
   # parse options
   options = get_options(argv)
-  # get infile/outfile
-  if options.infile in (None, '-'):
-    options.infile = sys.stdin
+  if options.subcommand == 'serve':
+    from analysis_server import AnalysisServer  # pylint: disable=g-import-not-at-top
+    server = AnalysisServer(options.socket_path, options.port, options.jobs,
+                            options.max_queue, tshark=options.tshark,
+                            debug=options.debug)
+    server.run()
+    return
+  if options.subcommand == 'export':
+    from metrics_exporter import MetricsExporter  # pylint: disable=g-import-not-at-top
+    exporter = MetricsExporter(options.tshark,
+                               (sys.stdin if options.infile == '-' else
+                                options.infile),
+                               options.port,
+                               options.src_reverse,
+                               options.debug,
+                               idle_timeout=options.idle_timeout)
+    exporter.run()
+    return
+  if options.subcommand in ('ingest', 'query'):
+    run_store(options)
+    return
+  run(options)
+
+
+def run_store(options):
+  """Runs an ingest or query subcommand."""
+  import trace_store  # pylint: disable=g-import-not-at-top
+  store = trace_store.TraceStore(options.store, options.debug)
+  try:
+    if options.subcommand == 'ingest':
+      prefix_labels = None
+      if options.prefix_labels is not None:
+        import cidr  # pylint: disable=g-import-not-at-top
+        prefix_labels = cidr.read_prefix_labels(options.prefix_labels)
+      infiles = [path for infile in options.infile
+                 for path in (sorted(glob.glob(infile))
+                              if glob.has_magic(infile) and
+                              not os.path.isfile(infile) else [infile])]
+      assert infiles, 'no file matches the input pattern'
+      for infile in infiles:
+        assert os.path.isfile(infile), 'File %s does not exist' % infile
+        store.ingest(infile, options.analysis_type, prefix_labels)
+    elif options.subcommand == 'query':
+      f = (open(options.outfile, 'w') if options.outfile not in (None, '-')
+           else sys.stdout)
+      try:
+        trace_store.write_query(store, f, options.aggregate, options.infile,
+                                options.delta, options.label,
+                                parse_time_range(options.time_range),
+                                options.group_by)
+      finally:
+        if f != sys.stdout:
+          f.close()
+  finally:
+    store.close()
+
+
+def run(options):
+  """Runs an analyze or plot subcommand."""
+  # get infile(s)/outfile
+  if options.infile is None:
+    options.infile = ['-']
+  if options.subcommand == 'analyze':
+    # expand (quoted) capture globs, e.g. rotated captures
+    options.infile = [
+        path for infile in options.infile
+        for path in (sorted(glob.glob(infile))
+                     if glob.has_magic(infile) and not os.path.isfile(infile)
+                     else [infile])]
+    assert options.infile, 'no capture matches the input pattern'
+  # traces read from a store are selected by id, path, or pattern
+  store = getattr(options, 'store', None)
+  if store is None:
+    assert len(options.infile) == 1 or '-' not in options.infile, (
+        'stdin cannot be used with several input files')
+    for infile in options.infile:
+      if infile != '-':
+        # ensure file exists
+        assert os.path.isfile(infile), 'File %s does not exist' % infile
+    options.infile = [(sys.stdin if infile == '-' else infile)
+                      for infile in options.infile]
   else:
-    # ensure file exists
-    assert os.path.isfile(options.infile), (
-        'File %s does not exist' % options.infile)
+    assert os.path.isfile(store), 'Store %s does not exist' % store
+    assert options.plot_batch is None, 'batch plots cannot read a store'
+    if options.infile == ['-']:
+      # all the traces
+      options.infile = []
   if options.outfile in (None, '-'):
     options.outfile = sys.stdout
   # print results
@@ -107,21 +435,86 @@ def main(argv):
     sys.stderr.write('%s\n' % options)
   # do something
   if options.subcommand == 'analyze':
+    from packet_dumper import PacketDumper  # pylint: disable=g-import-not-at-top
+    assert options.profile is not None or (
+        options.profile_interval is None and
+        options.profile_pstats is None), (
+            '--profile-interval and --profile-pstats need --profile')
+    profiler = None
+    if options.profile is not None:
+      from profiler import Profiler  # pylint: disable=g-import-not-at-top
+      profiler = Profiler(options.profile, options.profile_interval,
+                          options.profile_pstats)
+      profiler.start()
     packet_dumper = PacketDumper(options.tshark,
-                                 options.infile,
+                                 (options.infile[0]
+                                  if len(options.infile) == 1 else
+                                  options.infile),
                                  options.outfile,
                                  options.analysis_type,
-                                 options.debug)
-    packet_dumper.run()
+                                 options.debug,
+                                 options.max_segments,
+                                 options.max_conn_segments,
+                                 options.segment_horizon,
+                                 options.start,
+                                 options.duration,
+                                 profiler,
+                                 options.src_reverse,
+                                 options.reorder_window,
+                                 dedup_window=options.dedup_window,
+                                 prefix_labels=options.prefix_labels)
+    try:
+      packet_dumper.run()
+    finally:
+      if profiler is not None:
+        profiler.stop()
 
   elif options.subcommand == 'plot':
-    plotter = Plotter(options.infile,
+    # use a non-interactive matplotlib backend unless asked otherwise
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    if options.plot_batch is not None:
+      assert len(options.infile) == 1, 'batch plots use a single input file'
+      from batch_plotter import BatchPlotter  # pylint: disable=g-import-not-at-top
+      plotter = BatchPlotter(options.infile[0],
+                             options.plot_batch,
+                             options.analysis_type,
+                             options.src_reverse,
+                             options.debug,
+                             options.plot_density,
+                             options.jobs)
+      plotter.run()
+      return
+    if len(options.infile) > 1 and store is None:
+      from comparison_plotter import ComparisonPlotter  # pylint: disable=g-import-not-at-top
+      plotter = ComparisonPlotter(options.infile,
+                                  (options.plot_labels.split(',')
+                                   if options.plot_labels else None),
+                                  options.outfile,
+                                  options.analysis_type,
+                                  options.plot_format,
+                                  options.plot_title,
+                                  options.src_reverse,
+                                  options.debug,
+                                  options.jobs)
+      plotter.run()
+      return
+    from plotter import Plotter  # pylint: disable=g-import-not-at-top
+    plotter = Plotter((options.infile[0] if store is None else
+                       options.infile),
                       options.outfile,
                       options.analysis_type,
                       options.plot_format,
                       options.plot_title,
                       options.src_reverse,
-                      options.debug)
+                      options.debug,
+                      options.plot_density,
+                      options.top_connections,
+                      options.top_metric,
+                      options.time_range,
+                      options.flow,
+                      options.delta,
+                      options.prefix_labels,
+                      store)
     plotter.run()
 
 
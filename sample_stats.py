@@ -0,0 +1,174 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Grouped sample statistics (used by the plotter)."""
+
+
+import numpy as np
+
+
+QUANTILES = [0.01, 0.25, 0.50, 0.75, 0.99]
+# boxplot whiskers reach the most extreme sample within WHISKER_IQR * IQR
+WHISKER_IQR = 1.5
+# notch half-width, as a factor of IQR / sqrt(n) (McGill et al, 1978)
+NOTCH_IQR = 1.57
+
+
+def sorted_quantile(sorted_values, q):
+  """Quantile of a sorted array (linear interpolation, as pandas does)."""
+  pos = q * (len(sorted_values) - 1)
+  lo = int(np.floor(pos))
+  hi = int(np.ceil(pos))
+  return (sorted_values[lo] +
+          (sorted_values[hi] - sorted_values[lo]) * (pos - lo))
+
+
+class SampleStats(object):
+  """Statistics about a set of (timestamp, value) samples.
+
+  All the statistics are computed once, from a single sort of the values.
+  """
+
+  def __init__(self, timestamp, value, num_mean_markers, num_bins):
+    self.timestamp = timestamp
+    self.value = value
+    self.count = len(value)
+    if self.count == 0:
+      return
+    sorted_value = np.sort(value)
+    self.first_ts = timestamp[0]
+    self.last_ts = timestamp[-1]
+    self.mean = value.mean()
+    self.std = value.std(ddof=1) if self.count > 1 else float('nan')
+    self.quantile = dict((q, sorted_quantile(sorted_value, q))
+                         for q in QUANTILES)
+    # per-chunk means (in sample order)
+    chunks = min(num_mean_markers, self.count)
+    bounds = np.linspace(0, self.count, chunks + 1).astype(np.int64)[:-1]
+    sizes = np.diff(np.append(bounds, self.count))
+    self.mean_markers = (np.add.reduceat(timestamp, bounds) / sizes,
+                         np.add.reduceat(value, bounds) / sizes)
+    # pdf
+    self.histogram = np.histogram(value, num_bins)
+    self.box = self.box_stats(sorted_value)
+
+  def box_stats(self, sorted_value):
+    """Returns the boxplot stats (as needed by matplotlib's `bxp()`)."""
+    q1 = self.quantile[0.25]
+    med = self.quantile[0.50]
+    q3 = self.quantile[0.75]
+    iqr = q3 - q1
+    # whiskers
+    lo = np.searchsorted(sorted_value, q1 - WHISKER_IQR * iqr, side='left')
+    hi = np.searchsorted(sorted_value, q3 + WHISKER_IQR * iqr, side='right')
+    whislo = sorted_value[lo] if lo < self.count else q1
+    whishi = sorted_value[hi - 1] if hi > 0 else q3
+    # analytic median confidence interval
+    notch = NOTCH_IQR * iqr / np.sqrt(self.count)
+    return {
+        'med': med,
+        'q1': q1,
+        'q3': q3,
+        'iqr': iqr,
+        'mean': self.mean,
+        'whislo': min(whislo, q1),
+        'whishi': max(whishi, q3),
+        'cilo': med - notch,
+        'cihi': med + notch,
+        'fliers': np.concatenate((sorted_value[:lo], sorted_value[hi:])),
+    }
+
+
+class HistogramStats(object):
+  """Distribution statistics from a histogram (see hdr_histogram.py).
+
+  Only the distribution stats (count, mean, quantiles, and pdf) are
+  available, as the histogram has no timestamps.
+  """
+
+  def __init__(self, histogram, num_bins):
+    self.count = histogram.count
+    if self.count == 0:
+      return
+    self.mean = histogram.mean()
+    self.quantile = dict((q, histogram.quantile(q)) for q in QUANTILES)
+    # pdf
+    self.histogram = histogram.linear_histogram(num_bins)
+
+
+def group_stats(df, keys, num_mean_markers, num_bins):
+  """Computes the sample stats for all the groups in a dataframe.
+
+  Args:
+    df: dataframe with 'timestamp' and 'delta' columns
+    keys: list of columns to group by
+    num_mean_markers: number of per-chunk means
+    num_bins: number of histogram bins
+
+  Returns:
+    a dictionary mapping group keys to SampleStats objects.
+  """
+  stats = {}
+  for key, group in df.groupby(keys, observed=True, sort=False):
+    stats[key] = SampleStats(group.timestamp.values, group.delta.values,
+                             num_mean_markers, num_bins)
+  return stats
+
+
+def sample_summary(timestamp, value, t0, duration, num_cdf_points,
+                   num_time_bins):
+  """Computes a compact summary of a set of samples.
+
+  The summary is small (independent of the number of samples), so it can
+  be cheaply moved between processes and reused by several plots.
+
+  Args:
+    timestamp: numpy array with the sample timestamps
+    value: numpy array with the sample values
+    t0: start of the trace (time bins are relative to it)
+    duration: duration of the trace
+    num_cdf_points: number of (evenly-spaced) CDF probabilities
+    num_time_bins: number of time bins for the per-bin medians
+
+  Returns:
+    a dictionary with the 'count', 'mean', 'quantile', 'cdf' (values at
+    the probabilities in 'cdf_prob'), and 'time_median' (a (time, median)
+    pair of arrays, with the time relative to t0) entries.
+  """
+  summary = {'count': len(value)}
+  if len(value) == 0:  # pylint: disable=g-explicit-length-test
+    return summary
+  sorted_value = np.sort(value)
+  summary['mean'] = value.mean()
+  summary['quantile'] = dict((q, sorted_quantile(sorted_value, q))
+                             for q in QUANTILES)
+  summary['cdf_prob'] = np.linspace(0., 1., num_cdf_points)
+  summary['cdf'] = np.array([sorted_quantile(sorted_value, q)
+                             for q in summary['cdf_prob']])
+  # per-time-bin medians
+  width = float(duration) / num_time_bins if duration > 0 else 1.0
+  time_bin = np.clip(((timestamp - t0) / width).astype(np.int64), 0,
+                     num_time_bins - 1)
+  order = np.lexsort((value, time_bin))
+  time_bin = time_bin[order]
+  value = value[order]
+  index, start, count = np.unique(time_bin, return_index=True,
+                                  return_counts=True)
+  summary['time_median'] = (
+      (index + 0.5) * width,
+      (value[start + (count - 1) // 2] + value[start + count // 2]) / 2.)
+  return summary
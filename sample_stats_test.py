@@ -0,0 +1,96 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for sample_stats.py."""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from sample_stats import group_stats
+from sample_stats import sample_summary
+from sample_stats import SampleStats
+
+
+class SampleStatsTest(unittest.TestCase):
+
+  def testStats(self):
+    rnd = np.random.RandomState(0)
+    value = rnd.exponential(0.01, 1001)
+    timestamp = np.arange(len(value), dtype=np.float64)
+    stats = SampleStats(timestamp, value, 10, 50)
+    series = pd.Series(value)
+    self.assertEqual(1001, stats.count)
+    self.assertAlmostEqual(series.mean(), stats.mean)
+    self.assertAlmostEqual(series.std(), stats.std)
+    for q in (0.01, 0.25, 0.50, 0.75, 0.99):
+      self.assertAlmostEqual(series.quantile(q), stats.quantile[q])
+    self.assertEqual(0.0, stats.first_ts)
+    self.assertEqual(1000.0, stats.last_ts)
+    x_l, y_l = stats.mean_markers
+    self.assertEqual(10, len(x_l))
+    self.assertAlmostEqual(value.mean(),
+                           np.average(y_l, weights=np.diff(
+                               np.append(np.linspace(0, 1001, 11)[:-1]
+                                         .astype(int), 1001))))
+    n, bins = stats.histogram
+    self.assertEqual(1001, n.sum())
+    self.assertEqual(51, len(bins))
+
+  def testBoxStats(self):
+    value = np.array([1., 2., 3., 4., 5., 6., 7., 8., 100.])
+    stats = SampleStats(np.arange(len(value), dtype=np.float64), value, 2, 5)
+    box = stats.box
+    self.assertEqual(5., box['med'])
+    self.assertEqual(3., box['q1'])
+    self.assertEqual(7., box['q3'])
+    self.assertEqual(1., box['whislo'])
+    self.assertEqual(8., box['whishi'])
+    self.assertEqual([100.], list(box['fliers']))
+    self.assertLess(box['cilo'], box['med'])
+    self.assertGreater(box['cihi'], box['med'])
+
+  def testGroupStats(self):
+    df = pd.DataFrame({
+        'type': ['delta1', 'delta1', 'delta2', 'delta1'],
+        'dir': ['fwd', 'rev', 'fwd', 'fwd'],
+        'timestamp': [1., 2., 3., 4.],
+        'delta': [.1, .2, .3, .4],
+    })
+    stats = group_stats(df, ['type', 'dir'], 10, 5)
+    self.assertEqual(set([('delta1', 'fwd'), ('delta1', 'rev'),
+                          ('delta2', 'fwd')]), set(stats.keys()))
+    self.assertEqual(2, stats[('delta1', 'fwd')].count)
+    self.assertAlmostEqual(.25, stats[('delta1', 'fwd')].mean)
+
+  def testSampleSummary(self):
+    timestamp = np.arange(100, dtype=np.float64)
+    value = np.arange(100, dtype=np.float64)[::-1]
+    summary = sample_summary(timestamp, value, 0., 100., 11, 4)
+    self.assertEqual(100, summary['count'])
+    self.assertAlmostEqual(49.5, summary['quantile'][0.50])
+    self.assertEqual(0., summary['cdf'][0])
+    self.assertEqual(99., summary['cdf'][-1])
+    x_l, y_l = summary['time_median']
+    self.assertEqual([12.5, 37.5, 62.5, 87.5], list(x_l))
+    self.assertEqual([87., 62., 37., 12.], list(y_l))
+    self.assertEqual({'count': 0},
+                     sample_summary(np.array([]), np.array([]), 0., 1., 11, 4))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Set of the TCP sequence ranges seen in a connection direction.
+
+Sequence numbers wrap around, so they are first unwrapped (mapped into
+a single, unbounded timeline) relative to the highest sequence number
+seen. The set is then a sorted list of disjoint, non-adjacent, half-open
+intervals, so it has one interval more than the holes in the sequence
+space seen, whatever the number of packets.
+
+The intervals are kept in plain (bisected) lists rather than a balanced
+tree: inserting into or merging the middle of the list moves its tail,
+so an add() is O(n) in the number of intervals. n is capped at
+MAX_SEQ_INTERVALS, and in-order data (the common case) only extends the
+last interval, which moves nothing.
+"""
+
+
+import bisect
+
+from common import MAX_SEQ_INTERVALS
+from common import TCP_SEQ_MAX_VALUE
+from modulo import Modulo
+
+
+class SeqIntervalSet(object):
+  """A wrap-aware set of sequence number ranges."""
+
+  def __init__(self, seq=None, max_intervals=MAX_SEQ_INTERVALS):
+    """Creates an (empty) set.
+
+    Args:
+      seq: sequence number Modulo
+      max_intervals: max intervals kept. Over it, the lowest hole is
+          forgotten (as if it had been filled).
+    """
+    assert max_intervals > 0
+    self._seq = seq if seq is not None else Modulo(TCP_SEQ_MAX_VALUE)
+    self._max_intervals = max_intervals
+    # unwrapping reference: (raw, unwrapped) highest sequence number
+    self._ref = None
+    self._starts = []
+    self._ends = []
+
+  def __len__(self):
+    return len(self._starts)
+
+  def intervals(self):
+    """Returns the (unwrapped) intervals, as (start, end) pairs."""
+    return zip(self._starts, self._ends)
+
+  def unwrap(self, seq):
+    """Maps a sequence number into the (unwrapped) set timeline."""
+    if self._ref is None:
+      return seq
+    ref_seq, ref_unwrapped = self._ref
+    return ref_unwrapped + self._seq.sub(seq, ref_seq)
+
+  def highest(self):
+    """Returns the end of the highest interval (None if empty)."""
+    return self._ends[-1] if self._ends else None
+
+  def add(self, start, end):
+    """Adds an (unwrapped) interval [start, end).
+
+    Args:
+      start: interval start (see unwrap())
+      end: interval end
+
+    Returns:
+      the number of sequence numbers of the interval already in the set.
+
+    Finding the overlapping intervals is O(log n), but splicing the lists
+    is O(n) (see the module docstring), with n <= max_intervals.
+    """
+    assert start < end
+    starts = self._starts
+    ends = self._ends
+    # intervals overlapping (or adjacent to) [start, end)
+    first = bisect.bisect_left(ends, start)
+    last = bisect.bisect_right(starts, end)
+    covered = 0
+    for i in xrange(first, last):
+      covered += max(0, min(end, ends[i]) - max(start, starts[i]))
+    if first < last:
+      start = min(start, starts[first])
+      end = max(end, ends[last - 1])
+    starts[first:last] = [start]
+    ends[first:last] = [end]
+    if len(starts) > self._max_intervals:
+      # forget the lowest hole
+      del starts[1]
+      del ends[0]
+    highest = ends[-1]
+    self._ref = (self._seq.wrap_correction(highest), highest)
+    return covered
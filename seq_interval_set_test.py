@@ -0,0 +1,139 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for seq_interval_set.py."""
+
+import cStringIO
+import collections
+import unittest
+
+from common import TCP_SEQ_MAX_VALUE
+from output_sink import RecordSink
+from packet_dumper import PacketDumper
+from packet_info import PacketInfo
+from seq_interval_set import SeqIntervalSet
+import synthetic_trace
+from trace_info import TraceInfo
+
+
+class SeqIntervalSetTest(unittest.TestCase):
+
+  def add(self, seen, seq, length):
+    start = seen.unwrap(seq)
+    return seen.add(start, start + length)
+
+  def testAdd(self):
+    seen = SeqIntervalSet()
+    self.assertIsNone(seen.highest())
+    self.assertEqual(0, self.add(seen, 1000, 100))
+    self.assertEqual(0, self.add(seen, 1200, 100))
+    self.assertEqual(0, self.add(seen, 1400, 100))
+    self.assertEqual([(1000, 1100), (1200, 1300), (1400, 1500)],
+                     seen.intervals())
+    # fill a hole (and merge the adjacent intervals)
+    self.assertEqual(0, self.add(seen, 1100, 100))
+    self.assertEqual([(1000, 1300), (1400, 1500)], seen.intervals())
+    # a retransmission over a hole
+    self.assertEqual(100, self.add(seen, 1250, 200))
+    self.assertEqual([(1000, 1500)], seen.intervals())
+    self.assertEqual(100, self.add(seen, 1000, 100))
+    self.assertEqual(1500, seen.highest())
+
+  def testWrap(self):
+    seen = SeqIntervalSet()
+    self.add(seen, TCP_SEQ_MAX_VALUE - 99, 100)
+    self.add(seen, 100, 100)
+    # the ranges continue over the wrap point
+    self.assertEqual(0, self.add(seen, 0, 100))
+    self.assertEqual(1, len(seen))
+    self.assertEqual(300, self.add(seen, TCP_SEQ_MAX_VALUE - 99, 300))
+    self.assertEqual(TCP_SEQ_MAX_VALUE + 1 + 200, seen.highest())
+
+  def testMaxIntervals(self):
+    seen = SeqIntervalSet(max_intervals=3)
+    for seq in range(0, 1000, 200):
+      self.add(seen, seq, 100)
+    # the lowest holes are forgotten
+    self.assertEqual([(0, 500), (600, 700), (800, 900)], seen.intervals())
+    # (also when the new holes are under the highest sequence number)
+    seen = SeqIntervalSet(max_intervals=10)
+    self.add(seen, 0, 100)
+    self.add(seen, 100000, 100)
+    for seq in range(50000, 200, -200):
+      self.add(seen, seq, 100)
+      self.assertTrue(len(seen) <= 10)
+    self.assertEqual(100100, seen.highest())
+
+  def testFlowAccounting(self):
+    config = synthetic_trace.TraceConfig(packets=5000, flows=3, loss=.05,
+                                         reorder=.05)
+    # the expected counts (from every data segment seen)
+    seen = collections.defaultdict(set)
+    highest = {}
+    expected = collections.defaultdict(lambda: [0, 0, 0, 0])
+    for packet in synthetic_trace.generate(config):
+      if packet.tcp_len == 0:
+        continue
+      direction = (packet.ip_src, packet.ip_dst, packet.dport)
+      counts = expected[packet.dport]
+      if packet.tcp_seq in seen[direction]:
+        counts[0] += packet.tcp_len
+      elif packet.tcp_seq < highest.get(direction, 0):
+        counts[2] += 1
+      if packet.tcp_seq > highest.get(direction, packet.tcp_seq):
+        counts[3] += 1
+      seen[direction].add(packet.tcp_seq)
+      highest[direction] = max(highest.get(direction, 0),
+                               packet.tcp_seq + packet.tcp_len)
+    fields = cStringIO.StringIO()
+    synthetic_trace.write_trace(config, fields_file=fields)
+    packet_dumper = PacketDumper(None, None, None, 'flow', 0)
+    sink = RecordSink()
+    trace_info = TraceInfo(sink, 'flow')
+    for line in fields.getvalue().splitlines(True):
+      trace_info.process_packet(packet_dumper.parse_line(line))
+    trace_info.finish()
+    flows = sink.take()['flows']
+    self.assertEqual(3, len(flows))
+    for flow in flows:
+      dport = int(flow.connhash.split('-')[1].split(':')[1])
+      self.assertEqual(expected[dport],
+                       [flow.tcp_retrans_bytes, flow.tcp_spurious_retrans,
+                        flow.tcp_out_of_order, flow.tcp_holes])
+      self.assertTrue(flow.tcp_retrans_bytes > 0 and flow.tcp_holes > 0)
+
+  def testSpuriousRetransmission(self):
+    def packet(timestamp, src, seq, length, ack):
+      return PacketInfo(timestamp, 6, '1.1.1.%i' % src, '1.1.1.%i' % (3 - src),
+                        100 + length, str(src), str(3 - src), seq, length,
+                        seq + length if length else None, ack, 0, None, None)
+    sink = RecordSink()
+    trace_info = TraceInfo(sink, 'flow')
+    for p in (packet(1., 1, 1000, 100, 1), packet(1.1, 2, 1, 0, 1100),
+              # spurious (already acked), then a lost segment
+              packet(1.2, 1, 1000, 100, 1), packet(1.3, 1, 1100, 100, 1),
+              packet(1.4, 1, 1100, 100, 1)):
+      trace_info.process_packet(p)
+    trace_info.finish()
+    flow = sink.take()['flows'][0]
+    self.assertEqual((200, 1, 0, 0),
+                     (flow.tcp_retrans_bytes, flow.tcp_spurious_retrans,
+                      flow.tcp_out_of_order, flow.tcp_holes))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Space-Saving heavy hitters (Metwally et al, 2005)."""
+
+
+import heapq
+
+
+class SpaceSaving(object):
+  """A bounded-memory tracker of the heaviest keys in a stream.
+
+  At most `capacity` keys are tracked. When a new key arrives and the
+  tracker is full, it replaces the key with the smallest count, and
+  inherits its count (which becomes the error bound of the new key). Any
+  key whose weight is larger than total_weight / capacity is guaranteed
+  to be tracked, and tracked counts never underestimate the real ones.
+
+  The smallest count is found with a min-heap of (count, key) entries,
+  one per tracked key. Counts only grow (weights are not negative), so
+  the heap is not updated when a count grows: a stale entry is refreshed
+  when it reaches the top. A replacement is thus O(log capacity)
+  (amortized), and an update of a tracked key O(1).
+  """
+
+  def __init__(self, capacity):
+    assert capacity > 0
+    self._capacity = capacity
+    self._count = {}
+    self._error = {}
+    self._heap = []
+
+  def update(self, key, weight=1):
+    """Adds `weight` to the count of `key`."""
+    if key in self._count:
+      self._count[key] += weight
+      return
+    if len(self._count) < self._capacity:
+      self._count[key] = weight
+      self._error[key] = 0
+      heapq.heappush(self._heap, (weight, key))
+      return
+    # replace the key with the smallest count (ties go to the lowest key)
+    min_count, min_key = self._heap[0]
+    while self._count[min_key] != min_count:
+      heapq.heapreplace(self._heap, (self._count[min_key], min_key))
+      min_count, min_key = self._heap[0]
+    del self._count[min_key]
+    del self._error[min_key]
+    self._count[key] = min_count + weight
+    self._error[key] = min_count
+    heapq.heapreplace(self._heap, (min_count + weight, key))
+
+  def top(self, n):
+    """Returns the `n` heaviest keys.
+
+    Args:
+      n: number of keys to return
+
+    Returns:
+      a list of (key, count, error) tuples, sorted by decreasing count.
+      The real count of each key is in [count - error, count].
+    """
+    keys = sorted(self._count, key=lambda k: (-self._count[k], k))[:n]
+    return [(key, self._count[key], self._error[key]) for key in keys]
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for space_saving.py."""
+
+import random
+import unittest
+from space_saving import SpaceSaving
+
+
+class SpaceSavingTest(unittest.TestCase):
+
+  def testExactUnderCapacity(self):
+    s = SpaceSaving(4)
+    for key, weight in (('a', 3), ('b', 1), ('a', 2), ('c', 10)):
+      s.update(key, weight)
+    self.assertEqual([('c', 10, 0), ('a', 5, 0), ('b', 1, 0)], s.top(5))
+    self.assertEqual([('c', 10, 0)], s.top(1))
+
+  def testReplacement(self):
+    s = SpaceSaving(2)
+    s.update('a', 5)
+    s.update('b', 1)
+    # 'c' replaces 'b' (the smallest count), and inherits its count
+    s.update('c', 2)
+    self.assertEqual([('a', 5, 0), ('c', 3, 1)], s.top(2))
+
+  def testHeavyHittersAreKept(self):
+    s = SpaceSaving(30)
+    # 3 heavy keys hidden among many light ones
+    for i in range(1000):
+      s.update('light%i' % i)
+      if i % 4 == 0:
+        s.update('heavy%i' % (i % 3))
+    top = s.top(3)
+    self.assertEqual(set(['heavy0', 'heavy1', 'heavy2']),
+                     set(key for key, _, _ in top))
+    for key, count, error in top:
+      real = len([i for i in range(1000) if i % 4 == 0 and
+                  'heavy%i' % (i % 3) == key])
+      self.assertGreaterEqual(count, real)
+      self.assertLessEqual(count - error, real)
+
+  def testLinearScan(self):
+    # the heap replaces the same keys as a scan for the smallest count
+    rng = random.Random(7)
+    capacity = 10
+    s = SpaceSaving(capacity)
+    count = {}
+    error = {}
+    for _ in range(5000):
+      key = 'k%i' % int(rng.expovariate(.05))
+      weight = rng.randint(1, 1500)
+      s.update(key, weight)
+      if key in count or len(count) < capacity:
+        error.setdefault(key, 0)
+        count[key] = count.get(key, 0) + weight
+        continue
+      min_key = min(count, key=lambda k: (count[k], k))
+      min_count = count.pop(min_key)
+      del error[min_key]
+      count[key] = min_count + weight
+      error[key] = min_count
+    self.assertEqual(sorted((-c, k, c, error[k]) for k, c in count.items()),
+                     [(-c, k, c, e) for k, c, e in s.top(capacity)])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Cold-start benchmark for the rttcp subcommands.
+
+Runs each subcommand in a fresh interpreter, and reports (as JSON) the
+best-of-N wall-clock time and the heavy modules it imported. Fails if a
+subcommand exceeds its time budget, or imports a module it does not need.
+"""
+
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+RTTCP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rttcp.py')
+
+HEAVY_MODULES = ['numpy', 'pandas', 'matplotlib', 'matplotlib.pyplot']
+
+# subcommand -> (time budget (sec), modules that must not be imported)
+BUDGETS = {
+    'help': (0.3, HEAVY_MODULES),
+    'analyze': (0.5, HEAVY_MODULES),
+    'plot': (5.0, []),
+}
+
+# runs rttcp.py as __main__, and dumps the imported heavy modules
+WRAPPER = """
+import json, runpy, sys
+sys.argv = %r
+try:
+  runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+  pass
+with open(%r, 'w') as f:
+  json.dump({'modules': [m for m in %r if m in sys.modules],
+             'backend': (sys.modules['matplotlib'].get_backend()
+                         if 'matplotlib' in sys.modules else None)}, f)
+"""
+
+PACKET_SAMPLE = ''.join(
+    '%s %f 192.168.1.1:80 10.0.0.1:5000 %f %s\n' % (
+        delta, 1000 + i * 0.01, 0.001 * (1 + i % 7),
+        ('data' if i % 2 else 'ack') if delta == 'delta4' else '-')
+    for i in range(100)
+    for delta in ('delta1', 'delta2', 'delta4'))
+
+
+def get_options(argv):
+  """Generic option parser.
+
+  Args:
+    argv: list containing arguments
+
+  Returns:
+    argparse.ArgumentParser - generated option object
+  """
+  parser = argparse.ArgumentParser(description='rttcp startup benchmark.')
+  parser.add_argument('--runs', action='store', type=int,
+                      dest='runs', default=5,
+                      metavar='RUNS',
+                      help='number of runs per subcommand (best is kept)')
+  parser.add_argument('--budget-scale', action='store', type=float,
+                      dest='budget_scale', default=1.0,
+                      metavar='BUDGET_SCALE',
+                      help='scale all the time budgets (slow hosts)')
+  parser.add_argument('-o', '--output', dest='outfile', default=None,
+                      metavar='OUTPUT-FILE',
+                      help='output (JSON) file',)
+  return parser.parse_args(argv[1:])
+
+
+def get_commands(tmpdir):
+  """Returns the rttcp command line of each subcommand."""
+  empty_pcap = os.path.join(tmpdir, 'empty.pcap')
+  open(empty_pcap, 'w').close()
+  packet_file = os.path.join(tmpdir, 'trace.packet.txt')
+  with open(packet_file, 'w') as f:
+    f.write(PACKET_SAMPLE)
+  return {
+      'help': [RTTCP, 'help'],
+      # `true` is a tshark that decodes no packets
+      'analyze': [RTTCP, 'analyze', '--type', 'packet', '--tshark', 'true',
+                  '-i', empty_pcap, '-o', os.path.join(tmpdir, 'out.txt')],
+      'plot': [RTTCP, 'plot', '--type', 'packet', '--format', 'png',
+               '-i', packet_file, '-o', os.path.join(tmpdir, 'out.png')],
+  }
+
+
+def run_subcommand(argv, tmpdir, runs):
+  """Runs a subcommand several times in fresh interpreters."""
+  result_file = os.path.join(tmpdir, 'result.json')
+  wrapper = WRAPPER % (argv, result_file, HEAVY_MODULES)
+  times = []
+  with open(os.devnull, 'w') as devnull:
+    for _ in range(runs):
+      start = time.time()
+      subprocess.check_call([sys.executable, '-c', wrapper],
+                            stdout=devnull, stderr=devnull)
+      times.append(time.time() - start)
+  with open(result_file) as f:
+    result = json.load(f)
+  result['time'] = min(times)
+  return result
+
+
+def main(argv):
+  options = get_options(argv)
+  tmpdir = tempfile.mkdtemp()
+  results = {}
+  failures = []
+  try:
+    commands = get_commands(tmpdir)
+    for subcommand in sorted(commands):
+      budget, forbidden = BUDGETS[subcommand]
+      budget *= options.budget_scale
+      result = run_subcommand(commands[subcommand], tmpdir, options.runs)
+      result['budget'] = budget
+      results[subcommand] = result
+      if result['time'] > budget:
+        failures.append('%s: %.3f sec over budget (%.3f sec)' % (
+            subcommand, result['time'], budget))
+      for module in result['modules']:
+        if module in forbidden:
+          failures.append('%s: imports %s' % (subcommand, module))
+  finally:
+    shutil.rmtree(tmpdir)
+  f = open(options.outfile, 'w') if options.outfile else sys.stdout
+  try:
+    json.dump(results, f, indent=2, sort_keys=True, separators=(',', ': '))
+    f.write('\n')
+  finally:
+    if options.outfile:
+      f.close()
+  for failure in failures:
+    sys.stderr.write('error: %s\n' % failure)
+  return 1 if failures else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
@@ -0,0 +1,339 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Deterministic synthetic TCP traces.
+
+Every flow is a bulk transfer from a server (10.0.0.1:80) to a client,
+captured at the server. The server sends a window of segments per round
+trip, paced over the first quarter of the RTT, and the client acks every
+segment it receives (cumulatively) one RTT after it was sent. Lost
+segments are captured (they are lost after the capture point), and
+retransmitted at the start of the next round. Reordered segments swap
+their sending order with the next one.
+
+The same packets can be written as a pcap file and as the tshark field
+output that PacketDumper parses, so decoding and analysis can be
+benchmarked (or tested) separately.
+
+  ./synthetic_trace.py --packets 100000 --flows 10 -o trace.pcap \\
+      --fields trace.fields
+"""
+
+
+import argparse
+import collections
+import heapq
+import random
+import struct
+import sys
+
+
+SyntheticPacket = collections.namedtuple('SyntheticPacket', [
+    'timestamp', 'ip_src', 'ip_dst', 'ip_id', 'ip_len', 'sport', 'dport',
+    'tcp_seq', 'tcp_len', 'tcp_ack', 'tcp_flags_syn', 'tcp_tsval',
+    'tcp_tsecr'])
+
+SERVER_ADDR = '10.0.0.1'
+SERVER_PORT = 80
+CLIENT_PORT = 40000
+START_TIME = 1000.
+MSS = 1448
+TS_HZ = 1000
+IP_HEADER_BYTES = 20
+TCP_HEADER_BYTES = 20
+TCP_TS_OPTION_BYTES = 12
+ETHERNET_HEADER = '\x00\x00\x00\x00\x00\x02\x00\x00\x00\x00\x00\x01\x08\x00'
+SNAPLEN = 128
+SEQ_MODULO = 1 << 32
+TCP_FLAG_SYN = 0x02
+TCP_FLAG_ACK = 0x10
+
+
+class TraceConfig(object):
+  """Synthetic workload parameters."""
+
+  def __init__(self, packets=100000, flows=10, rtt=.02, loss=0.,
+               reorder=0., window=10, timestamps=True, seed=1):
+    assert packets > 0 and flows > 0 and rtt > 0 and window > 0
+    assert 0 <= loss < 1 and 0 <= reorder < 1
+    self.packets = packets
+    self.flows = flows
+    self.rtt = rtt
+    self.loss = loss
+    self.reorder = reorder
+    self.window = window
+    self.timestamps = timestamps
+    self.seed = seed
+
+  def name(self):
+    """Returns a (file) name that identifies the workload."""
+    return 'p%i-f%i-rtt%g-l%g-r%g-w%i-%s-s%i' % (
+        self.packets, self.flows, self.rtt, self.loss, self.reorder,
+        self.window, 'ts' if self.timestamps else 'nots', self.seed)
+
+
+class FlowGenerator(object):
+  """Generates the packets of a bulk-transfer flow, in time order."""
+
+  def __init__(self, config, flow, rng):
+    self._config = config
+    self._rng = rng
+    self._client = '192.168.%i.%i' % ((flow // 250) % 256, flow % 250 + 1)
+    self._client_port = CLIENT_PORT + flow % 20000
+    self._start = START_TIME + rng.uniform(0, config.rtt)
+    self._ts_offset = {
+        SERVER_ADDR: rng.randint(0, SEQ_MODULO - 1),
+        self._client: rng.randint(0, SEQ_MODULO - 1),
+    }
+    self._ip_id = {
+        SERVER_ADDR: rng.randint(0, 0xffff),
+        self._client: rng.randint(0, 0xffff),
+    }
+    # unwrapped sequence numbers
+    self._server_isn = rng.randint(0, SEQ_MODULO - 1)
+    self._client_isn = rng.randint(0, SEQ_MODULO - 1)
+
+  def tsval(self, host, timestamp):
+    if not self._config.timestamps:
+      return None
+    return (self._ts_offset[host] + int(timestamp * TS_HZ)) % SEQ_MODULO
+
+  def packet(self, timestamp, from_server, seq, length, ack, syn=0,
+             tsecr=None):
+    if from_server:
+      src, dst, sport, dport = (SERVER_ADDR, self._client, SERVER_PORT,
+                                self._client_port)
+    else:
+      src, dst, sport, dport = (self._client, SERVER_ADDR, self._client_port,
+                                SERVER_PORT)
+    self._ip_id[src] = (self._ip_id[src] + 1) & 0xffff
+    tsval = self.tsval(src, timestamp)
+    if tsval is not None and tsecr is None:
+      tsecr = 0
+    ip_len = (IP_HEADER_BYTES + TCP_HEADER_BYTES + length +
+              (TCP_TS_OPTION_BYTES if tsval is not None else 0))
+    return SyntheticPacket(
+        round(timestamp, 6), src, dst, self._ip_id[src], ip_len, sport, dport,
+        seq % SEQ_MODULO, length,
+        ack % SEQ_MODULO if ack is not None else None, syn, tsval, tsecr)
+
+  def packets(self):
+    """Yields the packets of the flow (forever)."""
+    config = self._config
+    t = self._start
+    # handshake
+    syn_tsval = self.tsval(self._client, t)
+    yield self.packet(t, False, self._client_isn, 0, None, syn=1)
+    synack_t = t + 1e-5
+    yield self.packet(synack_t, True, self._server_isn, 0,
+                      self._client_isn + 1, syn=1, tsecr=syn_tsval)
+    t = synack_t + config.rtt
+    yield self.packet(t, False, self._client_isn + 1, 0,
+                      self._server_isn + 1,
+                      tsecr=self.tsval(SERVER_ADDR, synack_t))
+    client_seq = self._client_isn + 1
+    next_seq = self._server_isn + 1
+    cum_ack = next_seq
+    out_of_order = {}
+    lost = []
+    gap = config.rtt / (4. * config.window)
+    while True:
+      # retransmissions first, then new data, up to the window
+      segments = lost[:config.window]
+      lost = lost[config.window:]
+      while len(segments) < config.window:
+        segments.append(next_seq)
+        next_seq += MSS
+      for i in range(len(segments) - 1):
+        if self._rng.random() < config.reorder:
+          segments[i], segments[i + 1] = segments[i + 1], segments[i]
+      acks = []
+      for i, seq in enumerate(segments):
+        send_t = t + (i + 1) * gap
+        tsval = self.tsval(SERVER_ADDR, send_t)
+        yield self.packet(send_t, True, seq, MSS, client_seq,
+                          tsecr=self.tsval(self._client, t))
+        if self._rng.random() < config.loss:
+          lost.append(seq)
+          continue
+        # the client receives the segment, and acks it
+        if seq == cum_ack:
+          cum_ack = seq + MSS
+          while cum_ack in out_of_order:
+            cum_ack = out_of_order.pop(cum_ack)
+        elif seq > cum_ack:
+          out_of_order[seq] = seq + MSS
+        acks.append((send_t + config.rtt, cum_ack, tsval))
+      for ack_t, ack, tsecr in acks:
+        yield self.packet(ack_t, False, client_seq, 0, ack, tsecr=tsecr)
+      t += config.rtt + config.window * gap
+
+
+def generate(config):
+  """Yields the packets of a synthetic trace, in time order.
+
+  Args:
+    config: TraceConfig object
+
+  Yields:
+    SyntheticPacket objects (config.packets of them).
+  """
+  rng = random.Random(config.seed)
+  # every flow has its own random stream, so the flows are independent
+  flows = []
+  for flow in range(config.flows):
+    flow_rng = random.Random(rng.random())
+    flows.append(FlowGenerator(config, flow, flow_rng).packets())
+  for i, packet in enumerate(heapq.merge(*flows)):
+    if i >= config.packets:
+      break
+    yield packet
+
+
+def fields_line(packet):
+  """Returns the tshark field line of a packet (see PacketDumper)."""
+  return '%.6f;6;%s;%s;%i;%i;%i;%i;%i;%s;%s;%i;%s;%s;0x%04x\n' % (
+      packet.timestamp, packet.ip_src, packet.ip_dst, packet.ip_len,
+      packet.sport, packet.dport, packet.tcp_seq, packet.tcp_len,
+      ((packet.tcp_seq + packet.tcp_len) % SEQ_MODULO
+       if packet.tcp_len > 0 else ''),
+      packet.tcp_ack if packet.tcp_ack is not None else '',
+      packet.tcp_flags_syn,
+      packet.tcp_tsval if packet.tcp_tsval is not None else '',
+      packet.tcp_tsecr if packet.tcp_tsecr is not None else '',
+      packet.ip_id)
+
+
+def pack_address(addr):
+  return struct.pack('!BBBB', *[int(octet) for octet in addr.split('.')])
+
+
+def pcap_record(packet, snaplen=SNAPLEN):
+  """Returns the pcap record (header and ethernet frame) of a packet."""
+  options = ''
+  if packet.tcp_tsval is not None:
+    options = struct.pack('!BBBBII', 1, 1, 8, 10, packet.tcp_tsval,
+                          packet.tcp_tsecr)
+  flags = TCP_FLAG_SYN if packet.tcp_flags_syn else 0
+  if packet.tcp_ack is not None:
+    flags |= TCP_FLAG_ACK
+  tcp = struct.pack('!HHIIBBHHH', packet.sport, packet.dport,
+                    packet.tcp_seq, packet.tcp_ack or 0,
+                    ((TCP_HEADER_BYTES + len(options)) // 4) << 4, flags,
+                    65535, 0, 0) + options
+  ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, packet.ip_len, packet.ip_id,
+                   0x4000, 64, 6, 0, pack_address(packet.ip_src),
+                   pack_address(packet.ip_dst))
+  frame = ETHERNET_HEADER + ip + tcp + '\0' * packet.tcp_len
+  orig_len = len(frame)
+  frame = frame[:snaplen]
+  ts_sec = int(packet.timestamp)
+  ts_usec = int(round((packet.timestamp - ts_sec) * 1e6))
+  return struct.pack('<IIII', ts_sec, ts_usec, len(frame), orig_len) + frame
+
+
+def write_trace(config, pcap_file=None, fields_file=None, snaplen=SNAPLEN):
+  """Writes a synthetic trace as a pcap file and/or tshark field output.
+
+  Args:
+    config: TraceConfig object
+    pcap_file: pcap file object (or None)
+    fields_file: tshark field output file object (or None)
+    snaplen: max bytes captured per packet (pcap)
+
+  Returns:
+    the number of packets written.
+  """
+  if pcap_file is not None:
+    # usec timestamps, ethernet link type
+    pcap_file.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, snaplen,
+                                1))
+  count = 0
+  for packet in generate(config):
+    if pcap_file is not None:
+      pcap_file.write(pcap_record(packet, snaplen))
+    if fields_file is not None:
+      fields_file.write(fields_line(packet))
+    count += 1
+  return count
+
+
+def get_options(argv):
+  """Generic option parser.
+
+  Args:
+    argv: list containing arguments
+
+  Returns:
+    argparse.ArgumentParser - generated option object
+  """
+  parser = argparse.ArgumentParser(description='synthetic TCP traces.')
+  parser.add_argument('-o', '--output', dest='pcap', default=None,
+                      metavar='PCAP-FILE',
+                      help='pcap output file')
+  parser.add_argument('--fields', dest='fields', default=None,
+                      metavar='FIELDS-FILE',
+                      help='tshark field output file (- for stdout)')
+  parser.add_argument('--packets', type=int, dest='packets', default=100000,
+                      help='number of packets')
+  parser.add_argument('--flows', type=int, dest='flows', default=10,
+                      help='number of (concurrent) flows')
+  parser.add_argument('--rtt', type=float, dest='rtt', default=.02,
+                      help='round-trip time (sec)')
+  parser.add_argument('--loss', type=float, dest='loss', default=0.,
+                      help='data segment loss probability')
+  parser.add_argument('--reorder', type=float, dest='reorder', default=0.,
+                      help='data segment reordering probability')
+  parser.add_argument('--window', type=int, dest='window', default=10,
+                      help='window (segments per round trip)')
+  parser.add_argument('--no-timestamps', action='store_false',
+                      dest='timestamps', default=True,
+                      help='do not use the TCP timestamp option')
+  parser.add_argument('--snaplen', type=int, dest='snaplen',
+                      default=SNAPLEN,
+                      help='max bytes captured per packet (pcap)')
+  parser.add_argument('--seed', type=int, dest='seed', default=1,
+                      help='random seed')
+  options = parser.parse_args(argv[1:])
+  if options.pcap is None and options.fields is None:
+    parser.error('at least one of --output and --fields is needed')
+  return options
+
+
+def main(argv):
+  options = get_options(argv)
+  config = TraceConfig(options.packets, options.flows, options.rtt,
+                       options.loss, options.reorder, options.window,
+                       options.timestamps, options.seed)
+  # we cannot use controlled execution (`with open(...) as f:`) as we want
+  # to support sys.stdout too.
+  pcap_file = open(options.pcap, 'wb') if options.pcap else None
+  fields_file = None
+  if options.fields is not None:
+    fields_file = (sys.stdout if options.fields == '-' else
+                   open(options.fields, 'w'))
+  try:
+    write_trace(config, pcap_file, fields_file, options.snaplen)
+  finally:
+    if pcap_file is not None:
+      pcap_file.close()
+    if fields_file not in (None, sys.stdout):
+      fields_file.close()
+
+
+if __name__ == '__main__':
+  main(sys.argv)
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for synthetic_trace.py."""
+
+import cStringIO
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import analysis_stream
+import pcap_index
+from packet_dumper import PacketDumper
+import synthetic_trace
+
+
+class SyntheticTraceTest(unittest.TestCase):
+
+  def getTrace(self, config):
+    pcap_file = cStringIO.StringIO()
+    fields_file = cStringIO.StringIO()
+    count = synthetic_trace.write_trace(config, pcap_file, fields_file)
+    return count, pcap_file.getvalue(), fields_file.getvalue()
+
+  def testDeterministic(self):
+    config = synthetic_trace.TraceConfig(packets=500, flows=3, loss=.05,
+                                         reorder=.05)
+    self.assertEqual(self.getTrace(config), self.getTrace(config))
+    other = synthetic_trace.TraceConfig(packets=500, flows=3, loss=.05,
+                                        reorder=.05, seed=2)
+    self.assertNotEqual(self.getTrace(config), self.getTrace(other))
+
+  def testFields(self):
+    config = synthetic_trace.TraceConfig(packets=200, flows=2,
+                                         timestamps=False)
+    count, _, fields = self.getTrace(config)
+    self.assertEqual(200, count)
+    packet_dumper = PacketDumper(None, None, None, 'packet', 0)
+    packets = [packet_dumper.parse_line(line)
+               for line in fields.splitlines(True)]
+    self.assertEqual(200, len(packets))
+    timestamps = [packet.timestamp for packet in packets]
+    self.assertEqual(sorted(timestamps), timestamps)
+    self.assertEqual(set([None]), set(packet.tcp_tsval for packet in packets))
+    # 2 handshakes
+    self.assertEqual(4, sum(packet.tcp_flags_syn for packet in packets))
+    self.assertEqual([packet.ip_id for packet in
+                      synthetic_trace.generate(config)],
+                     [packet.ip_id for packet in packets])
+    # older field dumps have no ip id
+    line = fields.splitlines(True)[0]
+    self.assertIsNone(packet_dumper.parse_line(
+        line[:line.rindex(';')] + '\n').ip_id)
+
+  def testPcap(self):
+    config = synthetic_trace.TraceConfig(packets=300, flows=4)
+    tmpdir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(tmpdir, 'trace.pcap')
+      with open(path, 'wb') as f:
+        synthetic_trace.write_trace(config, pcap_file=f)
+      index = pcap_index.build_index(path, checkpoint_records=1)
+      with open(path, 'rb') as f:
+        data = f.read()
+    finally:
+      shutil.rmtree(tmpdir)
+    packets = list(synthetic_trace.generate(config))
+    self.assertEqual(len(packets), len(index['checkpoints']))
+    for packet, (timestamp, offset) in zip(packets, index['checkpoints']):
+      self.assertAlmostEqual(packet.timestamp, timestamp, places=6)
+      # the IP total length covers the (not captured) payload
+      ip_len, = struct.unpack('!H', data[offset + 16 + 16:offset + 16 + 18])
+      self.assertEqual(packet.ip_len, ip_len)
+
+  def testRtt(self):
+    # without losses, every segment is acked one RTT later
+    config = synthetic_trace.TraceConfig(packets=1000, flows=5, rtt=.05)
+    _, _, fields = self.getTrace(config)
+    samples = [sample
+               for batch in analysis_stream.analyze_stream(
+                   fields.splitlines(True), deltas=['delta1'])
+               for sample in batch.samples]
+    self.assertTrue(len(samples) > 400)
+    for sample in samples:
+      self.assertAlmostEqual(.05, sample.value, places=5)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,200 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Multi-resolution (zoom level) pre-aggregation of time series.
+
+Level 0 splits the trace duration in `base_bins` time bins, and every
+level doubles the number of bins of the previous one, until the bins are
+TILE_FINEST_BIN_SECS wide (so longer traces get more levels). Each level
+keeps the per-bin count, min, max, and median of the samples. Only
+non-empty bins are stored, so bursty traces produce small pyramids.
+"""
+
+
+import base64
+import json
+import math
+import os.path
+
+import numpy as np
+
+
+TILE_BASE_BINS = 256
+# target width of the finest level bins (sec)
+TILE_FINEST_BIN_SECS = 0.001
+# bin indexes are encoded as uint32
+TILE_MAX_LEVELS = 20
+VIEWER_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'tile_viewer.html')
+VIEWER_DATA_MARKER = '/*TILE_DATA*/'
+
+
+def pyramid_levels(duration, base_bins=TILE_BASE_BINS,
+                   finest_width=TILE_FINEST_BIN_SECS):
+  """Returns the number of zoom levels whose finest bins are finest_width."""
+  if duration <= finest_width * base_bins:
+    return 1
+  levels = 1 + int(math.ceil(math.log(duration / (finest_width * base_bins),
+                                      2)))
+  return min(levels, TILE_MAX_LEVELS)
+
+
+def build_pyramid(timestamp, value, t_min, t_max, base_bins=TILE_BASE_BINS,
+                  levels=None):
+  """Aggregates a time series at several zoom levels.
+
+  The samples are sorted (by finest bin and value) once. Every coarser
+  level is then derived from the previous one, by merging the sorted
+  samples of each pair of adjacent bins.
+
+  Args:
+    timestamp: numpy array with the sample timestamps
+    value: numpy array with the sample values
+    t_min: start of the time range (shared by all the series)
+    t_max: end of the time range (shared by all the series)
+    base_bins: number of bins in the coarsest level
+    levels: number of zoom levels (None to derive it from the time range,
+      see pyramid_levels())
+
+  Returns:
+    a list (one item per level, coarsest first) of dictionaries with the
+    'index', 'count', 'min', 'max', and 'median' numpy arrays.
+  """
+  if levels is None:
+    levels = pyramid_levels(t_max - t_min, base_bins)
+  finest_bins = base_bins << (levels - 1)
+  width = float(t_max - t_min) / finest_bins if t_max > t_min else 1.0
+  fine_bin = np.clip(((timestamp - t_min) / width).astype(np.int64),
+                     0, finest_bins - 1)
+  order = np.argsort(value, kind='mergesort')
+  value = value[order]
+  fine_bin = fine_bin[order]
+  # in value order, the position of a sample is its rank, so a stable sort
+  # by bin gives the ranks of the samples, sorted by bin and value
+  level_rank = np.argsort(fine_bin, kind='mergesort')
+  level_bin = fine_bin[level_rank]
+  pyramid = [aggregate_level(level_bin, value[level_rank])]
+  for _ in range(levels - 1):
+    level_bin, level_rank = merge_bins(level_bin, level_rank, len(value))
+    pyramid.append(aggregate_level(level_bin, value[level_rank]))
+  pyramid.reverse()
+  return pyramid
+
+
+def merge_bins(level_bin, level_rank, num_samples):
+  """Merges every pair of adjacent bins (sorted by bin, then by rank).
+
+  Args:
+    level_bin: numpy array with the (sorted) bin of every sample
+    level_rank: numpy array with the value rank of every sample (sorted
+      inside every bin)
+    num_samples: total number of samples (upper bound of the ranks)
+
+  Returns:
+    (level_bin, level_rank) for the coarser level, sorted the same way.
+  """
+  parent = level_bin >> 1
+  # the samples of all the left (and all the right) bins are already
+  # sorted by (parent bin, rank)
+  key = parent * num_samples + level_rank
+  is_left = (level_bin & 1) == 0
+  left_key = key[is_left]
+  right_key = key[~is_left]
+  # the merged position of a sample is its position among its side, plus
+  # the number of samples of the other side that go before it
+  position = np.empty(len(key), dtype=np.int64)
+  position[is_left] = (np.arange(len(left_key)) +
+                       np.searchsorted(right_key, left_key))
+  position[~is_left] = (np.arange(len(right_key)) +
+                        np.searchsorted(left_key, right_key))
+  merged_bin = np.empty_like(parent)
+  merged_bin[position] = parent
+  merged_rank = np.empty_like(level_rank)
+  merged_rank[position] = level_rank
+  return merged_bin, merged_rank
+
+
+def aggregate_level(level_bin, level_value):
+  """Returns the stats of every non-empty bin (sorted by bin and value)."""
+  start = np.flatnonzero(np.diff(level_bin)) + 1
+  if len(level_bin):
+    start = np.concatenate(([0], start))
+  count = np.diff(np.append(start, len(level_bin)))
+  end = start + count
+  return {
+      'index': level_bin[start],
+      'count': count,
+      'min': level_value[start],
+      'max': level_value[end - 1],
+      'median': (level_value[start + (count - 1) // 2] +
+                 level_value[start + count // 2]) / 2.,
+  }
+
+
+def encode_array(array, dtype):
+  """Encodes a numpy array as base64 (little-endian) binary data."""
+  return base64.b64encode(np.asarray(array, dtype=dtype).tostring())
+
+
+def encode_pyramid(pyramid):
+  """Encodes a pyramid in a compact, JSON-friendly format."""
+  return [{
+      'index': encode_array(level['index'], '<u4'),
+      'count': encode_array(level['count'], '<u4'),
+      'min': encode_array(level['min'], '<f4'),
+      'max': encode_array(level['max'], '<f4'),
+      'median': encode_array(level['median'], '<f4'),
+  } for level in pyramid]
+
+
+def write_html(f, title, t_min, t_max, series, base_bins=TILE_BASE_BINS,
+               levels=None):
+  """Writes a self-contained HTML viewer with the embedded pyramids.
+
+  Args:
+    f: output file object
+    title: plot title
+    t_min: start of the time range
+    t_max: end of the time range
+    series: list of (delta, direction, color, pyramid) tuples
+    base_bins: number of bins in the coarsest level
+    levels: number of zoom levels (None to derive it from the time range,
+      as build_pyramid() does)
+  """
+  if not t_min <= t_max:
+    # no samples (nan time range): write an empty viewer
+    t_min = t_max = 0.
+  if levels is None:
+    levels = pyramid_levels(t_max - t_min, base_bins)
+  data = {
+      'title': title,
+      't_min': t_min,
+      't_max': t_max,
+      'base_bins': base_bins,
+      'levels': levels,
+      'series': [{
+          'delta': delta,
+          'dir': direction,
+          'color': color,
+          'levels': encode_pyramid(pyramid),
+      } for delta, direction, color, pyramid in series],
+  }
+  with open(VIEWER_TEMPLATE) as template:
+    html = template.read()
+  # a "</" in the data (e.g. in the title) would end the <script> element
+  f.write(html.replace(VIEWER_DATA_MARKER,
+                       json.dumps(data).replace('</', '<\\/')))
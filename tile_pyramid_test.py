@@ -0,0 +1,104 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for tile_pyramid.py."""
+
+import cStringIO
+import json
+import unittest
+
+import numpy as np
+from tile_pyramid import build_pyramid
+from tile_pyramid import pyramid_levels
+from tile_pyramid import VIEWER_DATA_MARKER
+from tile_pyramid import write_html
+
+
+class TilePyramidTest(unittest.TestCase):
+
+  def testBuildPyramid(self):
+    rnd = np.random.RandomState(0)
+    timestamp = np.sort(rnd.uniform(100., 110., 5000))
+    # leave a hole in the trace
+    timestamp = timestamp[(timestamp < 104.) | (timestamp > 106.)]
+    value = rnd.exponential(0.01, len(timestamp))
+    pyramid = build_pyramid(timestamp, value, 100., 110., base_bins=4,
+                            levels=4)
+    self.assertEqual(4, len(pyramid))
+    for level, stats in enumerate(pyramid):
+      num_bins = 4 << level
+      width = 10. / num_bins
+      self.assertEqual(len(timestamp), stats['count'].sum())
+      self.assertLessEqual(len(stats['index']), num_bins)
+      for i, b in enumerate(stats['index']):
+        in_bin = value[np.minimum(((timestamp - 100.) / width).astype(int),
+                                  num_bins - 1) == b]
+        self.assertEqual(len(in_bin), stats['count'][i])
+        self.assertEqual(in_bin.min(), stats['min'][i])
+        self.assertEqual(in_bin.max(), stats['max'][i])
+        self.assertAlmostEqual(np.median(in_bin), stats['median'][i])
+    # empty bins are not stored
+    self.assertLess(len(pyramid[-1]['index']), 4 << 3)
+
+  def testBuildEmptyPyramid(self):
+    pyramid = build_pyramid(np.array([]), np.array([]), 0., 1., base_bins=4,
+                            levels=3)
+    self.assertEqual(3, len(pyramid))
+    for stats in pyramid:
+      for name in ('index', 'count', 'min', 'max', 'median'):
+        self.assertEqual(0, len(stats[name]), name)
+
+  def testPyramidLevels(self):
+    # longer traces get more levels, down to 1 msec bins
+    self.assertEqual(1, pyramid_levels(0.))
+    self.assertEqual(1, pyramid_levels(.256))
+    self.assertEqual(2, pyramid_levels(.3))
+    for duration in (10., 1800.):
+      levels = pyramid_levels(duration)
+      self.assertLessEqual(duration / (256 << (levels - 1)), .001)
+      self.assertGreater(duration / (256 << (levels - 2)), .001)
+    self.assertEqual(14, pyramid_levels(1800.))
+    self.assertEqual(20, pyramid_levels(1e9))
+    pyramid = build_pyramid(np.array([0., 1.]), np.array([1., 2.]), 0., 1.)
+    self.assertEqual(pyramid_levels(1.), len(pyramid))
+
+  def testWriteHtml(self):
+    f = cStringIO.StringIO()
+    title = 'a </script><script>alert(1)</script> title'
+    write_html(f, title, 0., 1., [])
+    html = f.getvalue()
+    self.assertNotIn(VIEWER_DATA_MARKER, html)
+    self.assertNotIn(title, html)
+    # the data is still valid JSON (with the same title)
+    start = html.index('var DATA = ') + len('var DATA = ')
+    data, _ = json.JSONDecoder().raw_decode(html[start:])
+    self.assertEqual(title, data['title'])
+    self.assertEqual(pyramid_levels(1.), data['levels'])
+
+  def testWriteEmptyHtml(self):
+    # the time range of no samples is nan
+    f = cStringIO.StringIO()
+    write_html(f, 'empty', np.nan, np.nan, [])
+    html = f.getvalue()
+    start = html.index('var DATA = ') + len('var DATA = ')
+    data, _ = json.JSONDecoder().raw_decode(html[start:])
+    self.assertEqual((0., 0., 1, []), (data['t_min'], data['t_max'],
+                                       data['levels'], data['series']))
+
+
+if __name__ == '__main__':
+  unittest.main()
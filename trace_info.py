@@ -21,8 +21,20 @@
 import collections
 import sys
 
+from cidr import NO_LABEL
 from common import endpoint_cmp
+from common import MAX_CONN_SEGMENTS
+from common import MAX_TRACE_SEGMENTS
+from common import SEGMENT_HORIZON_SECS
+from common import TOP_CONNECTIONS
+from common import TOP_COUNTERS
+from common import TOP_METRICS
 from connection_info import ConnectionInfo
+from output_sink import OutputSink
+from output_sink import SINK_METHODS
+from output_sink import TextSink
+from output_sink import TopRecord
+from space_saving import SpaceSaving
 
 
 class TraceInfo(object):
@@ -30,18 +42,86 @@ class TraceInfo(object):
 
   ANALYSIS_TYPES = ['flow', 'packet']
 
-  def __init__(self, f, analysis_type, debug=0):
-    self._f = f
+  # fraction of the trace-wide cap we evict down to when it is exceeded
+  SEGMENT_LOW_WATERMARK = 0.9
+
+  # profiled methods (see profiler.py)
+  PROFILE_STAGES = {
+      'process_packet': 'process',
+      'get_hash': 'flow_lookup',
+      'get_connection': 'flow_lookup',
+      'evict_segments': 'eviction',
+      'expire_connections': 'eviction',
+  }
+
+  def __init__(self, f, analysis_type, debug=0,
+               max_segments=MAX_TRACE_SEGMENTS,
+               max_conn_segments=MAX_CONN_SEGMENTS,
+               segment_horizon=SEGMENT_HORIZON_SECS, profiler=None,
+               prefix_labels=None, idle_timeout=None):
+    # results go to a sink (files are written in the analysis file format)
+    self._sink = f if isinstance(f, OutputSink) else TextSink(f)
     assert analysis_type in self.ANALYSIS_TYPES
     self._analysis_type = analysis_type
     self._debug = debug
+    self._max_segments = max_segments
+    self._max_conn_segments = max_conn_segments
+    self._segment_horizon = segment_horizon
+    # subnet labels (a cidr.PrefixTrie), matched once per connection
+    self._prefix_labels = prefix_labels
+    # connections idle for longer than this are expired (None: never)
+    self._idle_timeout = idle_timeout
+    self._next_expiry = None
+    self._outstanding_segments = 0
     self._conn = collections.OrderedDict()
-    self._f.write(ConnectionInfo.header(self._analysis_type) + '\n')
+    # heaviest connections, per metric
+    self._top = dict((metric, SpaceSaving(TOP_COUNTERS))
+                     for metric in TOP_METRICS)
+    self._finished = False
+    self._profiler = profiler
+    if self._profiler is not None:
+      self._profiler.instrument(self, self.PROFILE_STAGES)
+      self._profiler.instrument(self._sink, dict(
+          (name, 'output') for name in SINK_METHODS))
+      self._profiler.add_gauge('connections', self, 'connections')
+      self._profiler.add_gauge('outstanding_segments', self,
+                               'outstanding_segments')
+    self._sink.comment(ConnectionInfo.header(self._analysis_type))
 
   def __del__(self):
-    # print connection data to out file
+    self.finish()
+
+  def finish(self):
+    """Prints the connection data and the trailer (only once)."""
+    if self._finished:
+      return
+    self._finished = True
+    if self._profiler is not None:
+      self._profiler.sample_gauges()
     for connhash in self._conn.keys():
       self._conn[connhash].print_connection_info()
+    self.print_top_connections()
+
+  def print_top_connections(self):
+    """Prints the heaviest connections as trailing comment lines.
+
+    The output may be a pipe, so the lines are appended at the end of the
+    output, where readers can find them without parsing the data lines.
+    """
+    self._sink.comment('# top connections: %s' % ' '.join(TopRecord._fields))
+    for metric in TOP_METRICS:
+      for rank, (connhash, count, error) in enumerate(
+          self._top[metric].top(TOP_CONNECTIONS)):
+        # (the connection may have been expired)
+        src, dst, _ = connhash.split('-')
+        self._sink.top(TopRecord(metric, rank, connhash, src, dst, count,
+                                 error))
+
+  def connections(self):
+    return len(self._conn)
+
+  def outstanding_segments(self):
+    return self._outstanding_segments
 
   @classmethod
   def get_hash(cls, packet):
@@ -60,12 +140,90 @@ class TraceInfo(object):
       sys.stderr.write('%s %s %s %s %s %s %s\n' % (
           connhash, packet.ip_src, packet.ip_dst, packet.sport, packet.dport,
           packet.timestamp, packet.ip_len))
+    if self._profiler is not None:
+      self._profiler.tick()
     # only process tcp, udp, and sctp packets
     if (packet.ip_proto != 6 and packet.ip_proto != 17 and
         packet.ip_proto != 132):
+      if self._profiler is not None:
+        self._profiler.count('ignored_packets')
       return
     # process the packet
-    if connhash not in self._conn:
-      self._conn[connhash] = ConnectionInfo(self._analysis_type,
-                                            connhash, self._f, self._debug)
-    self._conn[connhash].process_packet(packet)
+    conn = self.get_connection(connhash, packet)
+    outstanding_segments = conn.outstanding_segments()
+    delta1_samples = conn.delta1_samples()
+    conn.process_packet(packet)
+    self._outstanding_segments += (conn.outstanding_segments() -
+                                   outstanding_segments)
+    # account the connection in the heavy connection trackers
+    self._top['bytes'].update(connhash, packet.ip_len)
+    self._top['packets'].update(connhash)
+    if conn.delta1_samples() > delta1_samples:
+      self._top['delta1'].update(connhash,
+                                 conn.delta1_samples() - delta1_samples)
+    if self._outstanding_segments > self._max_segments:
+      self.evict_segments(packet.timestamp)
+    if self._idle_timeout is not None:
+      if self._next_expiry is None:
+        self._next_expiry = packet.timestamp + self._idle_timeout
+      elif packet.timestamp >= self._next_expiry:
+        self.expire_connections(packet.timestamp)
+
+  def get_connection(self, connhash, packet):
+    """Returns a connection (creating it if needed)."""
+    conn = self._conn.get(connhash)
+    if conn is None:
+      label = (self._prefix_labels.label_addresses(packet.ip_src,
+                                                   packet.ip_dst)
+               if self._prefix_labels is not None else NO_LABEL)
+      conn = ConnectionInfo(self._analysis_type, connhash, self._sink,
+                            self._debug, self._max_conn_segments,
+                            self._segment_horizon, label)
+      if self._profiler is not None:
+        self._profiler.instrument(conn, ConnectionInfo.PROFILE_STAGES)
+      self._conn[connhash] = conn
+    return conn
+
+  def evict_segments(self, timestamp):
+    """Bring the trace-wide number of in-flight segments under the cap.
+
+    We first expire the segments older than the horizon in all the
+    connections. If that is not enough, we drop all the in-flight segments
+    of the idlest connections (typically half-captured ones).
+
+    Args:
+      timestamp: current trace time
+    """
+    self._outstanding_segments = 0
+    for conn in self._conn.itervalues():
+      conn.expire_segments(timestamp)
+      self._outstanding_segments += conn.outstanding_segments()
+    low_watermark = int(self._max_segments * self.SEGMENT_LOW_WATERMARK)
+    if self._outstanding_segments <= low_watermark:
+      return
+    for conn in sorted(self._conn.itervalues(),
+                       key=lambda c: c.last_timestamp()):
+      self._outstanding_segments -= conn.flush_segments()
+      if self._outstanding_segments <= low_watermark:
+        break
+
+  def expire_connections(self, timestamp):
+    """Report and forget the connections idle for longer than the timeout.
+
+    Expired connections are reported as at the end of the trace (their
+    in-flight segments are accounted as evicted), so the sink totals are
+    the same, but a long-running analysis only keeps the active ones. The
+    connections are swept every timeout, so an idle connection is kept at
+    most twice as long.
+
+    Args:
+      timestamp: current trace time
+    """
+    self._next_expiry = timestamp + self._idle_timeout
+    deadline = timestamp - self._idle_timeout
+    expired = [connhash for connhash, conn in self._conn.iteritems()
+               if conn.last_timestamp() < deadline]
+    for connhash in expired:
+      conn = self._conn.pop(connhash)
+      self._outstanding_segments -= conn.flush_segments()
+      conn.print_connection_info()
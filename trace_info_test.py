@@ -0,0 +1,110 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""Unit tests for trace_info.py."""
+
+import unittest
+
+from output_sink import RecordSink
+from packet_info import PacketInfo
+from trace_info import TraceInfo
+
+
+def segment(timestamp, sport, seq, length=100, tsval=None):
+  """A client data segment (with a TSval if given)."""
+  return PacketInfo(timestamp, 6, '192.168.1.1', '10.0.0.1', 52 + length,
+                    str(sport), '80', seq, length, seq + length, 1, 0, tsval,
+                    None if tsval is None else 1)
+
+
+def ack(timestamp, sport, ack_value, tsval=None, tsecr=None):
+  """A server pure ACK (with TSval/TSecr if given)."""
+  return PacketInfo(timestamp, 6, '10.0.0.1', '192.168.1.1', 52, '80',
+                    str(sport), 1, 0, None, ack_value, 0, tsval, tsecr)
+
+
+class TraceInfoTest(unittest.TestCase):
+
+  def evicted(self, trace_info, sink):
+    sink.take()
+    trace_info.finish()
+    return sorted((record.dst if record.dst != '10.0.0.1:80' else
+                   record.src, record.delta, record.count)
+                  for record in sink.take()['evicted'])
+
+  def testSegmentCap(self):
+    sink = RecordSink()
+    trace_info = TraceInfo(sink, 'packet', max_segments=10,
+                           max_conn_segments=100, segment_horizon=100.)
+    # 11 in-flight segments in 3 connections (the first one is the idlest)
+    for sport, start, count in ((40001, 1., 4), (40002, 2., 4),
+                                (40003, 3., 3)):
+      for i in range(count):
+        trace_info.process_packet(segment(start + i * .1, sport,
+                                          1000 + i * 100))
+    # the idlest connection is flushed (down to the low watermark)
+    self.assertEqual(7, trace_info.outstanding_segments())
+    for sport in (40002, 40003):
+      trace_info.process_packet(ack(4., sport, 1400))
+    self.assertEqual(0, trace_info.outstanding_segments())
+    self.assertEqual(7, len([sample for sample in sink.take()['samples']
+                             if sample.delta == 'delta1']))
+    self.assertEqual([('192.168.1.1:40001', 'delta1', 4)],
+                     self.evicted(trace_info, sink))
+
+  def testSegmentHorizon(self):
+    sink = RecordSink()
+    trace_info = TraceInfo(sink, 'packet', max_segments=5,
+                           max_conn_segments=100, segment_horizon=1.)
+    for sport, start in ((40001, 1.), (40002, 3.)):
+      for i in range(3):
+        trace_info.process_packet(segment(start + i * .1, sport,
+                                          1000 + i * 100))
+    # expiring the old segments is enough (no connection is flushed)
+    self.assertEqual(3, trace_info.outstanding_segments())
+    self.assertEqual([('192.168.1.1:40001', 'delta1', 3)],
+                     self.evicted(trace_info, sink))
+
+  def testFlowEvictedColumns(self):
+    sink = RecordSink()
+    trace_info = TraceInfo(sink, 'flow', max_conn_segments=2,
+                           segment_horizon=100.)
+    for i in range(4):
+      trace_info.process_packet(segment(1. + i * .1, 40000, 1000 + i * 100,
+                                        tsval=100 + i))
+    # the per-connection cap applies to every delta
+    self.assertEqual(4, trace_info.outstanding_segments())
+    trace_info.process_packet(ack(2., 40000, 1400, tsval=500, tsecr=103))
+    self.assertEqual(0, trace_info.outstanding_segments())
+    # (and a server segment, so that both directions have samples)
+    trace_info.process_packet(PacketInfo(
+        2.1, 6, '10.0.0.1', '192.168.1.1', 152, '80', '40000', 1, 100, 101,
+        1400, 0, 501, 103))
+    trace_info.process_packet(PacketInfo(
+        2.11, 6, '192.168.1.1', '10.0.0.1', 52, '40000', '80', 1400, 0, None,
+        101, 0, 104, 501))
+    trace_info.finish()
+    flow, = sink.take()['flows']
+    self.assertEqual((2, 2), (flow.delta1_evicted, flow.delta2_evicted))
+    # only the surviving segments (sent at 1.2 and 1.3) are sampled
+    self.assertAlmostEqual(.75, flow.delta1_large_mean)
+    self.assertAlmostEqual(.01, flow.delta1_small_mean)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,509 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Local trace warehouse: analysis files in an indexed SQLite store.
+
+`rttcp.py ingest` bulk-loads analysis files (flow or packet mode) into a
+SQLite database, and `rttcp.py query` aggregates them, so that questions
+spanning many traces do not need to re-read every file. The tables are:
+
+- traces: one row per analysis file (path, type, and time range)
+- flows: the flow records (see output_sink.FlowRecord)
+- samples: the delta samples (their endpoints are interned in the
+  endpoints table)
+- sample_summary: a log-linear histogram (see hdr_histogram.py) per
+  (trace, delta, traffic, label), so the quantiles over any set of whole
+  traces come from merging histograms instead of reading samples
+- flow_summary: per (trace, label) flow totals
+
+Every file is loaded in a single transaction, with batched inserts. The
+indexes (trace, delta type and time, and connection) are built after the
+first load, and maintained by the next ones.
+"""
+
+
+import fnmatch
+import json
+import os.path
+import sqlite3
+import sys
+import time
+
+import cidr
+from common import QUERY_AGGREGATES
+from common import QUERY_GROUPS
+from hdr_histogram import LogLinearHistogram
+from output_sink import FlowRecord
+
+
+STORE_VERSION = 1
+# rows per executemany() call
+INGEST_BATCH_ROWS = 50000
+# quantiles reported by the queries
+QUERY_QUANTILES = [0.5, 0.9, 0.99]
+
+FLOW_INT_FIELDS = ['ip_proto', 'ip_total_pkt', 'ip_total_bytes',
+                   'tcp_bytes', 'tcp_goodput_bytes', 'delta1_evicted',
+                   'delta2_evicted', 'tcp_retrans_bytes',
+                   'tcp_spurious_retrans', 'tcp_out_of_order', 'tcp_holes']
+FLOW_TEXT_FIELDS = ['connhash', 'tcp_seq_syn_src', 'tcp_seq_syn_dst',
+                    'label']
+SAMPLE_FIELDS = ['type', 'timestamp', 'src', 'dst', 'delta', 'traffic']
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+    'CREATE TABLE IF NOT EXISTS traces ('
+    'trace_id INTEGER PRIMARY KEY, path TEXT UNIQUE, analysis_type TEXT, '
+    't_min REAL, t_max REAL, records INTEGER, ingested REAL)',
+    'CREATE TABLE IF NOT EXISTS endpoints ('
+    'endpoint_id INTEGER PRIMARY KEY, endpoint TEXT UNIQUE)',
+    'CREATE TABLE IF NOT EXISTS samples ('
+    'trace_id INTEGER, type TEXT, timestamp REAL, src INTEGER, '
+    'dst INTEGER, delta REAL, traffic TEXT, label TEXT)',
+    'CREATE TABLE IF NOT EXISTS flows (trace_id INTEGER, %s)' % ', '.join(
+        '%s %s' % (field, 'TEXT' if field in FLOW_TEXT_FIELDS else
+                   'INTEGER' if field in FLOW_INT_FIELDS else 'REAL')
+        for field in FlowRecord._fields),
+    'CREATE TABLE IF NOT EXISTS sample_summary ('
+    'trace_id INTEGER, type TEXT, traffic TEXT, label TEXT, '
+    'count INTEGER, histogram TEXT)',
+    'CREATE TABLE IF NOT EXISTS flow_summary ('
+    'trace_id INTEGER, label TEXT, flows INTEGER, tcp_flows INTEGER, '
+    'ip_total_pkt INTEGER, ip_total_bytes INTEGER, '
+    'tcp_goodput_bytes INTEGER, tcp_retrans_bytes INTEGER)',
+]
+
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS samples_trace ON samples (trace_id, type)',
+    'CREATE INDEX IF NOT EXISTS samples_type ON samples (type, timestamp)',
+    'CREATE INDEX IF NOT EXISTS samples_conn ON samples (src, dst)',
+    'CREATE INDEX IF NOT EXISTS flows_trace ON flows (trace_id)',
+    'CREATE INDEX IF NOT EXISTS flows_time ON flows (first_ts)',
+    'CREATE INDEX IF NOT EXISTS flows_conn ON flows (connhash)',
+    'CREATE INDEX IF NOT EXISTS flows_label ON flows (label)',
+    'CREATE INDEX IF NOT EXISTS sample_summary_trace '
+    'ON sample_summary (trace_id)',
+    'CREATE INDEX IF NOT EXISTS flow_summary_trace ON flow_summary (trace_id)',
+]
+
+TRACE_TABLES = ['samples', 'flows', 'sample_summary', 'flow_summary',
+                'traces']
+
+
+def parse_number(value, convert):
+  """Converts an analysis file value ('-', 'nan', or 'None' are None)."""
+  try:
+    value = convert(value)
+  except ValueError:
+    return None
+  return None if value != value else value
+
+
+def parse_flow_line(fields, prefix_labels=None):
+  """Parses the fields of a flow line into a FlowRecord (None if invalid).
+
+  Older files have fewer columns: the missing ones are None (and the
+  label is cidr.NO_LABEL).
+
+  Args:
+    fields: list of (whitespace-separated) line fields
+    prefix_labels: cidr.PrefixTrie to (re)label the flows with
+
+  Returns:
+    a FlowRecord, or None.
+  """
+  if len(fields) < 3 or len(fields) > len(FlowRecord._fields):
+    return None
+  fields = fields + [None] * (len(FlowRecord._fields) - len(fields))
+  values = []
+  for field, value in zip(FlowRecord._fields, fields):
+    if value is None or field in FLOW_TEXT_FIELDS:
+      values.append(value)
+    elif field in FLOW_INT_FIELDS:
+      values.append(parse_number(value, int))
+    else:
+      values.append(parse_number(value, float))
+  record = FlowRecord(*values)
+  if record.first_ts is None:
+    return None
+  if prefix_labels is not None:
+    record = record._replace(label=prefix_labels.label(
+        *record.connhash.rsplit('-', 1)[0].split('-')))
+  elif record.label is None:
+    record = record._replace(label=cidr.NO_LABEL)
+  return record
+
+
+class TraceStore(object):
+  """A SQLite store of analysis results."""
+
+  def __init__(self, path, debug=0):
+    self._path = path
+    self._debug = debug
+    self._db = sqlite3.connect(path)
+    self._db.text_factory = str
+    # ingestion favors speed: a crash may lose the last load (only)
+    self._db.execute('PRAGMA journal_mode=WAL')
+    self._db.execute('PRAGMA synchronous=NORMAL')
+    with self._db:
+      for statement in SCHEMA:
+        self._db.execute(statement)
+      version = self._db.execute(
+          "SELECT value FROM meta WHERE key = 'version'").fetchone()
+      if version is None:
+        self._db.execute("INSERT INTO meta VALUES ('version', ?)",
+                         (str(STORE_VERSION),))
+      else:
+        assert int(version[0]) == STORE_VERSION, (
+            'unsupported store version: %s' % version[0])
+    self._endpoints = None
+
+  def close(self):
+    self._db.close()
+
+  def ingest(self, infile, analysis_type, prefix_labels=None):
+    """Loads an analysis file into the store (replacing any older load).
+
+    Args:
+      infile: analysis file path
+      analysis_type: 'flow' or 'packet'
+      prefix_labels: cidr.PrefixTrie to label the connections with (flow
+          files keep their own labels otherwise)
+
+    Returns:
+      the trace id.
+    """
+    assert analysis_type in ('flow', 'packet')
+    path = os.path.abspath(infile)
+    try:
+      with self._db:
+        self.delete_trace(path)
+        trace_id = self._db.execute(
+            'INSERT INTO traces (path, analysis_type, ingested) '
+            'VALUES (?, ?, ?)', (path, analysis_type, time.time())).lastrowid
+        with open(infile, 'r') as f:
+          if analysis_type == 'flow':
+            records, t_min, t_max = self.ingest_flows(trace_id, f,
+                                                      prefix_labels)
+          else:
+            records, t_min, t_max = self.ingest_samples(trace_id, f,
+                                                        prefix_labels)
+        self._db.execute(
+            'UPDATE traces SET t_min = ?, t_max = ?, records = ? '
+            'WHERE trace_id = ?', (t_min, t_max, records, trace_id))
+    except:
+      # the endpoints interned by the failed load were rolled back
+      self._endpoints = None
+      raise
+    # (no-ops after the first load)
+    with self._db:
+      for statement in INDEXES:
+        self._db.execute(statement)
+    if self._debug > 0:
+      sys.stderr.write('ingested %s (trace %i): %i records\n' % (
+          path, trace_id, records))
+    return trace_id
+
+  def delete_trace(self, path):
+    """Deletes a trace (by path) and all its rows, if present."""
+    row = self._db.execute('SELECT trace_id FROM traces WHERE path = ?',
+                           (path,)).fetchone()
+    if row is None:
+      return
+    for table in TRACE_TABLES:
+      self._db.execute('DELETE FROM %s WHERE trace_id = ?' % table, row)
+
+  def ingest_flows(self, trace_id, f, prefix_labels):
+    """Loads the flow lines of a file, and their per-label totals."""
+    insert = 'INSERT INTO flows VALUES (?, %s)' % ', '.join(
+        ['?'] * len(FlowRecord._fields))
+    # label -> [flows, tcp_flows, ip_total_pkt, ip_total_bytes,
+    #           tcp_goodput_bytes, tcp_retrans_bytes]
+    totals = {}
+    batch = []
+    records = 0
+    t_min = t_max = None
+    for line in f:
+      if line.startswith('#'):
+        continue
+      record = parse_flow_line(line.split(), prefix_labels)
+      if record is None:
+        continue
+      batch.append((trace_id,) + record)
+      if len(batch) >= INGEST_BATCH_ROWS:
+        self._db.executemany(insert, batch)
+        batch = []
+      records += 1
+      t_min = record.first_ts if t_min is None else min(t_min,
+                                                        record.first_ts)
+      last_ts = record.last_ts if record.last_ts is not None else (
+          record.first_ts)
+      t_max = last_ts if t_max is None else max(t_max, last_ts)
+      total = totals.setdefault(record.label, [0] * 6)
+      total[0] += 1
+      if record.ip_proto == 6:
+        total[1] += 1
+      for i, value in enumerate((record.ip_total_pkt, record.ip_total_bytes,
+                                 record.tcp_goodput_bytes,
+                                 record.tcp_retrans_bytes), 2):
+        total[i] += value or 0
+    if batch:
+      self._db.executemany(insert, batch)
+    self._db.executemany(
+        'INSERT INTO flow_summary VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [(trace_id, label) + tuple(total)
+         for label, total in sorted(totals.iteritems())])
+    return records, t_min, t_max
+
+  def endpoint_id(self, endpoint):
+    """Returns the (interned) id of an endpoint."""
+    if self._endpoints is None:
+      self._endpoints = dict(self._db.execute(
+          'SELECT endpoint, endpoint_id FROM endpoints'))
+    endpoint_id = self._endpoints.get(endpoint)
+    if endpoint_id is None:
+      endpoint_id = self._db.execute(
+          'INSERT INTO endpoints (endpoint) VALUES (?)',
+          (endpoint,)).lastrowid
+      self._endpoints[endpoint] = endpoint_id
+    return endpoint_id
+
+  def ingest_samples(self, trace_id, f, prefix_labels):
+    """Loads the delta samples of a file, and their histograms."""
+    insert = 'INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+    # (type, traffic, label) -> values (added to the histograms in bulk)
+    values = {}
+    histograms = {}
+    # (src, dst) -> (src_id, dst_id, label)
+    pairs = {}
+    batch = []
+    records = 0
+    t_min = t_max = None
+    for line in f:
+      fields = line.split()
+      # (comments and eviction counters do not start with a delta type)
+      if len(fields) != len(SAMPLE_FIELDS) or not fields[0].startswith(
+          'delta'):
+        continue
+      delta_type, timestamp, src, dst, value, traffic = fields
+      timestamp = parse_number(timestamp, float)
+      value = parse_number(value, float)
+      if timestamp is None or value is None:
+        continue
+      pair = pairs.get((src, dst))
+      if pair is None:
+        label = (prefix_labels.label(src, dst) if prefix_labels is not None
+                 else cidr.NO_LABEL)
+        pair = pairs[(src, dst)] = (self.endpoint_id(src),
+                                    self.endpoint_id(dst), label)
+      batch.append((trace_id, delta_type, timestamp, pair[0], pair[1],
+                    value, traffic, pair[2]))
+      if len(batch) >= INGEST_BATCH_ROWS:
+        self._db.executemany(insert, batch)
+        batch = []
+      key = (delta_type, traffic, pair[2])
+      group = values.get(key)
+      if group is None:
+        group = values[key] = []
+      group.append(value)
+      if len(group) >= INGEST_BATCH_ROWS:
+        histograms.setdefault(key, LogLinearHistogram()).add_values(group)
+        del group[:]
+      records += 1
+      if t_min is None or timestamp < t_min:
+        t_min = timestamp
+      if t_max is None or timestamp > t_max:
+        t_max = timestamp
+    if batch:
+      self._db.executemany(insert, batch)
+    for key, group in values.iteritems():
+      histograms.setdefault(key, LogLinearHistogram()).add_values(group)
+    self._db.executemany(
+        'INSERT INTO sample_summary VALUES (?, ?, ?, ?, ?, ?)',
+        [(trace_id,) + key + (histogram.count,
+                              json.dumps(histogram.to_json()))
+         for key, histogram in sorted(histograms.iteritems())])
+    return records, t_min, t_max
+
+  def traces(self):
+    """Returns the traces, as (trace_id, path, analysis_type, t_min,
+    t_max, records) tuples."""
+    return self._db.execute(
+        'SELECT trace_id, path, analysis_type, t_min, t_max, records '
+        'FROM traces ORDER BY trace_id').fetchall()
+
+  def select_traces(self, selectors=None, analysis_type=None):
+    """Returns the ids of the traces matching any of the selectors.
+
+    Args:
+      selectors: list of trace ids, paths, or path patterns (e.g.
+          "*/2017-05-*"). Relative paths are made absolute. None (or an
+          empty list) selects all the traces.
+      analysis_type: only select the traces of this type
+
+    Returns:
+      a sorted list of trace ids.
+    """
+    selected = set()
+    for trace_id, path, trace_type, _, _, _ in self.traces():
+      if analysis_type is not None and trace_type != analysis_type:
+        continue
+      if not selectors or any(
+          selector == str(trace_id) or
+          fnmatch.fnmatch(path, selector) or
+          fnmatch.fnmatch(path, os.path.abspath(selector))
+          for selector in selectors):
+        selected.add(trace_id)
+    return sorted(selected)
+
+  def where(self, trace_ids, label=None, time_range=(None, None),
+            time_column='timestamp'):
+    """Returns a (where clause, parameters) pair for a row selection."""
+    clauses = ['trace_id IN (%s)' % ', '.join(str(int(trace_id))
+                                             for trace_id in trace_ids)]
+    params = []
+    if label is not None:
+      clauses.append('label = ?')
+      params.append(label)
+    start, end = time_range
+    if start is not None:
+      clauses.append('%s >= ?' % time_column)
+      params.append(start)
+    if end is not None:
+      clauses.append('%s < ?' % time_column)
+      params.append(end)
+    return ' AND '.join(clauses), params
+
+  def read_flows(self, trace_ids, label=None, time_range=(None, None)):
+    """Returns the flows of some traces, as a list of FlowRecord objects."""
+    where, params = self.where(trace_ids, label, time_range, 'first_ts')
+    return [FlowRecord(*row) for row in self._db.execute(
+        'SELECT %s FROM flows WHERE %s ORDER BY trace_id, first_ts' % (
+            ', '.join(FlowRecord._fields), where), params)]
+
+  def read_samples(self, trace_ids, delta_type=None, label=None,
+                   time_range=(None, None)):
+    """Returns the samples of some traces (as SAMPLE_FIELDS tuples)."""
+    where, params = self.where(trace_ids, label, time_range)
+    if delta_type is not None:
+      where += ' AND type = ?'
+      params.append(delta_type)
+    return self._db.execute(
+        'SELECT type, timestamp, s.endpoint, d.endpoint, delta, traffic '
+        'FROM samples JOIN endpoints s ON src = s.endpoint_id '
+        'JOIN endpoints d ON dst = d.endpoint_id WHERE %s '
+        'ORDER BY trace_id, timestamp' % where, params).fetchall()
+
+  def delta_histograms(self, trace_ids, delta_type, label=None,
+                       time_range=(None, None), group_by='none'):
+    """Returns the histograms of a delta type, per group.
+
+    Whole traces use the precomputed histograms. A time range reads the
+    matching samples instead (using the time index).
+
+    Args:
+      trace_ids: list of trace ids
+      delta_type: delta type (e.g. 'delta1')
+      label: only use the samples of this label
+      time_range: (start, end) unix times (either may be None)
+      group_by: 'none', 'trace', or 'label'
+
+    Returns:
+      a list of (group, traffic, histogram) tuples, sorted by group.
+    """
+    assert group_by in QUERY_GROUPS
+    group_column = {'none': "'all'", 'trace': 'trace_id',
+                    'label': 'label'}[group_by]
+    histograms = {}
+    if time_range == (None, None):
+      where, params = self.where(trace_ids, label)
+      for group, traffic, data in self._db.execute(
+          'SELECT %s, traffic, histogram FROM sample_summary '
+          'WHERE %s AND type = ?' % (group_column, where),
+          params + [delta_type]):
+        histograms.setdefault((group, traffic), LogLinearHistogram()).merge(
+            LogLinearHistogram.from_json(json.loads(data)))
+    else:
+      where, params = self.where(trace_ids, label, time_range)
+      values = {}
+      for group, traffic, value in self._db.execute(
+          'SELECT %s, traffic, delta FROM samples WHERE %s AND type = ?' % (
+              group_column, where), params + [delta_type]):
+        values.setdefault((group, traffic), []).append(value)
+      for key, group in values.iteritems():
+        histograms.setdefault(key, LogLinearHistogram()).add_values(group)
+    return [key + (histogram,)
+            for key, histogram in sorted(histograms.iteritems())]
+
+  def flow_totals(self, trace_ids, label=None, group_by='none'):
+    """Returns the flow totals per group.
+
+    Returns:
+      a list of (group, flows, tcp_flows, ip_total_pkt, ip_total_bytes,
+      tcp_goodput_bytes, tcp_retrans_bytes) tuples, sorted by group.
+    """
+    assert group_by in QUERY_GROUPS
+    group_column = {'none': "'all'", 'trace': 'trace_id',
+                    'label': 'label'}[group_by]
+    where, params = self.where(trace_ids, label)
+    return self._db.execute(
+        'SELECT %s AS g, SUM(flows), SUM(tcp_flows), SUM(ip_total_pkt), '
+        'SUM(ip_total_bytes), SUM(tcp_goodput_bytes), '
+        'SUM(tcp_retrans_bytes) FROM flow_summary WHERE %s '
+        'GROUP BY g ORDER BY g' % (group_column, where), params).fetchall()
+
+
+def write_query(store, f, aggregate, selectors=None, delta_type='delta1',
+                label=None, time_range=(None, None), group_by='trace'):
+  """Writes a query result as a whitespace-separated table.
+
+  Args:
+    store: TraceStore
+    f: file object to write to
+    aggregate: 'traces' (the trace list), 'delta' (count, mean, and
+        quantiles of a delta type), or 'flows' (flow totals)
+    selectors: trace selectors (see TraceStore.select_traces())
+    delta_type: delta type (delta aggregate)
+    label: only use the connections with this label
+    time_range: (start, end) unix times (delta aggregate)
+    group_by: 'none', 'trace', or 'label'
+  """
+  assert aggregate in QUERY_AGGREGATES
+  if aggregate == 'traces':
+    f.write('#trace_id path analysis_type t_min t_max records\n')
+    trace_ids = set(store.select_traces(selectors))
+    for row in store.traces():
+      if row[0] in trace_ids:
+        f.write('%i %s %s %s %s %s\n' % row)
+  elif aggregate == 'delta':
+    f.write('#%s traffic count mean min %s max\n' % (group_by, ' '.join(
+        'p%g' % (100 * q) for q in QUERY_QUANTILES)))
+    trace_ids = store.select_traces(selectors, 'packet')
+    for group, traffic, histogram in store.delta_histograms(
+        trace_ids, delta_type, label, time_range, group_by):
+      f.write('%s %s %i %f %f %s %f\n' % (
+          group, traffic, histogram.count, histogram.mean(), histogram.min,
+          ' '.join('%f' % histogram.quantile(q) for q in QUERY_QUANTILES),
+          histogram.max))
+  elif aggregate == 'flows':
+    assert time_range == (None, None), (
+        'flow totals are per trace (use trace selectors)')
+    f.write('#%s flows tcp_flows ip_total_pkt ip_total_bytes '
+            'tcp_goodput_bytes tcp_retrans_bytes\n' % group_by)
+    trace_ids = store.select_traces(selectors, 'flow')
+    for row in store.flow_totals(trace_ids, label, group_by):
+      f.write('%s %i %i %i %i %i %i\n' % row)
@@ -0,0 +1,163 @@
+#!/usr/bin/python
+
+# Copyright 2017 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Unit tests for trace_store.py."""
+
+import cStringIO
+import os
+import shutil
+import tempfile
+import unittest
+
+import cidr
+import numpy as np
+from packet_dumper import PacketDumper
+import synthetic_trace
+from trace_info import TraceInfo
+import trace_store
+
+
+def write_analysis(path, analysis_type, flows=20, prefix_labels=None):
+  """Writes the analysis file of a synthetic trace."""
+  config = synthetic_trace.TraceConfig(packets=2000, flows=flows, loss=.02)
+  fields = cStringIO.StringIO()
+  synthetic_trace.write_trace(config, fields_file=fields)
+  packet_dumper = PacketDumper(None, None, None, analysis_type, 0)
+  with open(path, 'w') as f:
+    trace_info = TraceInfo(f, analysis_type, prefix_labels=prefix_labels)
+    for line in fields.getvalue().splitlines(True):
+      trace_info.process_packet(packet_dumper.parse_line(line))
+    trace_info.finish()
+
+
+def read_samples(path, delta_type):
+  with open(path, 'r') as f:
+    return [float(line.split()[4]) for line in f
+            if line.startswith(delta_type + ' ')]
+
+
+class TraceStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self._prefix_labels = cidr.PrefixTrie()
+    self._prefix_labels.insert('192.168.0.0/29', 'site-1')
+    self._prefix_labels.insert('192.168.0.8/29', 'site-2')
+    self._store = trace_store.TraceStore(os.path.join(self._tmpdir, 'db'))
+
+  def tearDown(self):
+    self._store.close()
+    shutil.rmtree(self._tmpdir)
+
+  def path(self, name):
+    return os.path.join(self._tmpdir, name)
+
+  def testSamples(self):
+    write_analysis(self.path('a.packet.txt'), 'packet')
+    trace_id = self._store.ingest(self.path('a.packet.txt'), 'packet',
+                                  self._prefix_labels)
+    # loading a file again replaces it
+    self.assertEqual(trace_id, self._store.ingest(
+        self.path('a.packet.txt'), 'packet', self._prefix_labels))
+    ((_, path, analysis_type, t_min, t_max, records),) = self._store.traces()
+    self.assertEqual((self.path('a.packet.txt'), 'packet'),
+                     (path, analysis_type))
+    samples = self._store.read_samples([trace_id])
+    self.assertEqual(records, len(samples))
+    self.assertEqual((t_min, t_max), (min(s[1] for s in samples),
+                                      max(s[1] for s in samples)))
+    delta1 = read_samples(self.path('a.packet.txt'), 'delta1')
+    self.assertEqual(sorted(delta1), sorted(
+        s[4] for s in self._store.read_samples([trace_id], 'delta1')))
+    # the summary and the samples (any time range) give the same histograms
+    for time_range in ((None, None), (t_min, t_max + 1)):
+      ((group, traffic, histogram),) = self._store.delta_histograms(
+          [trace_id], 'delta1', time_range=time_range)
+      self.assertEqual(('all', '-', len(delta1)),
+                       (group, traffic, histogram.count))
+      self.assertAlmostEqual(np.median(delta1), histogram.quantile(.5),
+                             delta=np.median(delta1) / 64)
+    # per label (clients 192.168.0.1-7 and .8-15, the others unlabeled)
+    labels = self._store.delta_histograms([trace_id], 'delta1',
+                                          group_by='label')
+    self.assertEqual([cidr.NO_LABEL, 'site-1', 'site-2'],
+                     [group for group, _, _ in labels])
+    self.assertEqual(len(delta1), sum(h.count for _, _, h in labels))
+    ((_, _, histogram),) = self._store.delta_histograms(
+        [trace_id], 'delta1', label='site-1')
+    self.assertEqual(labels[1][2].count, histogram.count)
+
+  def testFlows(self):
+    write_analysis(self.path('a.flow.txt'), 'flow',
+                   prefix_labels=self._prefix_labels)
+    write_analysis(self.path('b.flow.txt'), 'flow')
+    with open(self.path('b.flow.txt'), 'r') as f:
+      lines = f.readlines()
+    # an older file (without the last 5 columns)
+    with open(self.path('c.flow.txt'), 'w') as f:
+      for line in lines:
+        f.write(line if line.startswith('#') else
+                ' '.join(line.split()[:19]) + '\n')
+    for name in ('a', 'b', 'c'):
+      self._store.ingest(self.path('%s.flow.txt' % name), 'flow')
+    self.assertEqual([1, 2, 3], self._store.select_traces())
+    self.assertEqual([2, 3], self._store.select_traces(['*/[bc].flow.txt']))
+    self.assertEqual([1], self._store.select_traces(
+        ['1', self.path('x.flow.txt')]))
+    self.assertEqual([], self._store.select_traces(None, 'packet'))
+    flows = self._store.read_flows([1, 2, 3])
+    self.assertEqual(60, len(flows))
+    # the labels of the analysis file are kept
+    # (clients 192.168.0.1-7 and 192.168.0.8-15)
+    self.assertEqual([7, 8, 5 + 40], [
+        len([flow for flow in flows if flow.label == label])
+        for label in ('site-1', 'site-2', cidr.NO_LABEL)])
+    self.assertEqual([None] * 20, [flow.tcp_holes for flow in flows[40:]])
+    totals = self._store.flow_totals([1, 2, 3], group_by='trace')
+    self.assertEqual([(1, 20), (2, 20), (3, 20)],
+                     [row[:2] for row in totals])
+    # (the older file has no retransmission counts)
+    self.assertEqual(totals[0][2:], totals[1][2:])
+    self.assertEqual(totals[0][2:6], totals[2][2:6])
+    self.assertEqual(0, totals[2][6])
+
+  def testWriteQuery(self):
+    write_analysis(self.path('a.packet.txt'), 'packet')
+    write_analysis(self.path('a.flow.txt'), 'flow')
+    self._store.ingest(self.path('a.packet.txt'), 'packet')
+    self._store.ingest(self.path('a.flow.txt'), 'flow')
+    for aggregate, lines in (('traces', 2), ('delta', 1), ('flows', 1)):
+      f = cStringIO.StringIO()
+      trace_store.write_query(self._store, f, aggregate)
+      output = f.getvalue().splitlines()
+      self.assertTrue(output[0].startswith('#'))
+      self.assertEqual(lines, len(output) - 1)
+      # every line has as many fields as the header
+      for line in output[1:]:
+        self.assertEqual(len(output[0].split()), len(line.split()))
+
+  def testParseFlowLine(self):
+    self.assertIsNone(trace_store.parse_flow_line(['x']))
+    record = trace_store.parse_flow_line(
+        '1.1.1.1:80-2.2.2.2:4000-6 1.5 nan 6 None None 3 180 - -'.split())
+    self.assertEqual((1.5, None, 6, 3, None, cidr.NO_LABEL),
+                     (record.first_ts, record.last_ts, record.ip_proto,
+                      record.ip_total_pkt, record.pps, record.label))
+
+
+if __name__ == '__main__':
+  unittest.main()